@@ -0,0 +1,237 @@
+"""
+Servidor HTTP que imita a API do Ollama usada pela aplicação (/api/chat,
+/api/embed, /api/embeddings, /api/tags, /api/show), com respostas
+determinísticas e latência configurável. A aplicação usa o servidor falso
+apontando OLLAMA_HOST para ele:
+
+    python -m bench.fake_ollama --port 11435 --latency-ms 150 --token-ms 5
+    OLLAMA_HOST=http://127.0.0.1:11435 uvicorn main:app
+
+- Embeddings: saco de trigramas de caracteres com hashing, normalizado;
+  textos parecidos geram vetores parecidos, então as buscas fazem sentido.
+- Chat: com `format` (JSON schema) a resposta é um JSON válido desse schema;
+  com ferramentas, a primeira resposta chama a primeira ferramenta e a
+  seguinte responde em texto; sem nada disso, um texto.
+- Latência: latency_ms até o primeiro token, mais prompt_ms_per_1k por mil
+  tokens de prompt e token_ms por token gerado. Só num_parallel requisições
+  são atendidas ao mesmo tempo, como o OLLAMA_NUM_PARALLEL do Ollama.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+import uvicorn
+import xxhash
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_OLLAMA_LATENCY_MS = float(os.getenv("FAKE_OLLAMA_LATENCY_MS", "100"))
+FAKE_OLLAMA_PROMPT_MS_PER_1K = float(os.getenv("FAKE_OLLAMA_PROMPT_MS_PER_1K", "50"))
+FAKE_OLLAMA_TOKEN_MS = float(os.getenv("FAKE_OLLAMA_TOKEN_MS", "5"))
+FAKE_OLLAMA_EMBED_MS = float(os.getenv("FAKE_OLLAMA_EMBED_MS", "10"))
+FAKE_OLLAMA_EMBED_ITEM_MS = float(os.getenv("FAKE_OLLAMA_EMBED_ITEM_MS", "0.5"))
+FAKE_OLLAMA_NUM_PARALLEL = int(os.getenv("FAKE_OLLAMA_NUM_PARALLEL", "4"))
+FAKE_OLLAMA_EMBED_DIM = int(os.getenv("FAKE_OLLAMA_EMBED_DIM", "768"))
+# Segundos que uma conexão ociosa fica aberta. O Ollama (net/http do Go) não fecha conexões
+# ociosas; com os 5 s padrão do uvicorn, iguais ao keepalive_expiry do httpx usado pelo cliente
+# ollama, o servidor fechava a conexão no instante em que o cliente a reaproveitava e a
+# requisição falhava com httpx.ReadError
+FAKE_OLLAMA_KEEP_ALIVE_S = int(os.getenv("FAKE_OLLAMA_KEEP_ALIVE_S", "300"))
+
+PALAVRAS = (
+    "produto entrega qualidade preço atendimento embalagem chegou rápido bom ótimo ruim defeito "
+    "funciona recomendo bateria tela som garantia troca prazo custo benefício material frágil "
+    "resistente bonito prático fácil difícil cliente compra loja satisfeito decepcionado"
+).split()
+
+
+def _seed(*parts: Any) -> int:
+    return xxhash.xxh64_intdigest(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str))
+
+
+def embed_text(text: str, dim: int = FAKE_OLLAMA_EMBED_DIM) -> List[float]:
+    normalizado = "  " + re.sub(r"\s+", " ", text.casefold()) + "  "
+    trigramas = [normalizado[i:i + 3] for i in range(len(normalizado) - 2)]
+    hashes = np.fromiter((xxhash.xxh32_intdigest(t) for t in trigramas), dtype=np.uint64, count=len(trigramas))
+    vetor = np.zeros(dim, dtype=np.float32)
+    np.add.at(vetor, (hashes % dim).astype(np.int64), np.where(hashes & (1 << 31), 1.0, -1.0))
+    norma = float(np.linalg.norm(vetor))
+    return (vetor / norma if norma else vetor).tolist()
+
+
+def _frase(rng: random.Random, palavras: int) -> str:
+    return " ".join(rng.choice(PALAVRAS) for _ in range(palavras)).capitalize() + "."
+
+
+def fake_from_schema(schema: Dict[str, Any], rng: random.Random, defs: Dict[str, Any] = None) -> Any:
+    """Instância determinística (pelo rng) de um JSON schema no formato gerado pelo pydantic."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return fake_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], rng, defs)
+    for composto in ("anyOf", "oneOf", "allOf"):
+        if composto in schema:
+            opcoes = [opcao for opcao in schema[composto] if opcao.get("type") != "null"] or schema[composto]
+            return fake_from_schema(opcoes[0], rng, defs)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "const" in schema:
+        return schema["const"]
+    tipo = schema.get("type", "object")
+    if tipo == "object":
+        return {nome: fake_from_schema(propriedade, rng, defs)
+                for nome, propriedade in schema.get("properties", {}).items()}
+    if tipo == "array":
+        minimo = schema.get("minItems", 1)
+        quantidade = rng.randint(minimo, schema.get("maxItems", max(minimo, 4)))
+        return [fake_from_schema(schema.get("items", {"type": "string"}), rng, defs) for _ in range(quantidade)]
+    if tipo == "integer":
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 100))
+    if tipo == "number":
+        return round(rng.uniform(schema.get("minimum", 0), schema.get("maximum", 100)), 2)
+    if tipo == "boolean":
+        return rng.random() < 0.5
+    return " ".join(_frase(rng, rng.randint(6, 14)) for _ in range(rng.randint(1, 3)))
+
+
+def _tool_call(tools: List[Dict], pergunta: str) -> Dict:
+    funcao = tools[0]["function"]
+    parametros = funcao.get("parameters", {})
+    obrigatorios = parametros.get("required") or list(parametros.get("properties", {}))[:1]
+    termo = " ".join(pergunta.split()[-2:]) or "produto"
+    return {"function": {"name": funcao["name"], "arguments": {nome: termo for nome in obrigatorios}}}
+
+
+def fake_reply(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Mensagem do assistente para um pedido de /api/chat; mesma entrada, mesma resposta."""
+    mensagens = body.get("messages") or []
+    rng = random.Random(_seed(body.get("model"), mensagens, body.get("format")))
+    formato = body.get("format")
+    tools = body.get("tools") or []
+    ultima = mensagens[-1] if mensagens else {}
+
+    if tools and ultima.get("role") == "user":
+        return {"role": "assistant", "content": "", "tool_calls": [_tool_call(tools, ultima.get("content", ""))]}
+    if isinstance(formato, dict):
+        return {"role": "assistant", "content": json.dumps(fake_from_schema(formato, rng), ensure_ascii=False)}
+    if formato == "json":
+        return {"role": "assistant", "content": json.dumps({"resposta": _frase(rng, 10)}, ensure_ascii=False)}
+    return {"role": "assistant", "content": " ".join(_frase(rng, rng.randint(8, 16)) for _ in range(3))}
+
+
+def _tokens(texto: str) -> List[str]:
+    return [texto[i:i + 4] for i in range(0, len(texto), 4)] or [""]
+
+
+def create_app(latency_ms: float = FAKE_OLLAMA_LATENCY_MS, prompt_ms_per_1k: float = FAKE_OLLAMA_PROMPT_MS_PER_1K,
+               token_ms: float = FAKE_OLLAMA_TOKEN_MS, embed_ms: float = FAKE_OLLAMA_EMBED_MS,
+               embed_item_ms: float = FAKE_OLLAMA_EMBED_ITEM_MS, num_parallel: int = FAKE_OLLAMA_NUM_PARALLEL,
+               embed_dim: int = FAKE_OLLAMA_EMBED_DIM) -> FastAPI:
+    app = FastAPI()
+    vagas = asyncio.Semaphore(num_parallel)
+    contadores = {"chat": 0, "embed": 0, "textos_embed": 0}
+
+    def _agora() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    @app.get("/")
+    async def root():
+        return "Ollama is running"
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": []}
+
+    @app.post("/api/show")
+    async def show(request: Request):
+        return {"modelfile": "", "parameters": "", "template": "", "details": {}, "model_info": {},
+                "capabilities": ["completion", "tools"]}
+
+    @app.get("/fake/stats")
+    async def stats():
+        return contadores
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        textos = body.get("input") or []
+        textos = [textos] if isinstance(textos, str) else textos
+        async with vagas:
+            await asyncio.sleep((embed_ms + embed_item_ms * len(textos)) / 1000)
+        contadores["embed"] += 1
+        contadores["textos_embed"] += len(textos)
+        return {"model": body.get("model"), "embeddings": [embed_text(texto, embed_dim) for texto in textos]}
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        async with vagas:
+            await asyncio.sleep((embed_ms + embed_item_ms) / 1000)
+        contadores["embed"] += 1
+        contadores["textos_embed"] += 1
+        return {"embedding": embed_text(body.get("prompt", ""), embed_dim)}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        contadores["chat"] += 1
+        mensagem = fake_reply(body)
+        tokens_prompt = sum(len(str(m.get("content", ""))) for m in body.get("messages") or []) // 4 + 1
+        pedacos = _tokens(mensagem["content"])
+        inicio = time.perf_counter_ns()
+
+        def final(conteudo: str) -> Dict[str, Any]:
+            duracao = time.perf_counter_ns() - inicio
+            return {"model": body.get("model"), "created_at": _agora(),
+                    "message": {**mensagem, "content": conteudo}, "done": True, "done_reason": "stop",
+                    "total_duration": duracao, "load_duration": 0, "prompt_eval_count": tokens_prompt,
+                    "prompt_eval_duration": 0, "eval_count": len(pedacos), "eval_duration": duracao}
+
+        if not body.get("stream", True):
+            async with vagas:
+                await asyncio.sleep((latency_ms + prompt_ms_per_1k * tokens_prompt / 1000
+                                     + token_ms * len(pedacos)) / 1000)
+            return JSONResponse(final(mensagem["content"]))
+
+        async def linhas():
+            async with vagas:
+                await asyncio.sleep((latency_ms + prompt_ms_per_1k * tokens_prompt / 1000) / 1000)
+                for pedaco in pedacos:
+                    await asyncio.sleep(token_ms / 1000)
+                    parcial = {"role": "assistant", "content": pedaco}
+                    yield json.dumps({"model": body.get("model"), "created_at": _agora(),
+                                      "message": parcial, "done": False}, ensure_ascii=False) + "\n"
+            yield json.dumps(final(""), ensure_ascii=False) + "\n"
+
+        return StreamingResponse(linhas(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-ms", type=float, default=FAKE_OLLAMA_LATENCY_MS)
+    parser.add_argument("--prompt-ms-per-1k", type=float, default=FAKE_OLLAMA_PROMPT_MS_PER_1K)
+    parser.add_argument("--token-ms", type=float, default=FAKE_OLLAMA_TOKEN_MS)
+    parser.add_argument("--embed-ms", type=float, default=FAKE_OLLAMA_EMBED_MS)
+    parser.add_argument("--embed-item-ms", type=float, default=FAKE_OLLAMA_EMBED_ITEM_MS)
+    parser.add_argument("--num-parallel", type=int, default=FAKE_OLLAMA_NUM_PARALLEL)
+    parser.add_argument("--embed-dim", type=int, default=FAKE_OLLAMA_EMBED_DIM)
+    parser.add_argument("--keep-alive-s", type=int, default=FAKE_OLLAMA_KEEP_ALIVE_S)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.prompt_ms_per_1k, args.token_ms, args.embed_ms,
+                     args.embed_item_ms, args.num_parallel, args.embed_dim)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", timeout_keep_alive=args.keep_alive_s)
+
+
+if __name__ == "__main__":
+    main()
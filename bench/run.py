@@ -0,0 +1,396 @@
+"""
+Suíte de benchmarks reproduzível, sem Ollama de verdade.
+
+Gera reviews sintéticas (bench.synthetic), sobe o Ollama falso
+(bench.fake_ollama) e mede, em um diretório de trabalho isolado:
+
+- ingestao: csv_to_sqlite + estatísticas materializadas (processo próprio)
+- indice: construção dos índices FAISS de todos os campos (processo próprio)
+- buscas: cada endpoint de retriever (vetorial, híbrido, texto, com filtro)
+- lotes: /sentimentos, /sentimentos/agregado, /gerador_topicos, /sumarizacao
+  e /sentimento_geral
+- chat: /chat com chamada de ferramenta
+
+Para cada cenário: latência p50/p95/p99, vazão e memória do processo medido
+(nas etapas offline, o pico de RSS do processo da etapa; nos cenários HTTP, a
+RSS atual da aplicação amostrada antes, durante e depois do cenário, com o
+pico e a variação de cada um). O resultado vai para um JSON. A execução
+termina com código 1 se algum cenário tiver requisições com erro ou, com
+--baseline, se algum cenário piorar mais que --max-regression, para uso em CI:
+
+    python -m bench.run --rows 10k --output bench_results.json
+    python -m bench.run --rows 10k --baseline bench_results.json --max-regression 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from bench.synthetic import COLUMNS, generate_reviews, parse_rows
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pedido HTTP de um cenário: (método, caminho, corpo JSON)
+Pedido = Tuple[str, str, Optional[dict]]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    """Memória residente atual (VmRSS) de um processo vivo; None fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return round(int(linha.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+async def _sample_rss(pid: int, amostras: List[float], intervalo_s: float = 0.05) -> None:
+    """Acrescenta a RSS atual do processo a `amostras` a cada intervalo_s, até ser cancelada."""
+    while True:
+        rss = _rss_mb(pid)
+        if rss is not None:
+            amostras.append(rss)
+        await asyncio.sleep(intervalo_s)
+
+
+def _percentiles(latencias: List[float]) -> Dict[str, Optional[float]]:
+    if not latencias:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(latencias) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+
+
+def _wait_http(url: str, processo: subprocess.Popen, timeout: float) -> None:
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"processo encerrou antes de responder em {url} (código {processo.returncode})")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} não respondeu em {timeout}s")
+
+
+def run_task(etapa: str, argumentos: List[str], env: dict) -> dict:
+    """Executa uma etapa de bench.tasks em um processo filho e mede tempo e pico de RSS dele."""
+    inicio = time.perf_counter()
+    processo = subprocess.Popen([sys.executable, "-m", "bench.tasks", etapa, *argumentos], cwd=REPO_DIR, env=env,
+                                stdout=subprocess.PIPE, text=True)
+    saida = processo.stdout.read()
+    _, status, uso = os.wait4(processo.pid, 0)
+    processo.returncode = os.waitstatus_to_exitcode(status)
+    duracao = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        raise RuntimeError(f"bench.tasks {etapa} falhou (código {processo.returncode})")
+    itens = json.loads(saida.strip().splitlines()[-1])["itens"]
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    rss = uso.ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else uso.ru_maxrss / 1024
+    return {
+        "requisicoes": 1,
+        "erros": 0,
+        "itens": itens,
+        "duracao_s": round(duracao, 3),
+        "vazao_por_s": round(itens / duracao, 2) if duracao else None,
+        **_percentiles([duracao]),
+        "pico_rss_mb": round(rss, 1),
+    }
+
+
+async def run_http_scenario(client: httpx.AsyncClient, pedidos: List[Pedido], concorrencia: int) -> dict:
+    """
+    Dispara os pedidos com no máximo `concorrencia` em andamento; latência por
+    pedido, vazão total e os erros agrupados por status HTTP ou exceção.
+    """
+    latencias: List[float] = []
+    falhas: Counter = Counter()
+    fila = iter(pedidos)
+
+    async def trabalhador():
+        for metodo, caminho, corpo in fila:
+            inicio = time.perf_counter()
+            try:
+                resposta = await client.request(metodo, caminho, json=corpo)
+                falha = f"HTTP {resposta.status_code}" if resposta.status_code >= 400 else None
+            except httpx.HTTPError as exc:
+                falha = type(exc).__name__
+            if falha is None:
+                latencias.append(time.perf_counter() - inicio)
+            else:
+                falhas[falha] += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    duracao = time.perf_counter() - inicio
+    return {
+        "requisicoes": len(pedidos),
+        "erros": sum(falhas.values()),
+        "falhas": dict(falhas),
+        "duracao_s": round(duracao, 3),
+        "vazao_por_s": round(len(latencias) / duracao, 2) if duracao else None,
+        **_percentiles(latencias),
+    }
+
+
+class Amostra:
+    """Valores reais do CSV sintético usados para montar as consultas dos cenários."""
+
+    def __init__(self, csv_filepath: str, seed: int, linhas: int = 5000):
+        import csv
+        with open(csv_filepath, newline="", encoding="utf-8") as f:
+            leitor = csv.DictReader(f)
+            self.reviews = [linha for _, linha in zip(range(linhas), leitor)]
+        self.rng = random.Random(seed)
+        self.valores = {coluna: sorted({r[coluna] for r in self.reviews if r[coluna]}) for coluna in COLUMNS}
+
+    def valor(self, coluna: str) -> str:
+        return self.rng.choice(self.valores[coluna])
+
+    def trecho_nome(self) -> str:
+        palavras = self.valor("product_name").split()
+        return " ".join(palavras[:self.rng.randint(1, len(palavras))])
+
+    def comentarios(self, quantidade: int) -> List[dict]:
+        inicio = self.rng.randrange(max(1, len(self.reviews) - quantidade))
+        return [{
+            "Categoria Principal": r["site_category_lv1"],
+            "Produto": r["product_name"],
+            "Categoria": r["site_category_lv1"],
+            "Subcategoria": r["site_category_lv2"],
+            "Título da Avaliação": r["review_title"],
+            "Avaliação Geral": int(r["overall_rating"]),
+            "Recomendaria a um amigo": r["recommend_to_a_friend"],
+            "Comentário": r["review_text"],
+            "Id": str(inicio + i + 1),
+        } for i, r in enumerate(self.reviews[inicio:inicio + quantidade])]
+
+
+def http_scenarios(amostra: Amostra) -> Dict[str, Tuple[Callable[[], Pedido], float]]:
+    """Cenários HTTP: nome -> (gerador de pedido, fração do número de requisições padrão)."""
+    return {
+        "busca_product_name": (lambda: ("GET", f"/product_name/{amostra.trecho_nome()}", None), 1.0),
+        "busca_product_brand": (lambda: ("GET", f"/product_brand/{amostra.valor('product_brand')}", None), 1.0),
+        "busca_site_category_lv1": (
+            lambda: ("GET", f"/site_category_lv1/{amostra.valor('site_category_lv1')}", None), 1.0),
+        "busca_site_category_lv2": (
+            lambda: ("GET", f"/site_category_lv2/{amostra.valor('site_category_lv2')}", None), 1.0),
+        "busca_hibrida": (lambda: ("GET", f"/product_name/{amostra.trecho_nome()}?hybrid=true", None), 1.0),
+        "busca_review_text": (lambda: ("GET", f"/review_text/{amostra.valor('review_title')}", None), 1.0),
+        "busca_identificador": (
+            lambda: ("GET", f"/review_text/{amostra.valor('product_name').split()[-1]}", None), 1.0),
+        "busca_filtrada": (
+            lambda: ("GET", f"/product_brand/{amostra.valor('product_brand')}?min_rating=4&recommend_to_a_friend=Yes",
+                     None), 1.0),
+        "sentimentos": (lambda: ("POST", "/sentimentos", {"comentarios": amostra.comentarios(10)}), 0.25),
+        "sentimentos_agregado": (
+            lambda: ("POST", "/sentimentos/agregado", {"comentarios": amostra.comentarios(20)}), 0.25),
+        "gerador_topicos": (lambda: ("POST", "/gerador_topicos", {"comentarios": amostra.comentarios(10)}), 0.25),
+        "sumarizacao": (lambda: ("POST", "/sumarizacao", {"comentarios": amostra.comentarios(50)}), 0.1),
+        "sentimento_geral": (
+            lambda: ("GET", f"/sentimento_geral/product_brand/{amostra.valor('product_brand')}/20", None), 0.1),
+        "chat": (lambda: ("POST", f"/chat?message=O que acham do {amostra.trecho_nome()}", None), 0.1),
+    }
+
+
+def compare(resultado: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Cenários em que p95, vazão ou pico de RSS pioraram mais que max_regression em relação ao baseline."""
+    regressoes = []
+    for nome, atual in resultado["cenarios"].items():
+        anterior = baseline.get("cenarios", {}).get(nome)
+        if not anterior:
+            continue
+        for metrica, pior_quando_maior in (("p95_ms", True), ("vazao_por_s", False), ("pico_rss_mb", True)):
+            antes, agora = anterior.get(metrica), atual.get(metrica)
+            if not antes or agora is None:
+                continue
+            variacao = agora / antes - 1 if pior_quando_maior else antes / agora - 1 if agora else float("inf")
+            if variacao > max_regression:
+                regressoes.append(f"{nome}.{metrica}: {antes} -> {agora} ({variacao:+.0%})")
+    return regressoes
+
+
+def print_report(resultado: dict) -> None:
+    cabecalho = (f"{'cenário':<26}{'req':>6}{'erros':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'vazão/s':>10}"
+                 f"{'RSS MB':>9}{'ΔRSS MB':>9}")
+    print(cabecalho)
+    print("-" * len(cabecalho))
+
+    def fmt(valor) -> str:
+        return "-" if valor is None else f"{valor:.1f}" if isinstance(valor, float) else str(valor)
+
+    for nome, c in resultado["cenarios"].items():
+        inicio, fim = c.get("rss_inicio_mb"), c.get("rss_fim_mb")
+        variacao = round(fim - inicio, 1) if inicio is not None and fim is not None else None
+        print(f"{nome:<26}{c['requisicoes']:>6}{c['erros']:>7}{fmt(c['p50_ms']):>10}{fmt(c['p95_ms']):>10}"
+              f"{fmt(c['p99_ms']):>10}{fmt(c['vazao_por_s']):>10}{fmt(c.get('pico_rss_mb')):>9}{fmt(variacao):>9}")
+
+
+async def _run_http(base_url: str, cenarios: Dict[str, Tuple[Callable[[], Pedido], float]], requisicoes: int,
+                    concorrencia: int, servidor_pid: int, resultado: dict) -> None:
+    # conexões ociosas são descartadas antes dos 5 s de keep-alive do uvicorn: com o mesmo prazo dos dois
+    # lados, uma conexão fechada pelo servidor pode ser reaproveitada pelo cliente e falhar com ReadError
+    limites = httpx.Limits(keepalive_expiry=2.0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(300.0), limits=limites) as client:
+        for nome, (fabrica, fracao) in cenarios.items():
+            pedidos = [fabrica() for _ in range(max(concorrencia, int(requisicoes * fracao)))]
+            rss_inicio, amostras = _rss_mb(servidor_pid), []
+            amostrador = asyncio.create_task(_sample_rss(servidor_pid, amostras))
+            try:
+                metricas = await run_http_scenario(client, pedidos, concorrencia)
+            finally:
+                amostrador.cancel()
+            metricas["rss_inicio_mb"] = rss_inicio
+            metricas["rss_fim_mb"] = _rss_mb(servidor_pid)
+            metricas["pico_rss_mb"] = max(amostras, default=None)
+            resultado["cenarios"][nome] = metricas
+            print(f"  {nome}: p95 {metricas['p95_ms']} ms, {metricas['vazao_por_s']} req/s, "
+                  f"{metricas['erros']} erros", metricas["falhas"] or "", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10k", help="reviews sintéticas: 10k, 100k, 1m ...")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="requisições por cenário de busca")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default="", help="lista separada por vírgulas (padrão: todos)")
+    parser.add_argument("--workdir", default=None, help="diretório de trabalho (padrão: temporário, apagado no fim)")
+    parser.add_argument("--output", default=None, help="arquivo JSON com o resultado")
+    parser.add_argument("--baseline", default=None, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--latency-ms", type=float, default=None, help="latência do Ollama falso até o 1º token")
+    parser.add_argument("--token-ms", type=float, default=None, help="latência do Ollama falso por token")
+    parser.add_argument("--embed-ms", type=float, default=None, help="latência do Ollama falso por lote de embeddings")
+    args = parser.parse_args()
+
+    linhas = parse_rows(args.rows)
+    selecionados = {nome.strip() for nome in args.scenarios.split(",") if nome.strip()}
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(workdir, exist_ok=True)
+    csv_filepath = os.path.join(workdir, f"reviews_{linhas}_{args.seed}.csv")
+    if not os.path.exists(csv_filepath):
+        print(f"gerando {linhas} reviews sintéticas em {csv_filepath}", flush=True)
+        generate_reviews(csv_filepath, linhas, args.seed)
+
+    porta_ollama, porta_app = _free_port(), _free_port()
+    opcoes_ollama = []
+    for opcao, valor in (("--latency-ms", args.latency_ms), ("--token-ms", args.token_ms),
+                         ("--embed-ms", args.embed_ms)):
+        if valor is not None:
+            opcoes_ollama += [opcao, str(valor)]
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])),
+        "OLLAMA_HOST": f"http://127.0.0.1:{porta_ollama}",
+        "REVIEWS_DB_FILE": os.path.join(workdir, "reviews.db"),
+        "EMBEDDING_CACHE_FILE": os.path.join(workdir, "embeddings_cache.db"),
+        "CHAT_DB_FILE": os.path.join(workdir, "chat_memory.db"),
+        "VECTOR_DB_DIR": os.path.join(workdir, "vector_db"),
+        "REVIEWS_CSV_FILE": csv_filepath,
+    }
+    for arquivo in ("reviews.db", "reviews.db-wal", "reviews.db-shm", "embeddings_cache.db", "chat_memory.db"):
+        if os.path.exists(os.path.join(workdir, arquivo)):
+            os.remove(os.path.join(workdir, arquivo))
+    shutil.rmtree(env["VECTOR_DB_DIR"], ignore_errors=True)
+
+    resultado = {
+        "meta": {
+            "linhas": linhas,
+            "seed": args.seed,
+            "requisicoes": args.requests,
+            "concorrencia": args.concurrency,
+            "ollama_falso": opcoes_ollama,
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cenarios": {},
+    }
+    processos: List[subprocess.Popen] = []
+    try:
+        ollama = subprocess.Popen([sys.executable, "-m", "bench.fake_ollama", "--port", str(porta_ollama),
+                                   *opcoes_ollama], cwd=REPO_DIR, env=env)
+        processos.append(ollama)
+        _wait_http(f"{env['OLLAMA_HOST']}/", ollama, timeout=30)
+
+        # ingestão e índice sempre rodam: os cenários HTTP dependem deles
+        for nome, etapa, argumentos in (("ingestao", "ingest", [csv_filepath]), ("indice", "index", [])):
+            print(f"{nome}...", flush=True)
+            resultado["cenarios"][nome] = run_task(etapa, argumentos, env)
+
+        cenarios = {nome: cenario for nome, cenario in http_scenarios(Amostra(csv_filepath, args.seed)).items()
+                    if not selecionados or nome in selecionados}
+        if cenarios:
+            app = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(porta_app),
+                                    "--log-level", "warning"], cwd=REPO_DIR, env=env)
+            processos.append(app)
+            base_url = f"http://127.0.0.1:{porta_app}"
+            _wait_http(f"{base_url}/", app, timeout=600)
+            print("cenários HTTP:", flush=True)
+            asyncio.run(_run_http(base_url, cenarios, args.requests, args.concurrency, app.pid, resultado))
+            resultado["ollama_falso"] = httpx.get(f"{env['OLLAMA_HOST']}/fake/stats").json()
+    finally:
+        for processo in reversed(processos):
+            processo.terminate()
+            try:
+                processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_report(resultado)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    falhou = False
+    com_erros = {nome: c for nome, c in resultado["cenarios"].items() if c["erros"]}
+    if com_erros:
+        # latências e vazão de um cenário com erros não são comparáveis com as de uma execução limpa
+        print("\nERRO: cenários com requisições que falharam:")
+        for nome, c in com_erros.items():
+            print(f"  {nome}: {c['erros']} de {c['requisicoes']} {c.get('falhas') or ''}")
+        falhou = True
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressoes = compare(resultado, json.load(f), args.max_regression)
+        if regressoes:
+            print(f"\nregressões acima de {args.max_regression:.0%}:")
+            for regressao in regressoes:
+                print(f"  {regressao}")
+            falhou = True
+        else:
+            print(f"\nsem regressões acima de {args.max_regression:.0%} em relação a {args.baseline}")
+
+    if falhou:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Gerador determinístico de reviews sintéticas no formato do B2W-Reviews01.csv
+(mesmas colunas, na mesma ordem), para os benchmarks:
+
+    python -m bench.synthetic --rows 100k --output /tmp/bench/B2W-Reviews01.csv
+
+A forma dos dados segue a do B2W: poucas categorias, muitas marcas e produtos
+com cauda longa (poucos produtos concentram boa parte das reviews), notas
+puxadas para 5, marcas vazias em parte das linhas e comentários curtos, vários
+quase idênticos entre si.
+"""
+import argparse
+import csv
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+COLUMNS = [
+    "submission_date", "reviewer_id", "product_id", "product_name", "product_brand",
+    "site_category_lv1", "site_category_lv2", "review_title", "overall_rating",
+    "recommend_to_a_friend", "review_text", "reviewer_birth_year", "reviewer_gender", "reviewer_state",
+]
+
+CATEGORIAS = {
+    "Celulares e Smartphones": ["Smartphone", "Acessórios para Celular", "Capinhas e Películas"],
+    "Eletrodomésticos": ["Geladeira", "Fogão", "Máquina de Lavar", "Micro-ondas"],
+    "Eletroportáteis": ["Liquidificador", "Cafeteira", "Ferro de Passar", "Aspirador de Pó", "Fritadeira"],
+    "TV e Home Theater": ["Smart TV", "Home Theater", "Soundbar", "Suporte para TV"],
+    "Informática": ["Notebook", "Impressora", "Mouse", "Teclado", "Monitor", "Roteador"],
+    "Games": ["Console", "Jogos", "Controle"],
+    "Beleza e Perfumaria": ["Perfume", "Secador de Cabelo", "Chapinha", "Barbeador"],
+    "Casa e Construção": ["Furadeira", "Ventilador", "Ar-Condicionado", "Colchão"],
+    "Brinquedos": ["Bonecas", "Jogos de Tabuleiro", "Carrinhos"],
+    "Livros": ["Literatura", "Autoajuda", "Infantil"],
+}
+MARCAS = [
+    "Samsung", "LG", "Motorola", "Apple", "Xiaomi", "Philco", "Britânia", "Mondial", "Arno", "Electrolux",
+    "Brastemp", "Consul", "Panasonic", "Sony", "Philips", "Multilaser", "Positivo", "Dell", "HP", "Lenovo",
+    "Acer", "Asus", "Epson", "Canon", "Logitech", "Microsoft", "Nintendo", "Black+Decker", "Bosch", "Makita",
+    "Walita", "Cadence", "Oster", "Tramontina", "Taiff", "Gama", "Mattel", "Hasbro", "Estrela", "Intelbras",
+]
+MODIFICADORES = ["Preto", "Branco", "Prata", "110V", "220V", "Bivolt", "32GB", "64GB", "128GB", "Dual Chip",
+                 "4K", "Full HD", "Inox", "Compacto", "Pro", "Plus", "Max", "Lite", "Edição Especial"]
+ESTADOS = ["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "PE", "CE", "GO", "DF", "ES", "PA", "AM", "MT", "MS"]
+
+# Distribuição aproximada das notas no B2W (1 a 5 estrelas)
+PESOS_NOTAS = [0.13, 0.05, 0.10, 0.20, 0.52]
+
+TITULOS = {
+    "positivo": ["Excelente", "Muito bom", "Recomendo", "Ótimo produto", "Gostei muito", "Superou as expectativas"],
+    "neutro": ["Razoável", "Bom, mas poderia ser melhor", "Regular", "Cumpre o que promete"],
+    "negativo": ["Péssimo", "Não recomendo", "Decepcionado", "Produto com defeito", "Não chegou"],
+}
+FRASES = {
+    "positivo": [
+        "Produto excelente, chegou antes do prazo.", "Muito bom, recomendo a todos.",
+        "Ótimo custo benefício.", "Entrega rápida e produto bem embalado.", "Funciona perfeitamente.",
+        "Qualidade muito boa, superou minhas expectativas.", "Bonito e fácil de usar.",
+        "A bateria dura bastante.", "Chegou tudo certo, estou satisfeito.",
+    ],
+    "neutro": [
+        "O produto é bom, mas a entrega atrasou alguns dias.", "Cumpre o que promete, nada além.",
+        "Achei um pouco caro pelo que oferece.", "Funciona, mas o material parece frágil.",
+        "Razoável, esperava um pouco mais.",
+    ],
+    "negativo": [
+        "Produto veio com defeito e não consegui trocar.", "Não recomendo, parou de funcionar em uma semana.",
+        "A entrega atrasou muito e o atendimento não resolveu.", "Chegou quebrado.",
+        "Péssima qualidade, material muito frágil.", "Não corresponde à descrição do anúncio.",
+        "Até hoje não recebi o produto.",
+    ],
+}
+
+
+def parse_rows(valor: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000; aceita também números simples."""
+    valor = valor.strip().lower().replace("_", "")
+    multiplicador = {"k": 1_000, "m": 1_000_000}.get(valor[-1:], 1)
+    return int(float(valor[:-1] if multiplicador > 1 else valor) * multiplicador)
+
+
+def make_catalog(produtos: int, rng: random.Random) -> List[Dict[str, str]]:
+    catalogo = []
+    for i in range(produtos):
+        categoria = rng.choice(list(CATEGORIAS))
+        subcategoria = rng.choice(CATEGORIAS[categoria])
+        marca = rng.choice(MARCAS) if rng.random() > 0.25 else ""
+        modelo = f"{rng.choice('ABCDEFGHJKLMNPRSTUVWXZ')}{rng.randint(10, 9999)}"
+        nome = " ".join(filter(None, [subcategoria, marca, modelo, *rng.sample(MODIFICADORES, rng.randint(0, 2))]))
+        catalogo.append({
+            "product_id": str(100_000_000 + i),
+            "product_name": nome,
+            "product_brand": marca.lower(),
+            "site_category_lv1": categoria,
+            "site_category_lv2": subcategoria,
+        })
+    return catalogo
+
+
+def _comentario(tom: str, rng: random.Random) -> str:
+    frases = rng.sample(FRASES[tom], rng.randint(1, min(3, len(FRASES[tom]))))
+    if tom != "neutro" and rng.random() < 0.3:
+        frases.append(rng.choice(FRASES["neutro"]))
+    return " ".join(frases)
+
+
+def generate_reviews(path: str, rows: int, seed: int = 42) -> str:
+    """Escreve `rows` reviews sintéticas em `path` (CSV com o cabeçalho do B2W). Mesma semente, mesmo arquivo."""
+    rng = random.Random(seed)
+    catalogo = make_catalog(max(10, rows // 15), rng)
+    inicio = datetime(2018, 1, 1)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for _ in range(rows):
+            # cauda longa: os produtos do início do catálogo concentram as reviews
+            produto = catalogo[int(len(catalogo) * rng.random() ** 2.5)]
+            nota = rng.choices(range(1, 6), weights=PESOS_NOTAS)[0]
+            tom = "positivo" if nota >= 4 else "negativo" if nota <= 2 else "neutro"
+            # parte das reviews contradiz a nota, como no B2W
+            if rng.random() < 0.08:
+                tom = rng.choice(["positivo", "negativo"])
+            recomenda = "Yes" if nota >= 4 or (nota == 3 and rng.random() < 0.5) else "No"
+            data = inicio + timedelta(seconds=rng.randrange(150 * 24 * 3600))
+            writer.writerow([
+                data.strftime("%Y-%m-%d %H:%M:%S"),
+                f"{rng.getrandbits(64):016x}",
+                produto["product_id"],
+                produto["product_name"],
+                produto["product_brand"],
+                produto["site_category_lv1"],
+                produto["site_category_lv2"],
+                rng.choice(TITULOS[tom]),
+                nota,
+                recomenda,
+                _comentario(tom, rng),
+                rng.randint(1950, 2002) if rng.random() > 0.05 else "",
+                rng.choice(["M", "F"]),
+                rng.choice(ESTADOS),
+            ])
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10k", help="quantidade de reviews: 10k, 100k, 1m ...")
+    parser.add_argument("--output", default="B2W-Reviews01.csv")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate_reviews(args.output, parse_rows(args.rows), args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Etapas offline medidas pelo bench.run, cada uma em um processo próprio para
+que o pico de memória seja só dela. Os caminhos vêm das variáveis de ambiente
+(REVIEWS_DB_FILE, VECTOR_DB_DIR, EMBEDDING_CACHE_FILE, OLLAMA_HOST):
+
+    python -m bench.tasks ingest caminho/do/arquivo.csv
+    python -m bench.tasks index
+
+Imprime uma linha JSON com a quantidade de itens processados.
+"""
+import json
+import sys
+
+from config.database import count_vector_values, csv_to_sqlite, refresh_review_stats
+from config.registry import retriever_registry
+from config.vectorstore import VECTOR_DB_FIELDS
+
+
+def ingest(csv_filepath: str) -> dict:
+    linhas = csv_to_sqlite(csv_filepath)
+    refresh_review_stats()
+    return {"itens": linhas}
+
+
+def build_index() -> dict:
+    retriever_registry.reload(rebuild=True)
+    return {"itens": sum(count_vector_values(field) for field in VECTOR_DB_FIELDS)}
+
+
+def main():
+    etapa, argumentos = sys.argv[1], sys.argv[2:]
+    resultado = ingest(*argumentos) if etapa == "ingest" else build_index()
+    print(json.dumps(resultado), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,47 @@
 from langchain_core.output_parsers import StrOutputParser, PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableSerializable
+from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnableSerializable
 from langgraph.prebuilt import create_react_agent
 from langgraph.checkpoint.memory import InMemorySaver
 
 from models.summarization_model import Sumarizacao
 from models.topics_model import Topics
-from models.sentimentos_model import SentimentosModel
+from models.sentimentos_model import SentimentoComentario, SentimentosLote, SentimentosModel
 
 from langchain_ollama import OllamaLLM
 from langchain.agents import initialize_agent, AgentType
 from langchain.memory import ConversationBufferMemory
 
+import os
 import sqlite3
-from typing import List
+from typing import Dict, List, Optional
 
 
+from config.batching import CLASSIFY_MICROBATCH_SIZE, MICROBATCH_MAX_WAIT_MS, MicroBatcher
+from config.concurrency import LLM_MAX_CONCURRENCY
+from config.context_packing import pack_context
+from config.llm_cache import cached_chain
+from config.memory import make_history_hook
+from config.tokens import chunk_by_tokens
+from config.structured import structured_model
 from config.tools import (
     buscar_por_nome_produto,
     buscar_por_marca_produto,
     buscar_por_categoria_lv1,
     buscar_por_categoria_lv2,
+    buscar_por_texto_review,
 )
 
+# Orçamento (tokens estimados) de comentários por chamada de sumarização;
+# acima disso a sumarização passa a ser hierárquica (map-reduce)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1200"))
 
-def get_agent_gerador_topicos(model):
 
-    parser = PydanticOutputParser(pydantic_object=Topics)
+def model_name(model) -> str:
+    return getattr(model, "model", None) or str(model)
+
+
+def get_agent_gerador_topicos(model):
 
     prompt = ChatPromptTemplate.from_template(template="""
 Você é um assistente de IA especializado em e-commerce. Sua tarefa é analisar comentários de usuários e extrair os principais tópicos abordados de forma objetiva e estruturada, gerando também insights úteis para o time de produto e atendimento.
@@ -56,28 +71,22 @@ Você também pode identificar e criar novos tópicos, caso perceba padrões rec
 
 5. Seja objetivo: cada insight deve representar uma conclusão clara que possa ser usada para melhorar o serviço, o produto ou a operação.
 
-6. **Formato de saída (JSON)**:  
-   Utilize estritamente este modelo Pydantic (já gerado por {format_instructions}) e retorne apenas o JSON.  
-   Não inclua texto adicional fora do JSON!
+6. Retorne apenas o JSON, com os insights na lista "extracted_topics".
 
 ---
 
 **Comentários para analisar (texto único):**  
 {query}
  
-""",
-        partial_variables={"format_instructions": parser.get_format_instructions()}
-    )
+""")
 
-    model_tool = model.with_structured_output(Topics)
-    chain = prompt | model_tool
+    model_tool = structured_model(model, Topics)
+    chain = cached_chain(prompt, model_tool, model_name(model), "topicos", Topics)
 
     return chain
 
 def get_agent_sumarizacao(model):
 
-    parser = PydanticOutputParser(pydantic_object=Sumarizacao)
-
     prompt = ChatPromptTemplate.from_template(template="""
 Você é um assistente de IA especializado em análise de comentários de e-commerce.
 
@@ -96,7 +105,7 @@ O que se espera aqui é uma **visão macro e estratégica**, útil para tomada d
 
 ### Instruções:
 
-1. A entrada será uma **lista de comentários reais de clientes** relacionados a um mesmo item (produto, marca ou categoria).
+1. A entrada será uma **lista de comentários reais de clientes** relacionados a um mesmo item (produto, marca ou categoria), agrupados por produto. Quando uma avaliação tem "Repetições", ela representa essa quantidade de comentários quase idênticos.
 
 2. Leia e analise os comentários como um todo.
 
@@ -108,25 +117,153 @@ O que se espera aqui é uma **visão macro e estratégica**, útil para tomada d
 
 6. Não precisa listar todos os tópicos. Concentre-se no **contexto e sentimento geral** observado na amostra.
 
-7. **Formato de saída (JSON):**
-    {format_instructions}
+7. Retorne apenas o JSON, com o resumo no campo "resumo_final".
 
 ---
-
+{contexto}
 **Comentários para analisar (texto único):**  
 {query}
 """,
-        partial_variables={
-            "format_instructions": parser.get_format_instructions()
-        }
+        partial_variables={"contexto": ""}
     )
 
     # 3) Encadeia: prompt → modelo com output estruturado
-    model_tool = model.with_structured_output(Sumarizacao)
-    chain = prompt | model_tool
+    model_tool = structured_model(model, Sumarizacao)
+    chain = cached_chain(prompt, model_tool, model_name(model), "sumarizacao", Sumarizacao)
+
+    return chain
+
+def get_agent_sumarizacao_reduce(model):
+    """
+    Cadeia da etapa de redução do map-reduce: consolida resumos parciais
+    (cada um feito sobre um bloco de comentários) em um único resumo.
+    """
+
+    prompt = ChatPromptTemplate.from_template(template="""
+Você é um assistente de IA especializado em análise de comentários de e-commerce.
+
+Os comentários de clientes sobre um **mesmo produto, marca ou categoria** foram divididos em blocos, e cada bloco já foi resumido por outra IA. Sua tarefa é **consolidar esses resumos parciais em um único resumo geral estratégico e objetivo**.
+
+### Instruções:
+
+1. Considere todos os resumos parciais como partes de uma mesma amostra.
+
+2. Identifique o tom geral (positivo, negativo ou misto) e os elogios e reclamações que se repetem entre os blocos; dê mais peso ao que aparece em vários resumos.
+
+3. Gere um **resumo geral coeso**, de 10 a 15 frases, sem repetir informações e sem citar os blocos.
+
+4. Seja fiel aos resumos. Não invente tendências que não estejam presentes.
+
+5. Retorne apenas o JSON, com o resumo no campo "resumo_final".
+
+---
+{contexto}
+**Resumos parciais:**  
+{query}
+""",
+        partial_variables={"contexto": ""}
+    )
+
+    model_tool = structured_model(model, Sumarizacao)
+    chain = cached_chain(prompt, model_tool, model_name(model), "sumarizacao_reduce", Sumarizacao)
 
     return chain
 
+def get_agent_sumarizacao_map_reduce(model, chunk_tokens: int = SUMMARY_CHUNK_TOKENS,
+                                     max_concurrency: int = LLM_MAX_CONCURRENCY):
+    """
+    Sumarização hierárquica para conjuntos grandes de comentários.
+
+    Antes de tudo os comentários passam por pack_context: duplicatas quase
+    idênticas saem e os metadados do produto aparecem uma vez por grupo.
+    Nenhum comentário é cortado: o orçamento vale por prompt, não para o
+    total. Se o resultado cabe em chunk_tokens, é uma chamada única ao agente
+    de sumarização. Caso contrário: divide os comentários em blocos de até
+    chunk_tokens, resume os blocos em paralelo (map) e consolida os resumos
+    parciais em rodadas de até chunk_tokens, também em paralelo, até sobrar um só (reduce). Cada
+    rodada divide a quantidade de resumos, então a latência cresce com o log
+    do tamanho da entrada e nenhum prompt estoura o contexto do modelo.
+
+    A entrada pode trazer "contexto" (ex.: estatísticas materializadas de
+    format_stats_context), que vai para a chamada única ou para a consolidação.
+    """
+    map_chain = get_agent_sumarizacao(model)
+    reduce_chain = get_agent_sumarizacao_reduce(model)
+
+    def blocos_de(entrada):
+        itens = entrada["query"]
+        if not isinstance(itens, list):
+            itens = [itens]
+        return pack_context(itens, None, chunk_tokens)
+
+    def rodada(resumos):
+        grupos = chunk_by_tokens(resumos, chunk_tokens)
+        if len(grupos) == len(resumos) > 1:
+            # resumos grandes demais para agrupar pelo orçamento: consolida de dois em dois
+            grupos = [resumos[i:i + 2] for i in range(0, len(resumos), 2)]
+        return [{"query": "\n\n".join(grupo)} for grupo in grupos]
+
+    async def resumir(entrada, config: RunnableConfig):
+        contexto = entrada.get("contexto", "")
+        blocos = blocos_de(entrada)
+        if len(blocos) == 1:
+            return await map_chain.ainvoke({"query": blocos[0], "contexto": contexto}, config)
+
+        batch_config = {**config, "max_concurrency": max_concurrency}
+        parciais = await map_chain.abatch([{"query": bloco} for bloco in blocos], config=batch_config)
+        resumos = [parcial.resumo_final for parcial in parciais]
+
+        while True:
+            entradas = rodada(resumos)
+            if len(entradas) == 1:
+                return await reduce_chain.ainvoke({**entradas[0], "contexto": contexto}, config)
+            resumos = [r.resumo_final for r in await reduce_chain.abatch(entradas, config=batch_config)]
+
+    def resumir_sync(entrada, config: RunnableConfig):
+        contexto = entrada.get("contexto", "")
+        blocos = blocos_de(entrada)
+        if len(blocos) == 1:
+            return map_chain.invoke({"query": blocos[0], "contexto": contexto}, config)
+
+        batch_config = {**config, "max_concurrency": max_concurrency}
+        parciais = map_chain.batch([{"query": bloco} for bloco in blocos], config=batch_config)
+        resumos = [parcial.resumo_final for parcial in parciais]
+
+        while True:
+            entradas = rodada(resumos)
+            if len(entradas) == 1:
+                return reduce_chain.invoke({**entradas[0], "contexto": contexto}, config)
+            resumos = [r.resumo_final for r in reduce_chain.batch(entradas, config=batch_config)]
+
+    return RunnableLambda(resumir_sync, afunc=resumir, name="sumarizacao_map_reduce")
+
+def format_stats_context(stats) -> str:
+    """
+    Texto com as estatísticas materializadas (config.database.select_review_stats)
+    para o prompt de sumarização: os números exatos sobre todas as reviews,
+    em vez de o modelo estimá-los a partir de uma amostra de comentários.
+    """
+    if not stats:
+        return ""
+    linhas = [
+        f"**Estatísticas de todas as {stats['total_reviews']} reviews de {stats['nome'] or stats['valor']}** "
+        f"(números exatos do banco; use-os como referência e não os recalcule a partir da amostra):",
+        f"- Nota média: {stats['nota_media']}",
+        "- Distribuição das notas: " + ", ".join(
+            f"{nota} estrela(s): {quantidade}" for nota, quantidade in stats["histograma_notas"].items()),
+    ]
+    if stats["recomendariam"]["taxa"] is not None:
+        linhas.append(f"- Recomendariam a um amigo: {stats['recomendariam']['taxa']:.0%}")
+    sentimentos = stats["sentimentos"]
+    if sentimentos["classificadas"]:
+        linhas.append(
+            f"- Sentimento ({sentimentos['classificadas']} reviews classificadas): "
+            f"{sentimentos['POSITIVO']:.0%} positivas, {sentimentos['NEGATIVO']:.0%} negativas, "
+            f"{sentimentos['NEUTRO']:.0%} neutras"
+        )
+    return "\n".join(linhas) + "\n\n"
+
+
 def get_agent_sentimentos(model):
     """
     Retorna uma cadeia que, dado um conjunto de comentários em texto,
@@ -147,30 +284,107 @@ Para cada bloco de comentários fornecido, siga estes passos:
 
 Por fim, gere a **porcentagem geral de comentários** em cada categoria de sentimento (Positivos, Negativos, Neutros).  
 
-Formate a saída exatamente neste formato JSON, sem texto adicional:
-{{
-  "Sentimentos": {{
-    "Positivos": "XX%",
-    "Negativos": "YY%",
-    "Neutros": "ZZ%"
-  }}
-}}
+Retorne apenas o JSON {{"Positivos": "XX%", "Negativos": "YY%", "Neutros": "ZZ%"}}.
 
 COMENTÁRIOS PARA ANALISAR:
 {query}
 """)
 
-    model_tool = model.with_structured_output(SentimentosModel)
-    chain = prompt | model_tool
+    model_tool = structured_model(model, SentimentosModel)
+    chain = cached_chain(prompt, model_tool, model_name(model), "sentimentos", SentimentosModel)
     return chain
 
+
+def get_agent_classificador_sentimento(model):
+    """
+    Classifica um único comentário como POSITIVO, NEGATIVO ou NEUTRO, com uma
+    saída curta e restrita. As porcentagens de um conjunto de comentários são
+    calculadas em Python a partir desses rótulos (config.sentiment).
+    """
+
+    prompt = ChatPromptTemplate.from_template(template="""
+Classifique o sentimento do comentário de um cliente de e-commerce como POSITIVO, NEGATIVO ou NEUTRO.
+Baseie-se principalmente no texto: a nota numérica nem sempre reflete o sentimento real.
+Responda apenas com o JSON {{"sentimento": "POSITIVO" | "NEGATIVO" | "NEUTRO"}}.
+
+COMENTÁRIO:
+{query}
+""")
+
+    model_tool = structured_model(model, SentimentoComentario)
+    chain = cached_chain(prompt, model_tool, model_name(model), "classificador_sentimento", SentimentoComentario)
+    return chain
+
+
+def get_agent_classificador_sentimento_lote(model, total: Optional[int] = None):
+    """
+    Classifica vários comentários numerados em uma única chamada, devolvendo
+    um rótulo por comentário na ordem da entrada. Com total, o schema enviado
+    ao Ollama fixa o tamanho da lista e a decodificação não pode pular nem
+    repetir rótulos.
+    """
+
+    prompt = ChatPromptTemplate.from_template(template="""
+Classifique o sentimento de cada comentário de cliente de e-commerce abaixo como POSITIVO, NEGATIVO ou NEUTRO.
+Baseie-se principalmente no texto: a nota numérica nem sempre reflete o sentimento real.
+Responda apenas com o JSON {{"sentimentos": [...]}}, com exatamente {total} rótulos, na ordem dos comentários.
+
+COMENTÁRIOS:
+{query}
+""")
+
+    formato = SentimentosLote.model_json_schema()
+    if total:
+        formato["properties"]["sentimentos"].update(minItems=total, maxItems=total)
+    model_tool = structured_model(model, SentimentosLote, formato)
+    chain = cached_chain(prompt, model_tool, model_name(model), "classificador_sentimento_lote", SentimentosLote)
+    return chain
+
+
+def get_agent_classificador_sentimento_microbatch(model, max_batch_size: int = CLASSIFY_MICROBATCH_SIZE,
+                                                  max_wait_ms: float = MICROBATCH_MAX_WAIT_MS):
+    """
+    Classificador de sentimento com os comentários de requisições concorrentes
+    agrupados (config.batching): os que chegam dentro da janela vão ao modelo
+    em um único prompt numerado. Se essa chamada falhar ou devolver um número
+    de rótulos diferente do lote, o lote é refeito comentário a comentário.
+    """
+    individual = get_agent_classificador_sentimento(model)
+    lotes: Dict[int, RunnableSerializable] = {}
+
+    def classificar(comentarios):
+        if len(comentarios) > 1:
+            texto = "\n\n".join(f"{i}. {comentario}" for i, comentario in enumerate(comentarios, 1))
+            lote = lotes.get(len(comentarios))
+            if lote is None:
+                lote = lotes.setdefault(len(comentarios), get_agent_classificador_sentimento_lote(model, len(comentarios)))
+            try:
+                resultado = lote.invoke({"query": texto, "total": len(comentarios)})
+                if len(resultado.sentimentos) == len(comentarios):
+                    return [SentimentoComentario(sentimento=sentimento) for sentimento in resultado.sentimentos]
+            except Exception:
+                pass
+        return individual.batch([{"query": comentario} for comentario in comentarios], return_exceptions=True)
+
+    batcher = MicroBatcher(classificar, max_batch_size, max_wait_ms, max_concurrency=LLM_MAX_CONCURRENCY,
+                           name=f"classificador_sentimento:{model_name(model)}")
+
+    def invoke(entrada):
+        return batcher(entrada["query"])
+
+    async def ainvoke(entrada):
+        return await batcher.acall(entrada["query"])
+
+    return RunnableLambda(invoke, afunc=ainvoke, name="classificador_sentimento_microbatch")
+
   
-def get_agent_chat_rag(model, temperature: float = 0.0):
+def get_agent_chat_rag(model, temperature: float = 0.0, checkpointer=None):
     """
     Agente RAG com:
      - Prefixo que lida com cumprimentos (greetings)
      - Suffix que instrui quando e como usar as ferramentas FAISS
-     - Memória de conversa (ConversationBufferMemory)
+     - Memória de conversa por sessão (thread_id) no checkpointer informado,
+       com janela deslizante + resumo contínuo limitando o histórico do prompt
     """
 
     tools = [
@@ -178,9 +392,10 @@ def get_agent_chat_rag(model, temperature: float = 0.0):
         buscar_por_marca_produto,
         buscar_por_categoria_lv1,
         buscar_por_categoria_lv2,
+        buscar_por_texto_review,
     ]
 
-    memory = InMemorySaver()
+    memory = checkpointer or InMemorySaver()
 
     prompt_template_string = """
     Você é um assistente conversacional de e-commerce. Siga estas instruções:
@@ -205,6 +420,8 @@ def get_agent_chat_rag(model, temperature: float = 0.0):
     - busca_por_categoria_lv1(pergunta): retorna até 3 produtos com base na categoria de nível 1.
 
     - busca_por_categoria_lv2(pergunta): retorna até 3 produtos com base na categoria de nível 2.
+
+    - busca_por_texto_review(pergunta): retorna até 3 reviews cujo título ou texto mencionam os termos da pergunta (defeitos, características, códigos de modelo).
     
 
     COMO USAR AS FERRAMENTAS:
@@ -219,19 +436,33 @@ def get_agent_chat_rag(model, temperature: float = 0.0):
     Final Answer: [aqui vai a sua resposta final para o usuário]
     """
     
-   # 1. Crie o template de prompt a partir da string unificada
-    prompt = ChatPromptTemplate.from_template(prompt_template_string)
-
+    # A string vira a SystemMessage inicial; o histórico da sessão vem logo depois
     agent_executor = create_react_agent(
         model=model,
         tools=tools,
-        prompt=prompt,
+        prompt=prompt_template_string,
+        pre_model_hook=make_history_hook(model),
         checkpointer=memory, 
     )
     
 
     return agent_executor
 
+def build_agents(model, checkpointer=None) -> Dict[str, RunnableSerializable]:
+    """
+    Monta uma única vez todas as cadeias/agentes de um modelo. O resultado fica
+    em app.consts.agents, e os endpoints apenas invocam as cadeias prontas.
+    """
+    return {
+        "sentimentos": get_agent_sentimentos(model),
+        "classificador_sentimento": get_agent_classificador_sentimento_microbatch(model),
+        "gerador_topicos": get_agent_gerador_topicos(model),
+        "sumarizacao": get_agent_sumarizacao(model),
+        "sumarizacao_map_reduce": get_agent_sumarizacao_map_reduce(model),
+        "chat_rag": get_agent_chat_rag(model, checkpointer=checkpointer),
+    }
+
+
 ## NAO TESTADO AINDA, IGNORAR!!!!!!!!!!!!!! Ass: isabelli
 
 def get_agent_sentimento_geral(model):
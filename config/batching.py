@@ -0,0 +1,172 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from config.concurrency import LLM_MAX_CONCURRENCY
+
+# Janela máxima (ms) que um pedido espera por outros para formar um lote
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+# Tamanho máximo dos lotes de embeddings e de classificação enviados ao Ollama
+EMBEDDING_MICROBATCH_SIZE = int(os.getenv("EMBEDDING_MICROBATCH_SIZE", "64"))
+CLASSIFY_MICROBATCH_SIZE = int(os.getenv("CLASSIFY_MICROBATCH_SIZE", "8"))
+
+_BATCHERS: "weakref.WeakSet[MicroBatcher]" = weakref.WeakSet()
+
+
+class MicroBatcher:
+    """
+    Despachante compartilhado que agrupa pedidos concorrentes em lotes.
+
+    Cada submit() entra em uma fila; uma thread de coleta junta os pedidos que
+    chegam dentro de max_wait_ms (até max_batch_size), chama batch_fn(itens)
+    uma única vez e devolve a cada chamador o resultado da sua posição. Com
+    max_concurrency lotes já em andamento, a coleta espera uma vaga e o lote
+    seguinte cresce com o que chegou nesse meio tempo, então sob carga a fila
+    do Ollama fica curta e os lotes, maiores.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int,
+                 max_wait_ms: float = MICROBATCH_MAX_WAIT_MS, max_concurrency: int = 1, name: str = "microbatch"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+        _BATCHERS.add(self)
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    async def acall(self, item: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._slots.acquire()
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            threading.Thread(target=self._dispatch, args=(batch,), name=f"{self.name}-lote", daemon=True).start()
+
+    @staticmethod
+    def _resolve(future: Future, resultado: Any) -> None:
+        """Entrega o resultado (ou a exceção) a um chamador; um future já resolvido não afeta os demais."""
+        try:
+            if isinstance(resultado, Exception):
+                future.set_exception(resultado)
+            else:
+                future.set_result(resultado)
+        except InvalidStateError:
+            pass
+
+    def _dispatch(self, batch) -> None:
+        try:
+            # pedidos cancelados antes do despacho (ex.: asyncio.wait_for expirado) saem do lote;
+            # os demais passam a "em execução" e não podem mais ser cancelados
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                return
+            itens = [item for item, _ in batch]
+            with self._lock:
+                self.batches += 1
+                self.items += len(itens)
+            try:
+                resultados = self.batch_fn(itens)
+                if len(resultados) != len(itens):
+                    raise ValueError(f"{self.name}: lote com {len(itens)} itens devolveu {len(resultados)} resultados")
+            except Exception as exc:
+                for _, future in batch:
+                    self._resolve(future, exc)
+                return
+            for (_, future), resultado in zip(batch, resultados):
+                self._resolve(future, resultado)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lotes": self.batches,
+                "itens": self.items,
+                "itens_por_lote": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "fila": self._queue.qsize(),
+            }
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embeddings com as consultas concorrentes agrupadas: cada embed_query de
+    qualquer handler (sync ou async) entra no mesmo MicroBatcher e textos que
+    chegam juntos vão ao Ollama em uma única chamada embed_documents. Listas
+    grandes (construção de índice) já são lotes e seguem direto.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = EMBEDDING_MICROBATCH_SIZE,
+                 max_wait_ms: float = MICROBATCH_MAX_WAIT_MS):
+        self.embeddings = embeddings
+        self.batcher = MicroBatcher(self._embed_batch, max_batch_size, max_wait_ms,
+                                    max_concurrency=LLM_MAX_CONCURRENCY, name="embeddings")
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        unicos = list(dict.fromkeys(texts))
+        vetores = dict(zip(unicos, self.embeddings.embed_documents(unicos)))
+        return [vetores[text] for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) >= self.batcher.max_batch_size:
+            return self.embeddings.embed_documents(texts)
+        futures = [self.batcher.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) >= self.batcher.max_batch_size:
+            return await self.embeddings.aembed_documents(texts)
+        return list(await asyncio.gather(*(self.batcher.acall(text) for text in texts)))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.batcher.acall(text)
+
+
+def batching_stats() -> Dict[str, dict]:
+    """Lotes despachados, itens e tamanho médio dos lotes de cada MicroBatcher ativo."""
+    return {batcher.name: batcher.stats() for batcher in list(_BATCHERS)}
@@ -0,0 +1,22 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Threads reservadas para o que ainda é bloqueante (SQLite, FAISS, I/O de disco)
+BLOCKING_MAX_WORKERS = int(os.getenv("BLOCKING_MAX_WORKERS", "8"))
+
+# Máximo de chamadas ao modelo em andamento por requisição nos endpoints em lote
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+BLOCKING_EXECUTOR = ThreadPoolExecutor(max_workers=BLOCKING_MAX_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Executa uma função síncrona no executor limitado, sem travar o event loop.
+    Como o executor tem um número fixo de threads, chamadas excedentes esperam
+    na fila em vez de criar threads sem limite.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BLOCKING_EXECUTOR, partial(func, *args, **kwargs))
@@ -0,0 +1,213 @@
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import xxhash
+from pydantic import BaseModel
+
+from config.tokens import estimate_tokens
+
+# Orçamento total (tokens estimados) de comentários enviados a uma chamada única de
+# sumarização; o que passar disso é cortado, do fim da ordem de prioridade
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Similaridade de Jaccard (estimada por MinHash) a partir da qual dois comentários são quase idênticos
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.8"))
+# Permutações da assinatura MinHash e linhas por banda do LSH (bandas = permutações / linhas)
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "64"))
+MINHASH_BAND_ROWS = int(os.getenv("MINHASH_BAND_ROWS", "4"))
+# Tamanho (caracteres) dos shingles comparados
+SHINGLE_SIZE = 5
+
+# Rótulos de format_docs / ComentarioInput que descrevem o produto: ficam uma vez por grupo
+GROUP_LABELS = ("Id do Produto", "Produto", "Marca", "Categoria", "Subcategoria")
+# Rótulos de cada review que chegam ao modelo; Id, dados do avaliador etc. não ajudam a resumir
+REVIEW_LABELS = ("Título da Avaliação", "Avaliação Geral", "Recomendaria a um amigo", "Comentário")
+# Valor do campo indexado (page_content), repetido em um dos rótulos de grupo
+MAIN_LABEL = "Categoria Principal"
+
+# Uma semente por permutação; cada permutação é o finalizador do murmur3 sobre hash ^ semente
+_SEMENTES = np.random.default_rng(20240601).integers(0, 1 << 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def _fmix64(x: np.ndarray) -> np.ndarray:
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xFF51AFD7ED558CCD)
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xC4CEB9FE1A85EC53)
+    return x ^ (x >> np.uint64(33))
+
+
+def _as_dict(item: Any) -> Dict[str, Any]:
+    if isinstance(item, BaseModel):
+        return item.model_dump(by_alias=True)
+    if isinstance(item, dict):
+        return item
+    return {"Comentário": str(item)}
+
+
+def _normalize_text(text: str) -> str:
+    sem_acento = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", sem_acento.casefold()))
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """
+    Assinatura MinHash dos shingles de caracteres do texto normalizado (sem
+    caixa, acentos e pontuação). None para texto vazio, que não é deduplicado.
+    """
+    normalizado = _normalize_text(text)
+    if not normalizado:
+        return None
+    shingles = {normalizado[i:i + SHINGLE_SIZE] for i in range(max(1, len(normalizado) - SHINGLE_SIZE + 1))}
+    hashes = np.fromiter((xxhash.xxh3_64_intdigest(s) for s in shingles), dtype=np.uint64, count=len(shingles))
+    with np.errstate(over="ignore"):
+        return _fmix64(hashes[None, :] ^ _SEMENTES[:, None]).min(axis=1)
+
+
+def _review_text(review: Dict[str, Any]) -> str:
+    return " ".join(str(review.get(label) or "") for label in ("Título da Avaliação", "Comentário"))
+
+
+def _group_key(review: Dict[str, Any]) -> Tuple:
+    return tuple(review.get(label) for label in GROUP_LABELS)
+
+
+def dedupe_reviews(reviews: List[Dict[str, Any]], threshold: float = DEDUP_SIMILARITY) -> List[Tuple[Dict, int]]:
+    """
+    Remove comentários quase idênticos do mesmo produto, mantendo a ordem.
+
+    Candidatos a duplicata vêm do LSH (bandas da assinatura MinHash) e são
+    confirmados pela similaridade estimada. Fica a primeira ocorrência, com a
+    quantidade de comentários que ela representa.
+    """
+    mantidos: List[List] = []
+    assinaturas: List[Optional[np.ndarray]] = []
+    buckets: Dict[Tuple, List[int]] = {}
+    for review in reviews:
+        assinatura = minhash_signature(_review_text(review))
+        grupo = _group_key(review)
+        duplicata = None
+        chaves = []
+        if assinatura is not None:
+            comparados = set()
+            for banda in range(0, MINHASH_PERMUTATIONS, MINHASH_BAND_ROWS):
+                chave = (grupo, banda, assinatura[banda:banda + MINHASH_BAND_ROWS].tobytes())
+                chaves.append(chave)
+                for indice in buckets.get(chave, ()):
+                    if duplicata is None and indice not in comparados:
+                        comparados.add(indice)
+                        if np.mean(assinaturas[indice] == assinatura) >= threshold:
+                            duplicata = indice
+        if duplicata is not None:
+            mantidos[duplicata][1] += 1
+            continue
+        for chave in chaves:
+            buckets.setdefault(chave, []).append(len(mantidos))
+        mantidos.append([review, 1])
+        assinaturas.append(assinatura)
+    return [(review, repeticoes) for review, repeticoes in mantidos]
+
+
+def _compact(review: Dict[str, Any], repeticoes: int) -> Dict[str, Any]:
+    compacto = {label: review[label] for label in REVIEW_LABELS if review.get(label) not in (None, "")}
+    if repeticoes > 1:
+        compacto["Repetições"] = repeticoes
+    return compacto
+
+
+def _group_header(review: Dict[str, Any]) -> Dict[str, Any]:
+    cabecalho = {label: review[label] for label in GROUP_LABELS if review.get(label) not in (None, "")}
+    principal = review.get(MAIN_LABEL)
+    if principal and principal not in cabecalho.values():
+        cabecalho[MAIN_LABEL] = principal
+    return cabecalho
+
+
+class ContextPackingStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.comentarios = 0
+        self.duplicados = 0
+        self.cortados = 0
+        self.tokens_entrada = 0
+        self.tokens_saida = 0
+
+    def add(self, comentarios: int, duplicados: int, cortados: int, tokens_entrada: int, tokens_saida: int) -> None:
+        with self._lock:
+            self.comentarios += comentarios
+            self.duplicados += duplicados
+            self.cortados += cortados
+            self.tokens_entrada += tokens_entrada
+            self.tokens_saida += tokens_saida
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "comentarios": self.comentarios,
+                "duplicados_removidos": self.duplicados,
+                "cortados_pelo_orcamento": self.cortados,
+                "tokens_entrada": self.tokens_entrada,
+                "tokens_saida": self.tokens_saida,
+            }
+
+
+context_packing_stats = ContextPackingStats()
+
+
+def pack_context(itens: List[Any], token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                 chunk_tokens: Optional[int] = None, threshold: float = DEDUP_SIMILARITY) -> List[List[Dict]]:
+    """
+    Prepara comentários (dicts de format_docs ou ComentarioInput) para o prompt.
+
+    1. Remove duplicatas quase idênticas do mesmo produto (MinHash + LSH).
+    2. Ordena por prioridade estável: comentários com texto primeiro, na
+       ordem recebida (a ordem de relevância da busca).
+    3. Para ao atingir token_budget tokens estimados (sem corte com None,
+       para quem divide a entrada em blocos de chunk_tokens).
+       Os comentários cortados entram em context_packing_stats e no log.
+    4. Agrupa pelos metadados do produto, que saem uma vez por grupo:
+       [{"Produto": ..., "Marca": ..., "Avaliações": [{...}, ...]}, ...]
+
+    Devolve blocos de até chunk_tokens tokens (um só bloco sem chunk_tokens),
+    cada um uma lista de grupos, prontos para a chamada única ou para o map.
+    """
+    reviews = [_as_dict(item) for item in itens]
+    unicos = dedupe_reviews(reviews, threshold)
+    ordenados = sorted(unicos, key=lambda par: not _review_text(par[0]).strip())
+
+    blocos: List[Dict[Tuple, Dict]] = []
+    usados_bloco, usados_total, incluidos = 0, 0, 0
+    for review, repeticoes in ordenados:
+        grupo = _group_key(review)
+        compacto = _compact(review, repeticoes)
+        custo = estimate_tokens(compacto)
+        custo_grupo = 0 if blocos and grupo in blocos[-1] else estimate_tokens(_group_header(review))
+        if token_budget is not None and incluidos and usados_total + custo + custo_grupo > token_budget:
+            break
+        if not blocos or (chunk_tokens and usados_bloco and usados_bloco + custo + custo_grupo > chunk_tokens):
+            blocos.append({})
+            usados_bloco = 0
+            custo_grupo = estimate_tokens(_group_header(review))
+        bloco = blocos[-1]
+        if grupo not in bloco:
+            bloco[grupo] = {**_group_header(review), "Avaliações": []}
+        bloco[grupo]["Avaliações"].append(compacto)
+        usados_bloco += custo + custo_grupo
+        usados_total += custo + custo_grupo
+        incluidos += 1
+
+    cortados = len(unicos) - incluidos
+    if cortados:
+        print(f"pack_context: {cortados} de {len(unicos)} comentários cortados pelo orçamento de "
+              f"{token_budget} tokens", flush=True)
+    context_packing_stats.add(
+        comentarios=len(reviews),
+        duplicados=len(reviews) - len(unicos),
+        cortados=cortados,
+        tokens_entrada=sum(estimate_tokens(review) for review in reviews),
+        tokens_saida=usados_total,
+    )
+    return [list(bloco.values()) for bloco in blocos] or [[]]
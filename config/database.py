@@ -1,8 +1,16 @@
 import sqlite3
 import csv
 import os
+import re
+import uuid
+import xxhash
+from typing import Optional
 
-DB_FILE = os.path.join(os.path.dirname(__file__), "..", "reviews.db")
+# Caminho do banco de reviews (REVIEWS_DB_FILE permite apontar outro banco, ex.: nos benchmarks)
+DB_FILE = os.getenv("REVIEWS_DB_FILE", os.path.join(os.path.dirname(__file__), "..", "reviews.db"))
+
+# Linhas inseridas por transação durante a ingestão do CSV
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))
 
 
 def get_connection():
@@ -12,39 +20,278 @@ def get_connection():
     return conn, cursor
 
 
-def csv_to_sqlite(csv_filepath: str):
+def _create_ingestion_state(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_state (
+            source TEXT PRIMARY KEY,
+            file_size INTEGER NOT NULL,
+            file_mtime INTEGER NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            prefix_hash TEXT NOT NULL,
+            last_review_id INTEGER NOT NULL,
+            completed INTEGER NOT NULL
+        );
+    """)
+
+
+def _create_reviews_generation(cursor):
+    """
+    reviews_generation guarda o identificador da geração da tabela reviews,
+    trocado a cada recarga completa do CSV (quando os review_id são
+    reatribuídos). Os índices vetoriais registram em vector_index_state a
+    geração e o último review_id que cobrem.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reviews_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation TEXT NOT NULL
+        );
+    """)
+    cursor.execute("INSERT OR IGNORE INTO reviews_generation (id, generation) VALUES (1, ?);",
+                   (uuid.uuid4().hex,))
+
+
+# Tipos das colunas numéricas da tabela reviews (as demais são TEXT); valores vazios viram NULL
+REVIEW_COLUMN_TYPES = {
+    "overall_rating": "INTEGER",
+    "reviewer_birth_year": "INTEGER",
+}
+
+# Índices usados pelos filtros dos retrievers (config.database.review_filter_sql)
+REVIEW_INDEXES = {
+    "idx_reviews_product_id": '"product_id"',
+    "idx_reviews_product_brand": '"product_brand" COLLATE NOCASE',
+    "idx_reviews_category_lv1": '"site_category_lv1" COLLATE NOCASE',
+    "idx_reviews_category_lv2": '"site_category_lv2" COLLATE NOCASE',
+    "idx_reviews_rating": '"overall_rating"',
+    "idx_reviews_recommend": '"recommend_to_a_friend"',
+    "idx_reviews_submission_date": '"submission_date"',
+}
+
+# Colunas de texto indexadas no FTS5 e o peso de cada uma no bm25
+FTS_COLUMNS = ("review_title", "review_text", "product_name", "product_brand")
+FTS_WEIGHTS = (2.0, 1.0, 3.0, 2.0)
+
+
+def _table_exists(cursor, name: str) -> bool:
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (name,)).fetchone() is not None
+
+
+def _create_fts_index(cursor):
+    """
+    Índice FTS5 de conteúdo externo sobre a tabela reviews (o texto não é
+    duplicado; rowid = review_id). Acentos são ignorados na busca.
+    """
+    columns = ", ".join(FTS_COLUMNS)
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5("
+        f"{columns}, content='reviews', content_rowid='review_id', tokenize='unicode61 remove_diacritics 2');"
+    )
+
+
+def _column_definitions(header):
+    definitions = [f'"{col}" {REVIEW_COLUMN_TYPES.get(col, "TEXT")}' for col in header]
+    definitions.append("review_id INTEGER PRIMARY KEY")
+    return definitions
+
+
+def _create_review_indexes(cursor):
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(reviews);")}
+    for name, expression in REVIEW_INDEXES.items():
+        if expression.split('"')[1] in columns:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON reviews ({expression});")
+    if _table_exists(cursor, "vector_value_reviews"):
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_vector_value_reviews_review "
+                       "ON vector_value_reviews (field, review_id);")
+
+
+def _migrate_review_types(cursor):
+    """
+    Bancos carregados quando todas as colunas eram TEXT: recria a tabela
+    reviews com os tipos de REVIEW_COLUMN_TYPES, preservando os review_id,
+    e descarta o FTS5 para que seja reconstruído sobre a nova tabela.
+    """
+    info = {row[1]: row[2] for row in cursor.execute("PRAGMA table_info(reviews);")}
+    if not any(col in info and info[col] != kind for col, kind in REVIEW_COLUMN_TYPES.items()):
+        return
+    header = [col for col in info if col != "review_id"]
+    select = ", ".join(f'NULLIF("{col}", \'\')' if col in REVIEW_COLUMN_TYPES else f'"{col}"' for col in header)
+    columns = ", ".join(f'"{col}"' for col in header)
+    cursor.execute("DROP TABLE IF EXISTS reviews_fts")
+    cursor.execute("DROP TABLE IF EXISTS reviews_typed")
+    cursor.execute(f"CREATE TABLE reviews_typed ({', '.join(_column_definitions(header))});")
+    cursor.execute(f"INSERT INTO reviews_typed ({columns}, review_id) SELECT {select}, review_id FROM reviews;")
+    cursor.execute("DROP TABLE reviews")
+    cursor.execute("ALTER TABLE reviews_typed RENAME TO reviews")
+
+
+def _ensure_fts_index(cursor):
+    """Cria e popula o FTS5 em bancos carregados antes de ele existir."""
+    if _table_exists(cursor, "reviews") and not _table_exists(cursor, "reviews_fts"):
+        _create_fts_index(cursor)
+        cursor.execute("INSERT INTO reviews_fts(reviews_fts) VALUES ('rebuild');")
+
+
+def _hash_prefix(csv_filepath: str, size: int):
+    """Hash xxh3 dos primeiros `size` bytes do arquivo."""
+    hasher = xxhash.xxh3_128()
+    remaining = size
+    with open(csv_filepath, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(1 << 20, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _iter_lines(f, hasher, position: dict):
+    """
+    Entrega as linhas do arquivo binário já decodificadas para o csv.reader,
+    atualizando o hash e o offset consumido até o momento.
+    """
+    for line in f:
+        hasher.update(line)
+        position["offset"] += len(line)
+        yield line.decode("utf-8")
+
+
+def csv_to_sqlite(csv_filepath: str) -> int:
+    """
+    Ingestão incremental e retomável do CSV de reviews.
+
+    - Se o arquivo não mudou desde a última carga completa, nada é feito.
+    - Se o arquivo apenas cresceu (o conteúdo já carregado continua igual), ou
+      se uma carga anterior foi interrompida, a ingestão continua do último
+      byte confirmado, acrescentando as novas linhas por review_id.
+    - Caso contrário a tabela é recriada e, na mesma transação, são descartados
+      os dados guardados por review_id (estatísticas, enriquecimento,
+      sentimentos, tópicos e o mapeamento dos índices vetoriais), já que os
+      ids são reatribuídos; a geração em reviews_generation também muda.
+
+    As linhas são lidas em streaming e gravadas em blocos de INGEST_CHUNK_SIZE,
+    uma transação por bloco (em modo WAL), junto com o progresso da carga e
+    com as entradas do índice FTS5 (reviews_fts) das linhas do bloco.
+    Retorna a quantidade de linhas inseridas.
+    """
 
     table_name = "reviews"
 
     if not os.path.isfile(csv_filepath):
         raise FileNotFoundError(f"Arquivo CSV não encontrado: {csv_filepath}")
 
-    with open(csv_filepath, newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        try:
-            header = next(reader)
-        except StopIteration:
-            raise ValueError("O CSV está vazio.")
-
-        data = list(reader)
+    source = os.path.abspath(csv_filepath)
+    stat = os.stat(csv_filepath)
 
     conn, cursor = get_connection()
     try:
-        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-        conn.commit()
+        cursor.execute("PRAGMA journal_mode=WAL;")
+        cursor.execute("PRAGMA synchronous=NORMAL;")
+        with conn:
+            _create_ingestion_state(cursor)
+            _create_reviews_generation(cursor)
+        if _table_exists(cursor, "reviews"):
+            with conn:
+                _migrate_review_types(cursor)
+                _create_review_indexes(cursor)
+                _ensure_fts_index(cursor)
+
+        state = cursor.execute(
+            "SELECT file_size, file_mtime, byte_offset, prefix_hash, last_review_id, completed "
+            "FROM ingestion_state WHERE source = ?;",
+            (source,),
+        ).fetchone()
+
+        if state and state[5] and state[0] == stat.st_size and state[1] == stat.st_mtime_ns:
+            return 0
+
+        byte_offset, last_review_id = 0, 0
+        hasher = None
+        if state and 0 < state[2] <= stat.st_size:
+            prefix = _hash_prefix(csv_filepath, state[2])
+            if prefix.hexdigest() == state[3]:
+                byte_offset, last_review_id, hasher = state[2], state[4], prefix
+
+        if hasher is None:
+            hasher = xxhash.xxh3_128()
+
+        position = {"offset": byte_offset}
+        inserted = 0
+        with open(csv_filepath, "rb") as f:
+            f.seek(byte_offset)
+            reader = csv.reader(_iter_lines(f, hasher, position))
+
+            if byte_offset == 0:
+                try:
+                    header = next(reader)
+                except StopIteration:
+                    raise ValueError("O CSV está vazio.")
 
-        cols_quoted = [f'"{col}" TEXT' for col in header]
-        create_stmt = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(cols_quoted)});"
-        cursor.execute(create_stmt)
-        conn.commit()
+                # Uma transação só: os review_id são reatribuídos, então tudo o
+                # que é guardado por review_id cai junto e a geração muda,
+                # invalidando os índices vetoriais. O estado das
+                # estatísticas é zerado antes de limpar review_sentiment, para
+                # os gatilhos de review_stats não dispararem.
+                cursor.execute("BEGIN")
+                if _table_exists(cursor, "review_stats_state"):
+                    cursor.execute("DELETE FROM review_stats;")
+                    cursor.execute("UPDATE review_stats_state SET last_review_id = 0;")
+                for derived in ("review_enrichment", "review_topics", "review_sentiment",
+                                "vector_values", "vector_value_reviews", "vector_index_state"):
+                    if _table_exists(cursor, derived):
+                        cursor.execute(f"DELETE FROM {derived};")
+                cursor.execute("UPDATE reviews_generation SET generation = ?;", (uuid.uuid4().hex,))
+                cursor.execute("DROP TABLE IF EXISTS reviews_fts")
+                cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+                create_stmt = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(_column_definitions(header))});"
+                cursor.execute(create_stmt)
+                _create_review_indexes(cursor)
+                _create_fts_index(cursor)
+                conn.commit()
+            else:
+                header = [row[1] for row in cursor.execute(f"PRAGMA table_info({table_name});")
+                          if row[1] != "review_id"]
 
-        placeholders = ", ".join(["?"] * len(header))
-        columns = ', '.join(f'"{col}"' for col in header)
-        insert_stmt = f'INSERT INTO {table_name} ({columns}) VALUES ({placeholders});'
+            placeholders = ", ".join(["?"] * (len(header) + 1))
+            columns = ', '.join(f'"{col}"' for col in header)
+            insert_stmt = (f'INSERT OR IGNORE INTO {table_name} ({columns}, review_id) '
+                           f'VALUES ({placeholders});')
 
+            fts_columns = ", ".join(FTS_COLUMNS)
+            fts_stmt = (f"INSERT INTO reviews_fts (rowid, {fts_columns}) "
+                        f"SELECT review_id, {fts_columns} FROM {table_name} WHERE review_id BETWEEN ? AND ?;")
 
-        cursor.executemany(insert_stmt, data)
-        conn.commit()
+            def flush(chunk, completed):
+                with conn:
+                    conn.executemany(insert_stmt, chunk)
+                    if chunk:
+                        conn.execute(fts_stmt, (chunk[0][-1], chunk[-1][-1]))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO ingestion_state "
+                        "(source, file_size, file_mtime, byte_offset, prefix_hash, last_review_id, completed) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                        (source, stat.st_size, stat.st_mtime_ns, position["offset"],
+                         hasher.hexdigest(), last_review_id, int(completed)),
+                    )
+
+            typed = [i for i, col in enumerate(header) if col in REVIEW_COLUMN_TYPES]
+
+            chunk = []
+            for row in reader:
+                last_review_id += 1
+                for i in typed:
+                    if i < len(row) and row[i] == "":
+                        row[i] = None
+                chunk.append((*row, last_review_id))
+                if len(chunk) >= INGEST_CHUNK_SIZE:
+                    flush(chunk, completed=False)
+                    inserted += len(chunk)
+                    chunk = []
+            flush(chunk, completed=True)
+            inserted += len(chunk)
+
+        return inserted
 
     finally:
         cursor.close()
@@ -54,7 +301,9 @@ def csv_to_sqlite(csv_filepath: str):
 def select_distinct_all():
     conn, cursor = get_connection()
     try:
-        query = "SELECT DISTINCT * FROM reviews;"
+        columns = ", ".join(f'"{row[1]}"' for row in cursor.execute("PRAGMA table_info(reviews);")
+                            if row[1] != "review_id")
+        query = f"SELECT DISTINCT {columns} FROM reviews;"
         cursor.execute(query)
         result = cursor.fetchall()
         return result
@@ -75,3 +324,763 @@ def select_distinct_by_column(columns: str):
     finally:
         cursor.close()
         conn.close()
+
+
+REVIEW_COLUMNS = (
+    "review_id",
+    "product_id",
+    "product_name",
+    "product_brand",
+    "site_category_lv1",
+    "site_category_lv2",
+    "overall_rating",
+    "recommend_to_a_friend",
+    "review_title",
+    "review_text",
+)
+
+
+def select_reviews_generation():
+    """Retorna (geração, maior review_id) da tabela reviews."""
+    conn, cursor = get_connection()
+    try:
+        row = None
+        if _table_exists(cursor, "reviews_generation"):
+            row = cursor.execute("SELECT generation FROM reviews_generation WHERE id = 1;").fetchone()
+        last_review_id = cursor.execute("SELECT COALESCE(MAX(review_id), 0) FROM reviews;").fetchone()[0]
+        return (row[0] if row else ""), last_review_id
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_review_ids_by_value(column: str, after_review_id: int = 0, last_review_id: Optional[int] = None):
+    """
+    Retorna cada valor distinto da coluna junto com os review_id das linhas
+    que possuem esse valor: [(valor, [id, ...]), ...]. Considera só as reviews
+    com review_id em (after_review_id, last_review_id].
+    """
+    conn, cursor = get_connection()
+    try:
+        query = (f'SELECT "{column}", group_concat(review_id) FROM reviews '
+                 f'WHERE "{column}" IS NOT NULL AND "{column}" != \'\' '
+                 f'AND review_id > ? AND review_id <= ? GROUP BY "{column}";')
+        cursor.execute(query, (after_review_id, last_review_id if last_review_id is not None else 2 ** 63 - 1))
+        return [(value, [int(i) for i in ids.split(",")]) for value, ids in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_reviews_by_ids(review_ids):
+    """
+    Busca as reviews pelos review_id informados, preservando a ordem recebida.
+    Cada review é devolvida como um dicionário coluna -> valor.
+    """
+    review_ids = list(review_ids)
+    conn, cursor = get_connection()
+    try:
+        columns = ", ".join(f'"{col}"' for col in REVIEW_COLUMNS)
+        by_id = {}
+        for start in range(0, len(review_ids), 900):
+            batch = review_ids[start:start + 900]
+            placeholders = ", ".join(["?"] * len(batch))
+            cursor.execute(f"SELECT {columns} FROM reviews WHERE review_id IN ({placeholders});", batch)
+            for row in cursor.fetchall():
+                by_id[row[0]] = dict(zip(REVIEW_COLUMNS, row))
+        return [by_id[review_id] for review_id in review_ids if review_id in by_id]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _create_vector_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vector_values (
+            field TEXT NOT NULL,
+            value_id INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (field, value_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vector_value_reviews (
+            field TEXT NOT NULL,
+            value_id INTEGER NOT NULL,
+            review_id INTEGER NOT NULL
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vector_index_state (
+            field TEXT PRIMARY KEY,
+            generation TEXT NOT NULL,
+            last_review_id INTEGER NOT NULL
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vector_values_value ON vector_values (field, value);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vector_value_reviews "
+                   "ON vector_value_reviews (field, value_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vector_value_reviews_review "
+                   "ON vector_value_reviews (field, review_id);")
+
+
+def _save_vector_index_state(cursor, field: str, generation: str, last_review_id: int):
+    cursor.execute("INSERT OR REPLACE INTO vector_index_state (field, generation, last_review_id) "
+                   "VALUES (?, ?, ?);", (field, generation, last_review_id))
+
+
+def save_vector_values(field: str, values, generation: str, last_review_id: int):
+    """
+    Grava o mapeamento do índice vetorial do campo: value_id -> valor e
+    value_id -> review_id. `values` é a lista [(valor, [review_id, ...]), ...]
+    na ordem dos value_id. Registra junto a geração da tabela reviews e o
+    último review_id cobertos pelo índice.
+    """
+    conn, cursor = get_connection()
+    try:
+        with conn:
+            _create_vector_tables(cursor)
+            cursor.execute("DELETE FROM vector_values WHERE field = ?;", (field,))
+            cursor.execute("DELETE FROM vector_value_reviews WHERE field = ?;", (field,))
+            cursor.executemany(
+                "INSERT INTO vector_values (field, value_id, value) VALUES (?, ?, ?);",
+                ((field, value_id, value) for value_id, (value, _) in enumerate(values)),
+            )
+            cursor.executemany(
+                "INSERT INTO vector_value_reviews (field, value_id, review_id) VALUES (?, ?, ?);",
+                ((field, value_id, review_id)
+                 for value_id, (_, review_ids) in enumerate(values) for review_id in review_ids),
+            )
+            _save_vector_index_state(cursor, field, generation, last_review_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def append_vector_values(field: str, values, generation: str, last_review_id: int):
+    """
+    Acrescenta ao mapeamento do campo as reviews de uma carga incremental.
+    `values` é [(value_id, valor, [review_id, ...]), ...]: os valores já
+    mapeados só ganham as novas reviews; os novos entram com o value_id
+    informado (a sua posição no índice).
+    """
+    conn, cursor = get_connection()
+    try:
+        with conn:
+            _create_vector_tables(cursor)
+            cursor.executemany(
+                "INSERT OR IGNORE INTO vector_values (field, value_id, value) VALUES (?, ?, ?);",
+                ((field, value_id, value) for value_id, value, _ in values),
+            )
+            cursor.executemany(
+                "INSERT INTO vector_value_reviews (field, value_id, review_id) VALUES (?, ?, ?);",
+                ((field, value_id, review_id) for value_id, _, review_ids in values for review_id in review_ids),
+            )
+            _save_vector_index_state(cursor, field, generation, last_review_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_vector_index_state(field: str):
+    """Retorna (geração, último review_id) cobertos pelo índice do campo, ou None."""
+    conn, cursor = get_connection()
+    try:
+        if not _table_exists(cursor, "vector_index_state"):
+            return None
+        return cursor.execute("SELECT generation, last_review_id FROM vector_index_state WHERE field = ?;",
+                              (field,)).fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_value_ids_by_value(field: str, values):
+    """Retorna {valor: value_id} dos valores já presentes no índice do campo."""
+    values = list(values)
+    conn, cursor = get_connection()
+    try:
+        by_value = {}
+        for start in range(0, len(values), 900):
+            batch = values[start:start + 900]
+            placeholders = ", ".join(["?"] * len(batch))
+            cursor.execute(
+                f"SELECT value, value_id FROM vector_values WHERE field = ? AND value IN ({placeholders});",
+                (field, *batch),
+            )
+            by_value.update(cursor.fetchall())
+        return by_value
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def count_vector_values(field: str) -> int:
+    conn, cursor = get_connection()
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'vector_values';")
+        if cursor.fetchone() is None:
+            return 0
+        cursor.execute("SELECT COUNT(*) FROM vector_values WHERE field = ?;", (field,))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def review_filter_sql(filtro, alias: str = "reviews"):
+    """
+    Condição WHERE (sem a palavra WHERE) e parâmetros para um FiltroReviews.
+    Devolve ("", []) quando não há filtro. Todas as condições usam os índices
+    de REVIEW_INDEXES.
+    """
+    if filtro is None:
+        return "", []
+    conditions, params = [], []
+    if filtro.product_id is not None:
+        conditions.append(f'{alias}."product_id" = ?')
+        params.append(filtro.product_id)
+    for column in ("product_brand", "site_category_lv1", "site_category_lv2"):
+        value = getattr(filtro, column)
+        if value is not None:
+            conditions.append(f'{alias}."{column}" = ? COLLATE NOCASE')
+            params.append(value)
+    if filtro.min_rating is not None:
+        conditions.append(f'{alias}."overall_rating" >= ?')
+        params.append(filtro.min_rating)
+    if filtro.max_rating is not None:
+        conditions.append(f'{alias}."overall_rating" <= ?')
+        params.append(filtro.max_rating)
+    if filtro.recommend_to_a_friend is not None:
+        conditions.append(f'{alias}."recommend_to_a_friend" = ?')
+        params.append(filtro.recommend_to_a_friend)
+    if filtro.submitted_after is not None:
+        conditions.append(f'{alias}."submission_date" >= ?')
+        params.append(filtro.submitted_after.isoformat())
+    if filtro.submitted_before is not None:
+        conditions.append(f'{alias}."submission_date" < date(?, \'+1 day\')')
+        params.append(filtro.submitted_before.isoformat())
+    return " AND ".join(conditions), params
+
+
+def select_value_ids_by_filter(field: str, filtro):
+    """value_id do índice vetorial do campo que possuem ao menos uma review dentro do filtro."""
+    where, params = review_filter_sql(filtro, alias="r")
+    conn, cursor = get_connection()
+    try:
+        cursor.execute(
+            f"SELECT DISTINCT v.value_id FROM reviews r "
+            f"JOIN vector_value_reviews v ON v.field = ? AND v.review_id = r.review_id "
+            f"WHERE {where or '1'};",
+            (field, *params),
+        )
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_reviews_by_value_ids(field: str, value_ids, filtro=None):
+    """
+    Expande os value_id do índice vetorial para as suas reviews (só as que
+    passam no filtro, quando informado).
+    Retorna {value_id: (valor, [review_id, ...])}.
+    """
+    value_ids = list(value_ids)
+    where, where_params = review_filter_sql(filtro, alias="r")
+    conn, cursor = get_connection()
+    try:
+        result = {}
+        for start in range(0, len(value_ids), 900):
+            batch = value_ids[start:start + 900]
+            placeholders = ", ".join(["?"] * len(batch))
+            cursor.execute(
+                f"SELECT value_id, value FROM vector_values WHERE field = ? AND value_id IN ({placeholders});",
+                (field, *batch),
+            )
+            for value_id, value in cursor.fetchall():
+                result[value_id] = (value, [])
+            cursor.execute(
+                f"SELECT v.value_id, v.review_id FROM vector_value_reviews v "
+                f"JOIN reviews r ON r.review_id = v.review_id "
+                f"WHERE v.field = ? AND v.value_id IN ({placeholders}) AND {where or '1'} ORDER BY v.review_id;",
+                (field, *batch, *where_params),
+            )
+            for value_id, review_id in cursor.fetchall():
+                result[value_id][1].append(review_id)
+        return result
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_vector_values(field: str):
+    """Valores do índice vetorial do campo, na ordem dos value_id."""
+    conn, cursor = get_connection()
+    try:
+        cursor.execute("SELECT value FROM vector_values WHERE field = ? ORDER BY value_id;", (field,))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def fts_match_expression(query: str, exact: bool = False) -> str:
+    """
+    Converte o texto do usuário em uma expressão MATCH segura: cada termo vira
+    uma string entre aspas e os termos são combinados com OR, deixando o bm25
+    ordenar as reviews que contêm mais termos (e os mais raros) primeiro.
+    Com exact=True (identificadores e frases entre aspas) a consulta inteira,
+    sem as aspas externas, vira uma única frase FTS5: os termos precisam
+    aparecer todos, juntos e na ordem.
+    """
+    if exact:
+        phrase = query.strip()
+        if len(phrase) > 1 and phrase[0] == phrase[-1] == '"':
+            phrase = phrase[1:-1]
+        return '"' + phrase.replace('"', '""') + '"' if re.search(r"\w", phrase) else ""
+    terms = re.findall(r"\w+", query)
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def search_fts(query: str, limit: int, filtro=None, exact: bool = False):
+    """
+    Busca lexical (FTS5/bm25) nas reviews, opcionalmente restrita a um
+    FiltroReviews: [(review_id, score), ...], do mais relevante ao menos.
+    exact=True busca a consulta como frase (fts_match_expression).
+    """
+    expression = fts_match_expression(query, exact)
+    if not expression:
+        return []
+    where, where_params = review_filter_sql(filtro, alias="r")
+    conn, cursor = get_connection()
+    try:
+        weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+        join = "JOIN reviews r ON r.review_id = reviews_fts.rowid " if where else ""
+        cursor.execute(
+            f"SELECT reviews_fts.rowid, bm25(reviews_fts, {weights}) AS score FROM reviews_fts {join}"
+            f"WHERE reviews_fts MATCH ? {'AND ' + where if where else ''} ORDER BY score LIMIT ?;",
+            (expression, *where_params, limit),
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def create_enrichment_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_enrichment (
+            review_id INTEGER PRIMARY KEY,
+            model TEXT NOT NULL,
+            enriched_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_sentiment (
+            review_id INTEGER PRIMARY KEY,
+            sentimento TEXT NOT NULL,
+            positivos TEXT,
+            negativos TEXT,
+            neutros TEXT
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_topics (
+            review_id INTEGER NOT NULL,
+            topic TEXT NOT NULL
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_topics_review_id ON review_topics (review_id);")
+    # Rótulos de comentários que não correspondem a uma review do banco, pelo hash do conteúdo;
+    # ficam fora de review_sentiment, e portanto de review_stats
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sentiment_label_cache (
+            content_hash TEXT PRIMARY KEY,
+            sentimento TEXT NOT NULL
+        );
+    """)
+
+
+def select_pending_enrichment(after_review_id: int, limit: int):
+    """Próximas reviews (review_id > after_review_id) que ainda não foram enriquecidas."""
+    conn, cursor = get_connection()
+    try:
+        create_enrichment_tables(cursor)
+        columns = ", ".join(f'r."{col}"' for col in REVIEW_COLUMNS)
+        cursor.execute(
+            f"SELECT {columns} FROM reviews r "
+            f"WHERE r.review_id > ? AND NOT EXISTS "
+            f"(SELECT 1 FROM review_enrichment e WHERE e.review_id = r.review_id) "
+            f"ORDER BY r.review_id LIMIT ?;",
+            (after_review_id, limit),
+        )
+        return [dict(zip(REVIEW_COLUMNS, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def save_enrichment(model: str, results):
+    """
+    Grava, em uma única transação, o sentimento e os tópicos de um bloco de
+    reviews. `results` é uma lista de (review_id, sentimento, {Positivos, Negativos,
+    Neutros}, [tópicos]). As reviews gravadas ficam marcadas como enriquecidas.
+    """
+    conn, cursor = get_connection()
+    try:
+        with conn:
+            create_enrichment_tables(cursor)
+            for review_id, sentimento, percentuais, topicos in results:
+                # upsert (e não REPLACE) para que os gatilhos de review_stats vejam a troca de rótulo
+                cursor.execute(
+                    "INSERT INTO review_sentiment "
+                    "(review_id, sentimento, positivos, negativos, neutros) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (review_id) DO UPDATE SET sentimento = excluded.sentimento, "
+                    "positivos = excluded.positivos, negativos = excluded.negativos, neutros = excluded.neutros;",
+                    (review_id, sentimento, percentuais.get("Positivos"),
+                     percentuais.get("Negativos"), percentuais.get("Neutros")),
+                )
+                cursor.execute("DELETE FROM review_topics WHERE review_id = ?;", (review_id,))
+                cursor.executemany("INSERT INTO review_topics (review_id, topic) VALUES (?, ?);",
+                                   [(review_id, topic) for topic in topicos])
+                cursor.execute("INSERT OR REPLACE INTO review_enrichment (review_id, model) VALUES (?, ?);",
+                               (review_id, model))
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_enrichment(review_ids):
+    """
+    Resultados já gravados pelo job de enriquecimento:
+    {review_id: {"sentimento", "percentuais", "topicos"}} apenas para as reviews enriquecidas.
+    """
+    review_ids = list(review_ids)
+    conn, cursor = get_connection()
+    try:
+        create_enrichment_tables(cursor)
+        result = {}
+        for start in range(0, len(review_ids), 900):
+            batch = review_ids[start:start + 900]
+            placeholders = ", ".join(["?"] * len(batch))
+            cursor.execute(
+                f"SELECT s.review_id, s.sentimento, s.positivos, s.negativos, s.neutros "
+                f"FROM review_sentiment s JOIN review_enrichment e ON e.review_id = s.review_id "
+                f"WHERE s.review_id IN ({placeholders});",
+                batch,
+            )
+            for review_id, sentimento, positivos, negativos, neutros in cursor.fetchall():
+                result[review_id] = {
+                    "sentimento": sentimento,
+                    "percentuais": {"Positivos": positivos, "Negativos": negativos, "Neutros": neutros},
+                    "topicos": [],
+                }
+            cursor.execute(f"SELECT review_id, topic FROM review_topics WHERE review_id IN ({placeholders});", batch)
+            for review_id, topic in cursor.fetchall():
+                if review_id in result:
+                    result[review_id]["topicos"].append(topic)
+        return result
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_matching_review_ids(reviews):
+    """
+    Dos pares [(review_id, texto), ...] enviados aos endpoints, retorna o
+    conjunto de review_id cujo texto é o review_text da review no banco. Só
+    esses podem usar ou gravar dados guardados por review_id.
+    """
+    texts = dict(reviews)
+    review_ids = list(texts)
+    conn, cursor = get_connection()
+    try:
+        matching = set()
+        for start in range(0, len(review_ids), 900):
+            batch = review_ids[start:start + 900]
+            placeholders = ", ".join(["?"] * len(batch))
+            cursor.execute(f"SELECT review_id, review_text FROM reviews WHERE review_id IN ({placeholders});", batch)
+            matching.update(review_id for review_id, text in cursor.fetchall() if text == texts[review_id])
+        return matching
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def select_sentiment_labels(keys):
+    """
+    Rótulos de sentimento já conhecidos (job de enriquecimento ou
+    classificações anteriores). Chaves inteiras são review_id, procurados em
+    review_sentiment; chaves de texto são hashes de conteúdo, procurados em
+    sentiment_label_cache.
+    """
+    keys = list(keys)
+    conn, cursor = get_connection()
+    try:
+        create_enrichment_tables(cursor)
+        result = {}
+        review_ids = [key for key in keys if isinstance(key, int)]
+        hashes = [key for key in keys if isinstance(key, str)]
+        for table, column, values in (("review_sentiment", "review_id", review_ids),
+                                      ("sentiment_label_cache", "content_hash", hashes)):
+            for start in range(0, len(values), 900):
+                batch = values[start:start + 900]
+                placeholders = ", ".join(["?"] * len(batch))
+                cursor.execute(f"SELECT {column}, sentimento FROM {table} WHERE {column} IN ({placeholders});", batch)
+                result.update(cursor.fetchall())
+        return result
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def save_sentiment_labels(labels):
+    """
+    Guarda os rótulos [(chave, sentimento), ...] classificados pelos
+    endpoints: por review_id em review_sentiment (e daí em review_stats) ou
+    por hash de conteúdo em sentiment_label_cache.
+    """
+    conn, cursor = get_connection()
+    try:
+        with conn:
+            create_enrichment_tables(cursor)
+            cursor.executemany("INSERT OR IGNORE INTO review_sentiment (review_id, sentimento) VALUES (?, ?);",
+                               [label for label in labels if isinstance(label[0], int)])
+            cursor.executemany("INSERT OR IGNORE INTO sentiment_label_cache (content_hash, sentimento) "
+                               "VALUES (?, ?);", [label for label in labels if isinstance(label[0], str)])
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# Agrupamentos materializados em review_stats
+STATS_DIMENSIONS = ("product_id", "product_name", "product_brand", "site_category_lv1", "site_category_lv2")
+
+# Colunas de contagem de review_stats; todas são somas, então a atualização incremental só acrescenta
+STATS_COUNTERS = ("total", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5", "rating_sum",
+                  "recommend_yes", "recommend_no", "positivos", "negativos", "neutros")
+
+
+def _stats_dimensions_of(review_id_expr: str) -> str:
+    """SELECT com os pares (dimensão, valor) de uma review, para os gatilhos de sentimento."""
+    return " UNION ALL ".join(
+        f"SELECT '{dimension}', \"{dimension}\" FROM reviews WHERE review_id = {review_id_expr}"
+        for dimension in STATS_DIMENSIONS
+    )
+
+
+def _sentiment_delta(row: str, sign: str) -> str:
+    return ", ".join(
+        f"{column} = {column} {sign} ({row}.sentimento = '{label}')"
+        for column, label in (("positivos", "POSITIVO"), ("negativos", "NEGATIVO"), ("neutros", "NEUTRO"))
+    )
+
+
+def create_stats_tables(cursor):
+    """
+    review_stats: contagens por produto, marca e categorias (histograma de
+    notas, recomendação e, para as reviews enriquecidas, sentimento).
+    review_stats_state guarda até qual review_id as contagens já incluem e
+    com quais dimensões (STATS_DIMENSIONS) foram feitas. Os valores são
+    agrupados sem diferenciar maiúsculas (value é COLLATE NOCASE), como nos
+    filtros e na consulta de select_review_stats; uma review_stats antiga,
+    sem essa collation, é descartada e refeita.
+    Os gatilhos em review_sentiment mantêm os contadores de sentimento
+    atualizados quando o job de enriquecimento (ou o classificador) grava rótulos.
+    """
+    create_enrichment_tables(cursor)
+    counters = ", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in STATS_COUNTERS)
+    existing = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'review_stats';").fetchone()
+    if existing and "COLLATE NOCASE" not in existing[0]:
+        cursor.execute("DROP TABLE review_stats;")
+        if _table_exists(cursor, "review_stats_state"):
+            cursor.execute("UPDATE review_stats_state SET last_review_id = 0;")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS review_stats (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL COLLATE NOCASE,
+            label TEXT,
+            {counters},
+            PRIMARY KEY (dimension, value)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_stats_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_review_id INTEGER NOT NULL
+        );
+    """)
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(review_stats_state);")]
+    if "dimensions" not in columns:
+        cursor.execute("ALTER TABLE review_stats_state ADD COLUMN dimensions TEXT NOT NULL DEFAULT '';")
+    cursor.execute("INSERT OR IGNORE INTO review_stats_state (id, last_review_id, dimensions) VALUES (1, 0, ?);",
+                   (",".join(STATS_DIMENSIONS),))
+
+    aggregated = "(SELECT last_review_id FROM review_stats_state WHERE id = 1)"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS review_stats_sentiment_insert AFTER INSERT ON review_sentiment
+        WHEN NEW.review_id <= {aggregated}
+        BEGIN
+            UPDATE review_stats SET {_sentiment_delta("NEW", "+")}
+            WHERE (dimension, value) IN ({_stats_dimensions_of("NEW.review_id")});
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS review_stats_sentiment_update AFTER UPDATE OF sentimento ON review_sentiment
+        WHEN NEW.review_id <= {aggregated}
+        BEGIN
+            UPDATE review_stats SET {_sentiment_delta("OLD", "-")}
+            WHERE (dimension, value) IN ({_stats_dimensions_of("OLD.review_id")});
+            UPDATE review_stats SET {_sentiment_delta("NEW", "+")}
+            WHERE (dimension, value) IN ({_stats_dimensions_of("NEW.review_id")});
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS review_stats_sentiment_delete AFTER DELETE ON review_sentiment
+        WHEN OLD.review_id <= {aggregated}
+        BEGIN
+            UPDATE review_stats SET {_sentiment_delta("OLD", "-")}
+            WHERE (dimension, value) IN ({_stats_dimensions_of("OLD.review_id")});
+        END;
+    """)
+
+
+def refresh_review_stats() -> int:
+    """
+    Acrescenta a review_stats as reviews com review_id acima da última
+    agregação (todas, na primeira vez), em uma única transação. Quando o CSV
+    é recarregado do zero, csv_to_sqlite zera as estatísticas e elas são
+    refeitas aqui; o mesmo acontece quando STATS_DIMENSIONS muda (os gatilhos
+    de sentimento são recriados com as novas dimensões). Retorna quantas
+    reviews foram agregadas.
+    """
+    dimensions = ",".join(STATS_DIMENSIONS)
+    conn, cursor = get_connection()
+    try:
+        with conn:
+            create_stats_tables(cursor)
+            last, stored_dimensions = cursor.execute(
+                "SELECT last_review_id, dimensions FROM review_stats_state WHERE id = 1;").fetchone()
+            if stored_dimensions != dimensions:
+                for trigger in ("insert", "update", "delete"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS review_stats_sentiment_{trigger};")
+                cursor.execute("UPDATE review_stats_state SET last_review_id = 0, dimensions = ? WHERE id = 1;",
+                               (dimensions,))
+                create_stats_tables(cursor)
+                cursor.execute("DELETE FROM review_stats;")
+                last = 0
+            max_id = cursor.execute("SELECT MAX(review_id) FROM reviews;").fetchone()[0]
+            if max_id is None or max_id < last:
+                # tabela esvaziada desde a última agregação: recomeça do zero
+                cursor.execute("DELETE FROM review_stats;")
+                last = 0
+            if max_id is None or max_id == last:
+                cursor.execute("UPDATE review_stats_state SET last_review_id = ? WHERE id = 1;", (last,))
+                return 0
+
+            for dimension in STATS_DIMENSIONS:
+                label = '"product_name"' if dimension == "product_id" else f'"{dimension}"'
+                cursor.execute(f"""
+                    INSERT INTO review_stats (dimension, value, label, {", ".join(STATS_COUNTERS)})
+                    SELECT '{dimension}', r."{dimension}", MAX(r.{label}),
+                           COUNT(*),
+                           COUNT(*) FILTER (WHERE r.overall_rating = 1), COUNT(*) FILTER (WHERE r.overall_rating = 2),
+                           COUNT(*) FILTER (WHERE r.overall_rating = 3), COUNT(*) FILTER (WHERE r.overall_rating = 4),
+                           COUNT(*) FILTER (WHERE r.overall_rating = 5), CAST(TOTAL(r.overall_rating) AS INTEGER),
+                           COUNT(*) FILTER (WHERE r.recommend_to_a_friend = 'Yes'),
+                           COUNT(*) FILTER (WHERE r.recommend_to_a_friend = 'No'),
+                           COUNT(*) FILTER (WHERE s.sentimento = 'POSITIVO'),
+                           COUNT(*) FILTER (WHERE s.sentimento = 'NEGATIVO'),
+                           COUNT(*) FILTER (WHERE s.sentimento = 'NEUTRO')
+                    FROM reviews r LEFT JOIN review_sentiment s ON s.review_id = r.review_id
+                    WHERE r.review_id > ? AND r."{dimension}" IS NOT NULL AND r."{dimension}" != ''
+                    GROUP BY r."{dimension}" COLLATE NOCASE
+                    ON CONFLICT (dimension, value) DO UPDATE SET
+                        label = COALESCE(excluded.label, label),
+                        {", ".join(f"{column} = {column} + excluded.{column}" for column in STATS_COUNTERS)};
+                """, (last,))
+            count = cursor.execute("SELECT COUNT(*) FROM reviews WHERE review_id > ?;", (last,)).fetchone()[0]
+            cursor.execute("UPDATE review_stats_state SET last_review_id = ? WHERE id = 1;", (max_id,))
+            return count
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _stats_row_to_dict(row) -> dict:
+    dimension, value, label, *counters = row
+    c = dict(zip(STATS_COUNTERS, counters))
+    avaliadas = sum(c[f"rating_{nota}"] for nota in range(1, 6))
+    recomendacoes = c["recommend_yes"] + c["recommend_no"]
+    classificadas = c["positivos"] + c["negativos"] + c["neutros"]
+    return {
+        "dimensao": dimension,
+        "valor": value,
+        "nome": label,
+        "total_reviews": c["total"],
+        "nota_media": round(c["rating_sum"] / avaliadas, 2) if avaliadas else None,
+        "histograma_notas": {str(nota): c[f"rating_{nota}"] for nota in range(1, 6)},
+        "recomendariam": {
+            "sim": c["recommend_yes"],
+            "nao": c["recommend_no"],
+            "taxa": round(c["recommend_yes"] / recomendacoes, 4) if recomendacoes else None,
+        },
+        "sentimentos": {
+            "classificadas": classificadas,
+            "POSITIVO": round(c["positivos"] / classificadas, 4) if classificadas else None,
+            "NEGATIVO": round(c["negativos"] / classificadas, 4) if classificadas else None,
+            "NEUTRO": round(c["neutros"] / classificadas, 4) if classificadas else None,
+        },
+    }
+
+
+def select_review_stats(dimension: str, value: str):
+    """Estatísticas materializadas de um produto, marca ou categoria (sem diferenciar maiúsculas), ou None."""
+    if dimension not in STATS_DIMENSIONS:
+        raise ValueError(f"Dimensão inválida: {dimension}. Use uma de {STATS_DIMENSIONS}")
+    conn, cursor = get_connection()
+    try:
+        if not _table_exists(cursor, "review_stats"):
+            return None
+        cursor.execute(
+            f"SELECT dimension, value, label, {', '.join(STATS_COUNTERS)} FROM review_stats "
+            f"WHERE dimension = ? AND value = ? COLLATE NOCASE ORDER BY total DESC LIMIT 1;",
+            (dimension, value),
+        )
+        row = cursor.fetchone()
+        return _stats_row_to_dict(row) if row else None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+_NOTA_MEDIA = "CAST(rating_sum AS REAL) / NULLIF(rating_1 + rating_2 + rating_3 + rating_4 + rating_5, 0)"
+STATS_ORDERINGS = {
+    "total": "total DESC",
+    "nota_media": f"{_NOTA_MEDIA} DESC",
+    "pior_nota": f"{_NOTA_MEDIA} ASC",
+    "recomendacao": "CAST(recommend_yes AS REAL) / NULLIF(recommend_yes + recommend_no, 0) DESC",
+}
+
+
+def select_top_review_stats(dimension: str, order_by: str = "total", limit: int = 20, min_reviews: int = 1):
+    """Ranking dos valores de uma dimensão pelas estatísticas materializadas."""
+    if dimension not in STATS_DIMENSIONS:
+        raise ValueError(f"Dimensão inválida: {dimension}. Use uma de {STATS_DIMENSIONS}")
+    if order_by not in STATS_ORDERINGS:
+        raise ValueError(f"Ordenação inválida: {order_by}. Use uma de {tuple(STATS_ORDERINGS)}")
+    conn, cursor = get_connection()
+    try:
+        if not _table_exists(cursor, "review_stats"):
+            return []
+        cursor.execute(
+            f"SELECT dimension, value, label, {', '.join(STATS_COUNTERS)} FROM review_stats "
+            f"WHERE dimension = ? AND total >= ? ORDER BY {STATS_ORDERINGS[order_by]} LIMIT ?;",
+            (dimension, min_reviews, limit),
+        )
+        return [_stats_row_to_dict(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+import xxhash
+from langchain_core.embeddings import Embeddings
+
+from config.concurrency import run_blocking
+
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE",
+                                 os.path.join(os.path.dirname(__file__), "..", "embeddings_cache.db"))
+
+# Quantidade máxima de vetores mantidos no LRU em memória
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "50000"))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Cache de embeddings endereçado por conteúdo.
+
+    A chave é o hash xxh3 de "modelo + texto". Os vetores ficam persistidos em
+    um SQLite próprio e os mais usados também em um LRU limitado em memória,
+    então reconstruções de índice e consultas repetidas não chamam o Ollama.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str,
+                 cache_file: str = EMBEDDING_CACHE_FILE,
+                 max_memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL);")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return xxhash.xxh3_128_hexdigest(f"{self.model_name}\0{text}")
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+            for start in range(0, len(missing), 900):
+                batch = missing[start:start + 900]
+                placeholders = ", ".join(["?"] * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders});", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?);",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()],
+                )
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+
+    def _pending(self, texts: List[str]):
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(keys)))
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                pending.setdefault(key, text)
+        return keys, found, pending
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, pending = self._pending(texts)
+        if pending:
+            computed = dict(zip(pending, self.embeddings.embed_documents(list(pending.values()))))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, pending = self._pending([text])
+        if pending:
+            found[keys[0]] = self.embeddings.embed_query(text)
+            self._store({keys[0]: found[keys[0]]})
+        return found[keys[0]]
+
+    # Nas versões async, a leitura e a escrita no SQLite do cache rodam no executor limitado
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, pending = await run_blocking(self._pending, texts)
+        if pending:
+            computed = dict(zip(pending, await self.embeddings.aembed_documents(list(pending.values()))))
+            await run_blocking(self._store, computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, pending = await run_blocking(self._pending, [text])
+        if pending:
+            found[keys[0]] = await self.embeddings.aembed_query(text)
+            await run_blocking(self._store, {keys[0]: found[keys[0]]})
+        return found[keys[0]]
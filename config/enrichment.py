@@ -0,0 +1,88 @@
+"""
+Job offline de enriquecimento da tabela reviews.
+
+Percorre as reviews ainda não enriquecidas em blocos, roda o classificador
+de sentimento e a cadeia de tópicos com paralelismo limitado e grava os resultados em
+review_sentiment / review_topics. Cada bloco é gravado em uma transação e
+marcado em review_enrichment, então o job pode ser interrompido e retomado:
+
+    python -m config.enrichment --model mistral --chunk-size 64 --max-concurrency 4
+"""
+import argparse
+import asyncio
+from typing import Dict, List, Optional
+
+from config.agents import get_agent_classificador_sentimento, get_agent_gerador_topicos
+from config.concurrency import LLM_MAX_CONCURRENCY, run_blocking
+from config.database import save_enrichment, select_pending_enrichment
+from config.model import load_model
+from config.sentiment import aggregate_sentiments
+from models.comentario_input import ComentarioInput
+
+
+def review_to_comentario(review: Dict) -> ComentarioInput:
+    """Converte uma linha da tabela reviews no mesmo formato recebido pelos endpoints."""
+    return ComentarioInput(**{
+        "Categoria Principal": review["site_category_lv1"],
+        "Produto": review["product_name"],
+        "Categoria": review["site_category_lv1"],
+        "Subcategoria": review["site_category_lv2"],
+        "Título da Avaliação": review["review_title"],
+        "Avaliação Geral": review["overall_rating"],
+        "Recomendaria a um amigo": review["recommend_to_a_friend"],
+        "Comentário": review["review_text"],
+        "Id": str(review["review_id"]),
+    })
+
+
+async def enrich_reviews(model_name: str = "mistral", chunk_size: int = 64,
+                         max_concurrency: int = LLM_MAX_CONCURRENCY, limit: Optional[int] = None) -> int:
+    """
+    Enriquece as reviews pendentes e devolve quantas foram gravadas. Reviews
+    cuja chamada ao modelo falhou não são marcadas e ficam para a próxima execução.
+    """
+    model = load_model(model_name)
+    agent_sentimentos = get_agent_classificador_sentimento(model)
+    agent_topicos = get_agent_gerador_topicos(model)
+    config = {"max_concurrency": max_concurrency}
+
+    enriched, after_review_id = 0, 0
+    while limit is None or enriched < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - enriched)
+        reviews = await run_blocking(select_pending_enrichment, after_review_id, size)
+        if not reviews:
+            break
+        after_review_id = reviews[-1]["review_id"]
+
+        inputs = [{"query": review_to_comentario(review)} for review in reviews]
+        sentimentos, topicos = await asyncio.gather(
+            agent_sentimentos.abatch(inputs, config=config, return_exceptions=True),
+            agent_topicos.abatch(inputs, config=config, return_exceptions=True),
+        )
+
+        results: List = []
+        for review, sentimento, topico in zip(reviews, sentimentos, topicos):
+            if isinstance(sentimento, Exception) or isinstance(topico, Exception):
+                continue
+            results.append((review["review_id"], sentimento.sentimento,
+                            aggregate_sentiments([sentimento.sentimento]).model_dump(), topico.extracted_topics))
+        await run_blocking(save_enrichment, model_name, results)
+        enriched += len(results)
+        print(f"{enriched} reviews enriquecidas (até review_id {after_review_id})", flush=True)
+
+    return enriched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--max-concurrency", type=int, default=LLM_MAX_CONCURRENCY)
+    parser.add_argument("--limit", type=int, default=None, help="máximo de reviews nesta execução")
+    args = parser.parse_args()
+
+    asyncio.run(enrich_reviews(args.model, args.chunk_size, args.max_concurrency, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import re
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config.concurrency import BLOCKING_EXECUTOR, BLOCKING_MAX_WORKERS, run_blocking
+from config.database import search_fts, select_reviews_by_ids
+from config.vectorstore import MultiFieldVectorStore
+from models.filtro_reviews import FiltroReviews
+
+# Constante k do Reciprocal Rank Fusion: score = soma de 1 / (k + posição)
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Candidatos buscados em cada lista antes da fusão, como múltiplo de top_k
+HYBRID_CANDIDATES_FACTOR = int(os.getenv("HYBRID_CANDIDATES_FACTOR", "4"))
+# Tempo máximo (s) esperando a busca vetorial; depois disso fica só o resultado lexical
+HYBRID_VECTOR_TIMEOUT = float(os.getenv("HYBRID_VECTOR_TIMEOUT", "1.5"))
+# Buscas vetoriais síncronas em andamento no executor, contando as abandonadas por timeout;
+# sem vaga, a consulta fica só lexical em vez de enfileirar mais trabalho nas threads bloqueantes
+HYBRID_MAX_PENDING_VECTOR = int(os.getenv("HYBRID_MAX_PENDING_VECTOR", str(max(1, BLOCKING_MAX_WORKERS // 2))))
+
+_VECTOR_SLOTS = threading.BoundedSemaphore(HYBRID_MAX_PENDING_VECTOR)
+
+# Identificador exato (código de modelo, SKU, EAN): um único termo com dígitos, ou texto entre aspas
+_IDENTIFICADOR = re.compile(r'^(?=[\w./-]*\d)[\w./-]{3,}$|^".+"$')
+
+
+def is_exact_identifier(query: str) -> bool:
+    return bool(_IDENTIFICADOR.match(query.strip()))
+
+
+def rrf_fuse(rankings: Iterable[List[int]], k: int = HYBRID_RRF_K) -> List[int]:
+    """Reciprocal Rank Fusion: une listas ordenadas de review_id pela soma de 1 / (k + posição)."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for posicao, review_id in enumerate(ranking, 1):
+            scores[review_id] = scores.get(review_id, 0.0) + 1.0 / (k + posicao)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hibridas = 0
+        self.lexicas_identificador = 0
+        self.lexicas_timeout = 0
+        self.lexicas_erro = 0
+        self.lexicas_saturado = 0
+
+    def count(self, caminho: str) -> None:
+        with self._lock:
+            setattr(self, caminho, getattr(self, caminho) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hibridas": self.hibridas,
+                "lexicas_identificador": self.lexicas_identificador,
+                "lexicas_timeout": self.lexicas_timeout,
+                "lexicas_erro": self.lexicas_erro,
+                "lexicas_saturado": self.lexicas_saturado,
+            }
+
+
+hybrid_stats = HybridStats()
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Busca híbrida: bm25 do FTS5 sobre título, texto, produto e marca das
+    reviews + busca vetorial no índice FAISS de `field`, fundidas por RRF.
+
+    Caminho só lexical (sem embedding) quando a consulta é um identificador
+    exato (ex.: código de modelo), buscado como frase, ou quando a busca
+    vetorial falha, não responde em vector_timeout segundos ou (no caminho
+    síncrono) já há HYBRID_MAX_PENDING_VECTOR buscas vetoriais no executor.
+    """
+
+    store: MultiFieldVectorStore
+    field: str = "product_name"
+    top_k: int = 10
+    vector_timeout: float = HYBRID_VECTOR_TIMEOUT
+    filtro: Optional[FiltroReviews] = None
+
+    @property
+    def candidates(self) -> int:
+        return self.top_k * HYBRID_CANDIDATES_FACTOR
+
+    def _fuse(self, lexical: List[Tuple[int, float]], vector: List[Tuple[int, str]]) -> List[int]:
+        ranking_lexical = [review_id for review_id, _ in lexical]
+        ranking_vetorial = list(dict.fromkeys(review_id for review_id, _ in vector))
+        return rrf_fuse([ranking_lexical, ranking_vetorial])[:self.top_k]
+
+    def _submit_vector(self, query: str) -> Optional[Future]:
+        """
+        Agenda a busca vetorial no executor se houver vaga. A vaga só é liberada
+        quando a busca termina, então buscas abandonadas por timeout continuam
+        contando e não acumulam threads presas no executor.
+        """
+        if not _VECTOR_SLOTS.acquire(blocking=False):
+            return None
+        try:
+            vetorial = BLOCKING_EXECUTOR.submit(self.store.search_reviews, self.field, query, self.candidates,
+                                                self.filtro)
+        except BaseException:
+            _VECTOR_SLOTS.release()
+            raise
+        vetorial.add_done_callback(lambda _: _VECTOR_SLOTS.release())
+        return vetorial
+
+    @staticmethod
+    def _vector_failed(query: str, erro: Exception) -> List[Tuple[int, str]]:
+        print(f"Busca vetorial falhou para {query!r}, usando só o resultado lexical: {erro!r}", flush=True)
+        hybrid_stats.count("lexicas_erro")
+        return []
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if is_exact_identifier(query):
+            hybrid_stats.count("lexicas_identificador")
+            return self._to_documents(self._fuse(search_fts(query, self.top_k, self.filtro, exact=True), []))
+
+        vetorial = self._submit_vector(query)
+        lexical = search_fts(query, self.candidates, self.filtro)
+        if vetorial is None:
+            hybrid_stats.count("lexicas_saturado")
+            return self._to_documents(self._fuse(lexical, []))
+        try:
+            vector = vetorial.result(timeout=self.vector_timeout)
+            hybrid_stats.count("hibridas")
+        except FutureTimeoutError:
+            # ainda na fila: sai dela; já rodando: termina sozinha e libera a vaga
+            vetorial.cancel()
+            vector = []
+            hybrid_stats.count("lexicas_timeout")
+        except Exception as erro:
+            vector = self._vector_failed(query, erro)
+        return self._to_documents(self._fuse(lexical, vector))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if is_exact_identifier(query):
+            hybrid_stats.count("lexicas_identificador")
+            lexical = await run_blocking(search_fts, query, self.top_k, self.filtro, True)
+            return await run_blocking(self._to_documents, self._fuse(lexical, []))
+
+        vetorial = asyncio.ensure_future(self.store.asearch_reviews(self.field, query, self.candidates,
+                                                                    self.filtro))
+        lexical = await run_blocking(search_fts, query, self.candidates, self.filtro)
+        try:
+            vector = await asyncio.wait_for(vetorial, timeout=self.vector_timeout)
+            hybrid_stats.count("hibridas")
+        except asyncio.TimeoutError:
+            vector = []
+            hybrid_stats.count("lexicas_timeout")
+        except Exception as erro:
+            vector = self._vector_failed(query, erro)
+        return await run_blocking(self._to_documents, self._fuse(lexical, vector))
+
+    def _to_documents(self, review_ids: List[int]) -> List[Document]:
+        return [
+            Document(id=str(review["review_id"]), page_content=review.get(self.field) or "", metadata=review)
+            for review in select_reviews_by_ids(review_ids)
+        ]
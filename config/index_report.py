@@ -0,0 +1,116 @@
+"""
+Relatório recall x latência dos tipos de índice vetorial.
+
+Compara cada configuração (flat, ivf, hnsw, pq, sq8 e os valores de
+nprobe/efSearch) com a busca exata "Flat" sobre os vetores reais de um campo:
+
+    python -m config.index_report --field product_name --k 10 --queries 500
+"""
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from config.database import select_vector_values
+from config.vectorstore import (
+    VECTOR_DB_FIELDS,
+    MultiFieldVectorStore,
+    build_index,
+    configure_search,
+    index_factory_string,
+)
+
+NPROBE_VALUES = (1, 4, 16, 64)
+EF_SEARCH_VALUES = (16, 32, 64, 128)
+
+
+def _configurations():
+    """Tipo de índice -> parâmetros de busca avaliados (o índice é construído uma vez por tipo)."""
+    return {
+        "flat": [{}],
+        "ivf": [{"nprobe": nprobe} for nprobe in NPROBE_VALUES],
+        "hnsw": [{"ef_search": ef_search} for ef_search in EF_SEARCH_VALUES],
+        "pq": [{"nprobe": nprobe} for nprobe in NPROBE_VALUES],
+        "sq8": [{}],
+    }
+
+
+def _search_timed(index: faiss.Index, queries: np.ndarray, k: int):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    return np.asarray(results), np.asarray(latencies) * 1000
+
+
+def recall_latency_report(field: str, k: int = 10, n_queries: int = 500, seed: int = 0) -> List[Dict]:
+    """
+    Constrói cada configuração de índice sobre os vetores do campo e mede
+    recall@k (contra a busca exata), latência por consulta e tamanho do índice.
+    As consultas são vetores do próprio campo levemente perturbados.
+    """
+    store = MultiFieldVectorStore()
+    vectors = store.embed_texts(select_vector_values(field))
+    if len(vectors) == 0:
+        raise ValueError(f"Índice do campo {field} está vazio; rode a ingestão antes do relatório.")
+    k = min(k, len(vectors))
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[sample] + rng.normal(scale=0.01, size=(len(sample), vectors.shape[1])).astype(np.float32)
+
+    exact, _ = _search_timed(build_index(vectors, index_type="flat"), queries, k)
+
+    report = []
+    for index_type, search_params in _configurations().items():
+        start = time.perf_counter()
+        index = build_index(vectors, index_type=index_type)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 2 ** 20
+
+        for params in search_params:
+            configure_search(index, **params)
+            found, latencies = _search_timed(index, queries, k)
+            recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, exact)])
+            report.append({
+                "field": field,
+                "index": index_factory_string(index_type, vectors.shape[1], len(vectors)),
+                "index_type": index_type,
+                **params,
+                "recall_at_k": round(float(recall), 4),
+                "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+                "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+                "build_s": round(build_seconds, 3),
+                "size_mb": round(size_mb, 2),
+            })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--field", choices=VECTOR_DB_FIELDS, default="product_name")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    report = recall_latency_report(args.field, k=args.k, n_queries=args.queries)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'índice':<22}{'params':<16}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'MB':>8}")
+    for row in report:
+        params = ", ".join(f"{key}={row[key]}" for key in ("nprobe", "ef_search") if key in row)
+        print(f"{row['index']:<22}{params:<16}{row['recall_at_k']:>10}{row['latency_ms_p50']:>10}"
+              f"{row['latency_ms_p95']:>10}{row['build_s']:>10}{row['size_mb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Type
+
+import numpy as np
+import xxhash
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+# Respostas mantidas em memória (LRU) e por quanto tempo continuam válidas
+LLM_CACHE_MAX_ITEMS = int(os.getenv("LLM_CACHE_MAX_ITEMS", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+# Similaridade de cosseno mínima para um acerto semântico; 0 desativa o modo semântico
+LLM_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+_MISS = object()
+
+
+def _is_instance(value: Any, expected_type: Optional[Type]) -> bool:
+    return expected_type is None or isinstance(value, expected_type)
+
+
+class _Entry:
+    __slots__ = ("scope", "value", "expires_at", "embedding")
+
+    def __init__(self, scope, value, expires_at, embedding):
+        self.scope = scope
+        self.value = value
+        self.expires_at = expires_at
+        self.embedding = embedding
+
+
+class ResponseCache:
+    """
+    Cache de respostas das cadeias de análise.
+
+    - Escopo: modelo, cadeia e as variáveis fixas da entrada (ex.: contexto);
+      respostas de cadeias ou schemas diferentes nunca se misturam.
+    - Exato: chave xxh3 de "escopo + texto variável da entrada".
+    - Semântico (opcional): quando não há acerto exato, compara o embedding do
+      texto variável (só a entrada do usuário, sem o template do prompt) com
+      os já respondidos no mesmo escopo e reaproveita a resposta se a
+      similaridade de cosseno passar de semantic_threshold.
+    Com expected_type, um valor guardado que não seja desse tipo nunca é
+    devolvido. Entradas expiram após ttl_seconds e as menos usadas saem quando
+    o cache passa de max_items.
+    """
+
+    def __init__(self, max_items: int = LLM_CACHE_MAX_ITEMS, ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 semantic_threshold: float = LLM_CACHE_SEMANTIC_THRESHOLD,
+                 embedding_model: Optional[Embeddings] = None):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._embedding_model = embedding_model
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def embedding_model(self) -> Embeddings:
+        if self._embedding_model is None:
+            from config.model import load_embedding_model
+            self._embedding_model = load_embedding_model()
+        return self._embedding_model
+
+    @staticmethod
+    def key(scope: str, text: str) -> str:
+        return xxhash.xxh3_128_hexdigest(f"{scope}\0{text}")
+
+    def _evict_expired(self, now: float) -> None:
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[key]
+
+    def _lookup_exact(self, key: str, expected_type: Optional[Type] = None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISS
+            if entry.expires_at <= time.monotonic() or not _is_instance(entry.value, expected_type):
+                del self._entries[key]
+                return _MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def _lookup_semantic(self, scope: str, embedding: np.ndarray, expected_type: Optional[Type] = None):
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            best_key, best_score = None, self.semantic_threshold
+            for key, entry in self._entries.items():
+                if entry.scope != scope or entry.embedding is None or not _is_instance(entry.value, expected_type):
+                    continue
+                score = float(entry.embedding @ embedding)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return _MISS
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key].value
+
+    def _store(self, key: str, scope: str, value: Any, embedding: Optional[np.ndarray]) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(scope, value, time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    async def aget_or_compute(self, scope: str, text: str, compute, expected_type: Optional[Type] = None):
+        """
+        Devolve a resposta em cache para o texto no escopo ou executa
+        `compute()` (corrotina) e guarda o resultado.
+        """
+        key = self.key(scope, text)
+        value = self._lookup_exact(key, expected_type)
+        if value is not _MISS:
+            return value
+
+        embedding = None
+        if self.semantic_threshold > 0:
+            embedding = self._normalize(await self.embedding_model.aembed_query(text))
+            value = self._lookup_semantic(scope, embedding, expected_type)
+            if value is not _MISS:
+                return value
+        else:
+            with self._lock:
+                self.misses += 1
+
+        value = await compute()
+        self._store(key, scope, value, embedding)
+        return value
+
+    def get_or_compute(self, scope: str, text: str, compute, expected_type: Optional[Type] = None):
+        """Versão síncrona de aget_or_compute."""
+        key = self.key(scope, text)
+        value = self._lookup_exact(key, expected_type)
+        if value is not _MISS:
+            return value
+
+        embedding = None
+        if self.semantic_threshold > 0:
+            embedding = self._normalize(self.embedding_model.embed_query(text))
+            value = self._lookup_semantic(scope, embedding, expected_type)
+            if value is not _MISS:
+                return value
+        else:
+            with self._lock:
+                self.misses += 1
+
+        value = compute()
+        self._store(key, scope, value, embedding)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.semantic_hits + self.misses
+            return {
+                "itens": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.semantic_hits) / total, 4) if total else 0.0,
+            }
+
+
+llm_response_cache = ResponseCache()
+
+
+def cached_chain(prompt: Runnable, model_tool: Runnable, model_name: str, namespace: str, output_type: Type,
+                 cache: Optional[ResponseCache] = None, input_key: str = "query") -> Runnable:
+    """
+    Cadeia `prompt | model_tool` com o cache de respostas na frente: o modelo
+    só é chamado em caso de miss. O escopo do cache é o modelo, o namespace
+    da cadeia e as demais variáveis da entrada; só o valor de input_key (a
+    entrada do usuário) é comparado no modo semântico. Apenas respostas do
+    tipo output_type saem do cache.
+    """
+    cache = cache or llm_response_cache
+    chain = prompt | model_tool
+
+    def scope_and_text(entrada):
+        if not isinstance(entrada, dict):
+            entrada = {input_key: entrada}
+        fixas = {chave: valor for chave, valor in entrada.items() if chave != input_key and valor not in ("", None)}
+        scope = f"{model_name}\0{namespace}\0{json.dumps(fixas, sort_keys=True, ensure_ascii=False, default=str)}"
+        return scope, str(entrada.get(input_key, ""))
+
+    def invoke(entrada, config: RunnableConfig):
+        scope, text = scope_and_text(entrada)
+        return cache.get_or_compute(scope, text, lambda: chain.invoke(entrada, config), output_type)
+
+    async def ainvoke(entrada, config: RunnableConfig):
+        scope, text = scope_and_text(entrada)
+        return await cache.aget_or_compute(scope, text, lambda: chain.ainvoke(entrada, config), output_type)
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"cached_{namespace}")
@@ -0,0 +1,139 @@
+import os
+from typing import List
+
+import aiosqlite
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+CHAT_DB_FILE = os.getenv("CHAT_DB_FILE", os.path.join(os.path.dirname(__file__), "..", "chat_memory.db"))
+
+# Tokens de histórico que podem ir para o prompt do chat
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "2000"))
+# Mensagens mais recentes mantidas na íntegra quando o histórico é resumido
+CHAT_HISTORY_KEEP_MESSAGES = int(os.getenv("CHAT_HISTORY_KEEP_MESSAGES", "6"))
+
+SUMMARY_MESSAGE_ID = "resumo_conversa"
+
+SUMMARY_PROMPT = """
+Você mantém o resumo de uma conversa entre um cliente e um assistente de e-commerce.
+Atualize o resumo existente incorporando as novas mensagens. Preserve produtos, marcas,
+categorias, preferências e perguntas em aberto; descarte cumprimentos e repetições.
+Responda apenas com o novo resumo, em no máximo 10 frases.
+
+Resumo atual:
+{resumo}
+
+Novas mensagens:
+{mensagens}
+"""
+
+
+async def open_chat_checkpointer(db_file: str = CHAT_DB_FILE) -> AsyncSqliteSaver:
+    """Checkpointer do LangGraph persistido em SQLite: o histórico de cada sessão sobrevive a reinícios."""
+    conn = await aiosqlite.connect(db_file)
+    checkpointer = AsyncSqliteSaver(conn)
+    await checkpointer.setup()
+    return checkpointer
+
+
+def _last_human(messages: List[AnyMessage]) -> int:
+    """Posição da última mensagem do usuário (início do turno atual); len(messages) se não houver."""
+    for posicao in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[posicao], HumanMessage):
+            return posicao
+    return len(messages)
+
+
+def _split_point(messages: List[AnyMessage], keep_last: int) -> int:
+    """
+    Início da janela recente, sem separar uma chamada de ferramenta das suas
+    respostas e sem deixar de fora o turno atual.
+    """
+    start = min(max(len(messages) - keep_last, 0), _last_human(messages))
+    while start > 0 and isinstance(messages[start], ToolMessage):
+        start -= 1
+    return start
+
+
+def _window(messages: List[AnyMessage], max_tokens: int) -> List[AnyMessage]:
+    """
+    Mensagens recentes que cabem em max_tokens. O turno atual (da última
+    mensagem do usuário em diante) entra sempre inteiro; as anteriores são
+    cortadas pelo início, começando em uma mensagem do usuário.
+    """
+    atual = _last_human(messages)
+    turno = messages[atual:]
+    restante = max_tokens - count_tokens_approximately(turno)
+    if atual == 0 or restante <= 0:
+        return turno
+    return trim_messages(
+        messages[:atual],
+        max_tokens=restante,
+        token_counter=count_tokens_approximately,
+        strategy="last",
+        start_on="human",
+        allow_partial=False,
+    ) + turno
+
+
+def _render(messages: List[AnyMessage]) -> str:
+    linhas = []
+    for message in messages:
+        if isinstance(message, AIMessage) and not message.content:
+            continue
+        linhas.append(f"{message.type}: {message.content}")
+    return "\n".join(linhas)
+
+
+def make_history_hook(model, max_tokens: int = CHAT_HISTORY_MAX_TOKENS,
+                      keep_last: int = CHAT_HISTORY_KEEP_MESSAGES) -> RunnableLambda:
+    """
+    pre_model_hook do agente de chat: janela deslizante + resumo contínuo.
+
+    Enquanto o histórico da sessão cabe em max_tokens ele vai inteiro para o
+    modelo. Quando passa disso, as mensagens antigas são condensadas (junto com
+    o resumo anterior) em uma única SystemMessage, e o estado salvo no
+    checkpointer passa a ser [resumo] + as keep_last mensagens recentes. O
+    prompt de cada turno fica então limitado, independente do tamanho da conversa.
+    A última mensagem do usuário nunca é resumida nem cortada.
+    """
+
+    def split(messages):
+        resumo = ""
+        if messages and messages[0].id == SUMMARY_MESSAGE_ID:
+            resumo, messages = messages[0].content, messages[1:]
+        start = _split_point(messages, keep_last)
+        return resumo, messages[:start], messages[start:]
+
+    def summary_prompt(resumo, antigas) -> str:
+        return SUMMARY_PROMPT.format(resumo=resumo or "(vazio)", mensagens=_render(antigas))
+
+    def update(resumo, recentes):
+        historico = [SystemMessage(content=f"Resumo da conversa até aqui: {resumo}", id=SUMMARY_MESSAGE_ID)]
+        return {
+            "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *historico, *recentes],
+            "llm_input_messages": historico + _window(recentes, max_tokens),
+        }
+
+    async def ahook(state):
+        messages = state["messages"]
+        if count_tokens_approximately(messages) <= max_tokens:
+            return {"llm_input_messages": messages}
+        resumo, antigas, recentes = split(messages)
+        if antigas:
+            resumo = (await model.ainvoke(summary_prompt(resumo, antigas))).content
+        return update(resumo, recentes)
+
+    def hook(state):
+        messages = state["messages"]
+        if count_tokens_approximately(messages) <= max_tokens:
+            return {"llm_input_messages": messages}
+        resumo, antigas, recentes = split(messages)
+        if antigas:
+            resumo = model.invoke(summary_prompt(resumo, antigas)).content
+        return update(resumo, recentes)
+
+    return RunnableLambda(hook, afunc=ahook)
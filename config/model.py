@@ -1,5 +1,12 @@
+from functools import cache
+
 from langchain_ollama import OllamaEmbeddings, ChatOllama
 
+from config.batching import BatchedEmbeddings
+from config.embedding_cache import CachedEmbeddings
+
+EMBEDDING_MODEL_NAME = "nomic-embed-text"
+
 
 def load_model(model_name) -> ChatOllama:
     model = ChatOllama(model=model_name, name=model_name)
@@ -8,8 +15,14 @@ def load_model(model_name) -> ChatOllama:
 
     return chain
 
-def load_embedding_model() :
+@cache
+def load_embedding_model() -> CachedEmbeddings:
+    """
+    Modelo de embeddings compartilhado pelo processo, com cache em disco
+    e em memória na frente do Ollama. Os textos que não estão no cache passam
+    pelo despachante de micro-lotes, que junta as consultas concorrentes.
+    """
     embeddings = OllamaEmbeddings(
-        model="nomic-embed-text",
+        model=EMBEDDING_MODEL_NAME,
     )
-    return embeddings
+    return CachedEmbeddings(BatchedEmbeddings(embeddings), model_name=EMBEDDING_MODEL_NAME)
@@ -0,0 +1,59 @@
+import threading
+from typing import Iterable, Optional
+
+from config.hybrid import HybridRetriever
+from config.vectorstore import VECTOR_DB_FIELDS, FieldRetriever, MultiFieldVectorStore
+from models.filtro_reviews import FiltroReviews
+
+
+class RetrieverRegistry:
+    """
+    Mantém os índices vetoriais carregados uma única vez por processo.
+
+    As rotas do FastAPI e as ferramentas do agente compartilham a mesma
+    instância; cada chamada recebe apenas uma visão com o seu próprio top_k.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store: Optional[MultiFieldVectorStore] = None
+
+    def load(self, fields: Optional[Iterable[str]] = None) -> None:
+        """Carrega (ou constrói) os índices que ainda não estão em memória."""
+        with self._lock:
+            if self._store is None:
+                self._store = MultiFieldVectorStore()
+            faltando = [field for field in fields or VECTOR_DB_FIELDS if field not in self._store.indexes]
+            if faltando:
+                self._store.load(faltando)
+
+    def reload(self, fields: Optional[Iterable[str]] = None, rebuild: bool = False) -> None:
+        """
+        Recarrega explicitamente os índices. O novo store é montado fora do
+        lock, então as buscas em andamento continuam usando o anterior.
+        """
+        novo = MultiFieldVectorStore().load(fields, rebuild=rebuild)
+        with self._lock:
+            if self._store is not None:
+                for field, index in self._store.indexes.items():
+                    novo.indexes.setdefault(field, index)
+            self._store = novo
+
+    def store(self) -> MultiFieldVectorStore:
+        if self._store is None:
+            self.load()
+        return self._store
+
+    def get_retriever(self, field: str, top_k: int, filtro: Optional[FiltroReviews] = None) -> FieldRetriever:
+        if self._store is None or field not in self._store.indexes:
+            self.load([field])
+        return FieldRetriever(store=self._store, field=field, top_k=top_k, filtro=filtro)
+
+    def get_hybrid_retriever(self, field: str, top_k: int, filtro: Optional[FiltroReviews] = None) -> HybridRetriever:
+        """Busca híbrida (FTS5 + índice vetorial de `field`) sobre o mesmo store compartilhado."""
+        if self._store is None or field not in self._store.indexes:
+            self.load([field])
+        return HybridRetriever(store=self._store, field=field, top_k=top_k, filtro=filtro)
+
+
+retriever_registry = RetrieverRegistry()
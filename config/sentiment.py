@@ -0,0 +1,192 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple, Union
+
+import xxhash
+
+from config.concurrency import LLM_MAX_CONCURRENCY, run_blocking
+from config.database import save_sentiment_labels, select_matching_review_ids, select_sentiment_labels
+from models.sentimentos_model import SentimentosModel
+
+SENTIMENTOS = ("POSITIVO", "NEGATIVO", "NEUTRO")
+
+# Confiança mínima (0 a 1) para o pré-classificador local decidir sem chamar o modelo;
+# um valor acima de 1 manda todos os comentários para o LLM
+SENTIMENT_LOCAL_THRESHOLD = float(os.getenv("SENTIMENT_LOCAL_THRESHOLD", "0.8"))
+
+# Léxico em português, sem acentos; um termo precedido de negação inverte a polaridade
+TERMOS_POSITIVOS = frozenset("""
+    recomendo excelente otimo otima bom boa perfeito perfeita maravilhoso maravilhosa adorei amei
+    gostei satisfeito satisfeita rapido rapida eficiente lindo linda funciona superou confiavel
+    qualidade pratico pratica vale
+""".split())
+TERMOS_NEGATIVOS = frozenset("""
+    ruim pessimo pessima horrivel defeito defeituoso quebrado quebrada quebrou atraso atrasou
+    atrasada decepcionado decepcionada decepcao insatisfeito insatisfeita lixo pior fraco fraca
+    devolvi devolver devolucao problema problemas parou estragou enganosa arrependido arrependida
+""".split())
+NEGACOES = frozenset({"nao", "nunca", "nem", "jamais"})
+
+# Peso de cada sinal no escore do pré-classificador (somam 1)
+PESO_NOTA, PESO_RECOMENDACAO, PESO_LEXICO = 0.5, 0.25, 0.25
+
+
+def aggregate_sentiments(labels: Iterable[str]) -> SentimentosModel:
+    """
+    Porcentagens de POSITIVO/NEGATIVO/NEUTRO calculadas a partir dos rótulos.
+    Usa o método do maior resto, então as três porcentagens inteiras sempre
+    somam 100% (ou são todas 0% quando não há rótulos).
+    """
+    contagem = Counter(label for label in labels if label in SENTIMENTOS)
+    total = sum(contagem.values())
+    if total == 0:
+        return SentimentosModel(Positivos="0%", Negativos="0%", Neutros="0%")
+
+    exatos = {label: 100 * contagem[label] / total for label in SENTIMENTOS}
+    inteiros = {label: int(valor) for label, valor in exatos.items()}
+    restantes = 100 - sum(inteiros.values())
+    for label in sorted(SENTIMENTOS, key=lambda label: inteiros[label] - exatos[label])[:restantes]:
+        inteiros[label] += 1
+
+    return SentimentosModel(
+        Positivos=f"{inteiros['POSITIVO']}%",
+        Negativos=f"{inteiros['NEGATIVO']}%",
+        Neutros=f"{inteiros['NEUTRO']}%",
+    )
+
+
+def _tokens(texto: str) -> List[str]:
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    return re.findall(r"[a-z]+", texto.encode("ascii", "ignore").decode())
+
+
+def lexicon_score(texto: str) -> float:
+    """Polaridade do texto entre -1 e 1 pelo léxico; 0 quando nenhum termo é encontrado."""
+    positivos = negativos = 0
+    tokens = _tokens(texto)
+    for i, token in enumerate(tokens):
+        polaridade = (token in TERMOS_POSITIVOS) - (token in TERMOS_NEGATIVOS)
+        if polaridade and NEGACOES.intersection(tokens[max(i - 2, 0):i]):
+            polaridade = -polaridade
+        positivos += polaridade > 0
+        negativos += polaridade < 0
+    total = positivos + negativos
+    return (positivos - negativos) / total if total else 0.0
+
+
+def local_sentiment(comentario) -> Tuple[str, float]:
+    """
+    Sentimento estimado sem o modelo e a confiança (0 a 1), a partir da nota
+    (1 a 5 estrelas), de "Recomendaria a um amigo" e do léxico aplicado ao
+    título e ao comentário. Só decide entre POSITIVO e NEGATIVO: casos mistos
+    têm confiança baixa e ficam para o LLM.
+    """
+    nota = (min(max(comentario.avaliacao_geral, 1), 5) - 3) / 2
+    recomenda = (comentario.recomendaria_a_um_amigo or "").strip().lower()
+    recomendacao = 1.0 if recomenda in ("yes", "sim") else -1.0 if recomenda in ("no", "não", "nao") else 0.0
+    lexico = lexicon_score(f"{comentario.titulo_avaliacao or ''} {comentario.comentario or ''}")
+
+    escore = PESO_NOTA * nota + PESO_RECOMENDACAO * recomendacao + PESO_LEXICO * lexico
+    return ("POSITIVO" if escore >= 0 else "NEGATIVO"), abs(escore)
+
+
+class LocalSentimentRouter:
+    """
+    Primeira etapa da classificação de sentimento: comentários com confiança
+    local >= threshold são respondidos por local_sentiment e os demais seguem
+    para o modelo. Conta quantos foram por cada caminho.
+    """
+
+    def __init__(self, threshold: float = SENTIMENT_LOCAL_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.local = Counter()
+        self.llm = 0
+
+    def classify(self, comentario) -> Optional[str]:
+        """Rótulo local do comentário, ou None quando ele deve ir para o LLM."""
+        label, confianca = local_sentiment(comentario)
+        with self._lock:
+            if confianca >= self.threshold:
+                self.local[label] += 1
+                return label
+            self.llm += 1
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            local = sum(self.local.values())
+            total = local + self.llm
+            return {
+                "threshold": self.threshold,
+                "local": local,
+                "local_positivos": self.local["POSITIVO"],
+                "local_negativos": self.local["NEGATIVO"],
+                "llm": self.llm,
+                "local_rate": round(local / total, 4) if total else 0.0,
+            }
+
+
+local_sentiment_router = LocalSentimentRouter()
+
+
+def content_hash(comentario) -> str:
+    """Hash do conteúdo do comentário (todos os campos menos o Id), chave dos rótulos sem review no banco."""
+    return xxhash.xxh3_128_hexdigest(comentario.model_dump_json(exclude={"id"}))
+
+
+async def classify_comments(agent, list_comentarios, max_concurrency: int = LLM_MAX_CONCURRENCY
+                            ) -> List[Union[str, Exception]]:
+    """
+    Rótulo de sentimento de cada comentário, na ordem de entrada.
+
+    Comentários já classificados (pelo job de enriquecimento ou por uma
+    chamada anterior) são respondidos do banco e os casos claros pelo
+    pré-classificador local; os demais vão ao agente classificador em paralelo
+    e os novos rótulos do modelo são guardados. A chave de um comentário é o
+    seu review_id quando o texto enviado é o review_text dessa review (só esses
+    rótulos entram em review_stats); senão, o hash do conteúdo.
+    A falha de um comentário aparece como exceção na sua posição.
+    """
+    conferidos = await run_blocking(select_matching_review_ids, [
+        (c.review_id, c.comentario) for c in list_comentarios if c.review_id is not None])
+    chaves = [c.review_id if c.review_id in conferidos else content_hash(c) for c in list_comentarios]
+    conhecidos = await run_blocking(select_sentiment_labels, set(chaves))
+
+    locais = {}
+    for posicao, (comentario, chave) in enumerate(zip(list_comentarios, chaves)):
+        if chave not in conhecidos:
+            label = local_sentiment_router.classify(comentario)
+            if label is not None:
+                locais[posicao] = label
+
+    pendente = [chave not in conhecidos and i not in locais for i, chave in enumerate(chaves)]
+    pendentes = [c for c, p in zip(list_comentarios, pendente) if p]
+    chaves_pendentes = [chave for chave, p in zip(chaves, pendente) if p]
+    resultados = await agent.abatch(
+        [{"query": comentario} for comentario in pendentes],
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+
+    novos = {}
+    for chave, resultado in zip(chaves_pendentes, resultados):
+        if not isinstance(resultado, Exception):
+            novos.setdefault(chave, resultado.sentimento)
+    if novos:
+        await run_blocking(save_sentiment_labels, list(novos.items()))
+
+    resultados = iter(resultados)
+    rotulos = []
+    for posicao, (chave, p) in enumerate(zip(chaves, pendente)):
+        if p:
+            resultado = next(resultados)
+            rotulos.append(resultado if isinstance(resultado, Exception) else resultado.sentimento)
+        elif posicao in locais:
+            rotulos.append(locais[posicao])
+        else:
+            rotulos.append(conhecidos[chave])
+    return rotulos
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+import xxhash
+from pydantic import BaseModel
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip().casefold()
+    if isinstance(value, BaseModel):
+        return _normalize(value.model_dump())
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def flight_key(*parts: Any) -> str:
+    """
+    Chave de deduplicação a partir das entradas normalizadas: textos sem
+    diferença de caixa e de espaços, modelos pydantic pelos seus campos.
+    """
+    return xxhash.xxh3_128_hexdigest(json.dumps(_normalize(parts), sort_keys=True, default=str))
+
+
+class SingleFlight:
+    """
+    Coalescência de chamadas síncronas idênticas em andamento: a primeira
+    chamada com uma chave executa a função e as que chegam enquanto ela roda
+    esperam e recebem o mesmo resultado (ou a mesma exceção). Nada fica
+    guardado depois que a chamada termina; isso é papel dos caches.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.followers += 1
+                leader = False
+            else:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+                leader = True
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(func())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"em_andamento": len(self._calls), "executadas": self.leaders, "coalescidas": self.followers}
+
+
+class AsyncSingleFlight:
+    """
+    Versão assíncrona de SingleFlight. A computação roda em uma task própria,
+    então o cancelamento de uma requisição (cliente desconectado) não cancela
+    as demais que esperam pelo mesmo resultado.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"em_andamento": len(self._calls), "executadas": self.leaders, "coalescidas": self.followers}
+
+
+# Instâncias compartilhadas: buscas dos retrievers (sync e async) e invocações dos agentes
+retriever_flight = SingleFlight()
+aretriever_flight = AsyncSingleFlight()
+agent_flight = AsyncSingleFlight()
+
+
+def singleflight_stats() -> dict:
+    return {
+        "retrievers": retriever_flight.stats(),
+        "retrievers_async": aretriever_flight.stats(),
+        "agentes": agent_flight.stats(),
+    }
@@ -0,0 +1,224 @@
+import ast
+import json
+import re
+import threading
+import typing
+import unicodedata
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+
+_CERCA = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_VIRGULA_FINAL = re.compile(r",\s*([}\]])")
+_LITERAIS_JSON = {"true": "True", "false": "False", "null": "None"}
+
+
+class StructuredOutputStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.validas = 0
+        self.reparadas = 0
+        self.falhas = 0
+
+    def count(self, resultado: str) -> None:
+        with self._lock:
+            setattr(self, resultado, getattr(self, resultado) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"validas": self.validas, "reparadas": self.reparadas, "falhas": self.falhas}
+
+
+structured_output_stats = StructuredOutputStats()
+
+
+def _close_json(texto: str) -> str:
+    """
+    Recorta o primeiro objeto/lista JSON do texto: descarta o que vem antes e
+    depois dele e, se a geração foi truncada, fecha a string e os colchetes
+    que ficaram abertos.
+    """
+    inicio = min((i for i in (texto.find("{"), texto.find("[")) if i >= 0), default=-1)
+    if inicio < 0:
+        return texto
+    pilha, em_string, escape = [], None, False
+    for posicao in range(inicio, len(texto)):
+        c = texto[posicao]
+        if em_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == em_string:
+                em_string = None
+        elif c in "\"'":
+            em_string = c
+        elif c in "{[":
+            pilha.append("}" if c == "{" else "]")
+        elif c in "}]":
+            if pilha:
+                pilha.pop()
+            if not pilha:
+                return texto[inicio:posicao + 1]
+    fechamento = (em_string or "") + "".join(reversed(pilha))
+    return _VIRGULA_FINAL.sub(r"\1", texto[inicio:].rstrip().rstrip(",") + fechamento)
+
+
+def repair_json(texto: str) -> Any:
+    """
+    Lê a saída do modelo como JSON, consertando os defeitos comuns sem nova
+    geração: cerca de markdown, texto antes/depois do JSON, vírgula sobrando,
+    geração truncada e sintaxe de Python (aspas simples, True/None).
+    """
+    texto = _CERCA.sub("", texto.strip())
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        pass
+    candidato = _VIRGULA_FINAL.sub(r"\1", _close_json(texto))
+    try:
+        return json.loads(candidato)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(re.sub(r"\b(true|false|null)\b", lambda m: _LITERAIS_JSON[m.group(1)], candidato))
+    except (ValueError, SyntaxError) as exc:
+        raise OutputParserException(f"Saída do modelo não é JSON: {texto[:200]!r}", llm_output=texto) from exc
+
+
+class JsonFieldStream:
+    """
+    Acompanha um JSON gerado aos pedaços e devolve, a cada pedaço, só o texto
+    novo do campo de texto `campo` (já sem os escapes do JSON). Um escape
+    partido entre dois pedaços espera o pedaço seguinte.
+    """
+
+    def __init__(self, campo: str):
+        self._abertura = re.compile(r'"%s"\s*:\s*"' % re.escape(campo))
+        self._buffer = ""
+        self._posicao: Optional[int] = None
+        self._fechado = False
+
+    def feed(self, pedaco: str) -> str:
+        self._buffer += pedaco
+        if self._posicao is None:
+            abertura = self._abertura.search(self._buffer)
+            if abertura is None:
+                return ""
+            self._posicao = abertura.end()
+        novo, texto, posicao = [], self._buffer, self._posicao
+        while posicao < len(texto) and not self._fechado:
+            c = texto[posicao]
+            if c == '"':
+                self._fechado = True
+            elif c != "\\":
+                novo.append(c)
+                posicao += 1
+            else:
+                tamanho = self._escape_size(texto, posicao)
+                if tamanho is None:
+                    break
+                novo.append(json.loads('"' + texto[posicao:posicao + tamanho] + '"'))
+                posicao += tamanho
+        self._posicao = posicao
+        return "".join(novo)
+
+    @staticmethod
+    def _escape_size(texto: str, posicao: int) -> Optional[int]:
+        """Tamanho do escape que começa em posicao, ou None se ele ainda não chegou inteiro."""
+        if posicao + 1 >= len(texto):
+            return None
+        if texto[posicao + 1] != "u":
+            return 2
+        if posicao + 6 > len(texto):
+            return None
+        if not 0xD800 <= int(texto[posicao + 2:posicao + 6], 16) < 0xDC00:
+            return 6
+        # primeira metade de um par substituto (ex.: emoji): decodifica junto com a segunda
+        if posicao + 12 > len(texto):
+            return None
+        return 12 if texto[posicao + 6:posicao + 8] == "\\u" else 6
+
+
+def _key(nome: str) -> str:
+    sem_acento = "".join(c for c in unicodedata.normalize("NFKD", nome) if not unicodedata.combining(c))
+    return re.sub(r"[\W_]+", "", sem_acento.casefold())
+
+
+def _coerce_value(valor: Any, anotacao: Any) -> Any:
+    origem, argumentos = typing.get_origin(anotacao), typing.get_args(anotacao)
+    if origem is typing.Union:
+        argumentos = [argumento for argumento in argumentos if argumento is not type(None)]
+        return _coerce_value(valor, argumentos[0]) if len(argumentos) == 1 else valor
+    if origem is typing.Literal and isinstance(valor, str):
+        opcoes = {_key(str(opcao)): opcao for opcao in argumentos}
+        return opcoes.get(_key(valor), valor)
+    if origem in (list, typing.List) and argumentos:
+        itens = valor if isinstance(valor, list) else [valor]
+        return [_coerce_value(item, argumentos[0]) for item in itens]
+    if anotacao is str and isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return str(valor)
+    return valor
+
+
+def coerce_to_schema(dados: Any, schema: Type[M]) -> Dict[str, Any]:
+    """
+    Aproxima o JSON do formato do modelo pydantic: desembrulha um objeto
+    aninhado (ex.: {"Sentimentos": {...}}), casa chaves sem diferenciar caixa
+    e acentos, embrulha o valor solto de um modelo de campo único e ajusta
+    rótulos (Literal) e números que deveriam ser texto.
+    """
+    campos = schema.model_fields
+    if not isinstance(dados, dict) and len(campos) == 1:
+        dados = {next(iter(campos)): dados}
+    if not isinstance(dados, dict):
+        return dados
+    nomes = {_key(campo.alias or nome): nome for nome, campo in campos.items()}
+    if len(dados) == 1 and _key(next(iter(dados))) not in nomes and isinstance(next(iter(dados.values())), dict):
+        dados = next(iter(dados.values()))
+    resultado = {}
+    for chave, valor in dados.items():
+        nome = nomes.get(_key(chave))
+        if nome is not None:
+            resultado[campos[nome].alias or nome] = _coerce_value(valor, campos[nome].annotation)
+    return resultado
+
+
+def parse_structured(saida: Any, schema: Type[M]) -> M:
+    """
+    Valida a saída do modelo contra schema. Se não validar de primeira, tenta
+    o reparo local (repair_json + coerce_to_schema); se ainda assim não
+    validar, levanta OutputParserException, sem gerar de novo.
+    """
+    texto = saida.content if isinstance(saida, BaseMessage) else str(saida)
+    try:
+        resultado = schema.model_validate_json(texto)
+        structured_output_stats.count("validas")
+        return resultado
+    except ValidationError:
+        pass
+    try:
+        resultado = schema.model_validate(coerce_to_schema(repair_json(texto), schema))
+    except (OutputParserException, ValidationError) as exc:
+        structured_output_stats.count("falhas")
+        raise OutputParserException(f"Saída do modelo não valida como {schema.__name__}: {exc}",
+                                    llm_output=texto) from exc
+    structured_output_stats.count("reparadas")
+    return resultado
+
+
+def structured_model(model, schema: Type[M], formato: Optional[dict] = None) -> Runnable:
+    """
+    Substitui model.with_structured_output(schema): o JSON schema vai ao
+    Ollama como `format`, que restringe a decodificação a JSON válido desse
+    formato, e a resposta passa por parse_structured. Os prompts não precisam
+    repetir as instruções de formato. `formato` permite um schema mais
+    restrito que o do modelo (ex.: tamanho exato de uma lista).
+    """
+    return model.bind(format=formato or schema.model_json_schema()) | RunnableLambda(
+        lambda saida: parse_structured(saida, schema), name=f"parse_{schema.__name__}")
@@ -0,0 +1,24 @@
+from typing import Any, List
+
+
+def estimate_tokens(text: Any) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token), suficiente para orçamentos de prompt."""
+    return len(str(text)) // 4 + 1
+
+
+def chunk_by_tokens(items: List[Any], budget: int) -> List[List[Any]]:
+    """
+    Agrupa os itens, na ordem, em blocos de até `budget` tokens estimados.
+    Um item maior que o orçamento fica sozinho no seu bloco.
+    """
+    chunks, current, used = [], [], 0
+    for item in items:
+        tokens = estimate_tokens(item)
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
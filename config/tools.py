@@ -3,10 +3,7 @@ from models.topics_model import Topics
 from langchain_core.tools import tool
 from langchain_core.documents import Document
 
-from config.vectorstore import generate_vector_db_to_retrieve_by_product_name
-from config.vectorstore import generate_vector_db_to_retrieve_by_product_brand
-from config.vectorstore import generate_vector_db_to_retrieve_by_site_category_lv1
-from config.vectorstore import generate_vector_db_to_retrieve_by_site_category_lv2
+from config.registry import retriever_registry
 
 
 @tool
@@ -34,7 +31,7 @@ def buscar_por_nome_produto(pergunta: str) -> str:
     Busca produtos similares com base no nome, usando FAISS.
     Retorna até 3 resultados formatados (nome + título e texto da review + rating).
     """
-    retriever = generate_vector_db_to_retrieve_by_product_name(top_k=3)
+    retriever = retriever_registry.get_retriever("product_name", top_k=3)
 
     docs: List[Document] = retriever.get_relevant_documents(pergunta)
     if not docs:
@@ -64,7 +61,7 @@ def buscar_por_marca_produto(pergunta: str) -> str:
     Busca produtos similares com base na marca, usando FAISS.
     Retorna até 3 resultados formatados (marca + título e texto da review + rating).
     """
-    retriever = generate_vector_db_to_retrieve_by_product_brand(top_k=3)
+    retriever = retriever_registry.get_retriever("product_brand", top_k=3)
     docs: List[Document] = retriever.get_relevant_documents(pergunta)
     if not docs:
         return "Nenhum produto (pela marca) encontrado para essa consulta."
@@ -95,7 +92,7 @@ def buscar_por_categoria_lv1(pergunta: str) -> str:
     Busca produtos similares com base na categoria de nível 1, usando FAISS.
     Retorna até 3 resultados formatados.
     """
-    retriever = generate_vector_db_to_retrieve_by_site_category_lv1(top_k=3)
+    retriever = retriever_registry.get_retriever("site_category_lv1", top_k=3)
     docs: List[Document] = retriever.get_relevant_documents(pergunta)
     if not docs:
         return "Nenhum produto encontrado para essa categoria (nível 1)."
@@ -126,7 +123,7 @@ def buscar_por_categoria_lv2(pergunta: str) -> str:
     Busca produtos similares com base na categoria de nível 2, usando FAISS.
     Retorna até 3 resultados formatados.
     """
-    retriever = generate_vector_db_to_retrieve_by_site_category_lv2(top_k=3)
+    retriever = retriever_registry.get_retriever("site_category_lv2", top_k=3)
     docs: List[Document] = retriever.get_relevant_documents(pergunta)
     if not docs:
         return "Nenhum produto encontrado para essa categoria (nível 2)."
@@ -149,3 +146,34 @@ def buscar_por_categoria_lv2(pergunta: str) -> str:
         blocos.append(bloco)
 
     return "\n\n---\n\n".join(blocos)
+
+
+@tool("busca_por_texto_review")
+def buscar_por_texto_review(pergunta: str) -> str:
+    """
+    Busca reviews pelo conteúdo (título e texto da review, nome e marca do produto),
+    combinando busca por palavras-chave (FTS5) e busca vetorial. Use para termos
+    específicos, defeitos citados pelos clientes ou códigos de modelo.
+    Retorna até 3 resultados formatados.
+    """
+    retriever = retriever_registry.get_hybrid_retriever("product_name", top_k=3)
+    docs: List[Document] = retriever.get_relevant_documents(pergunta)
+    if not docs:
+        return "Nenhuma review encontrada com esse conteúdo."
+
+    blocos: List[str] = []
+    for doc in docs:
+        meta = doc.metadata
+        nome_produto = meta.get("product_name", "—")
+        titulo_review = meta.get("review_title", "—")
+        texto_review = meta.get("review_text", "—")
+        rating = meta.get("overall_rating", "—")
+        bloco = (
+            f"Produto: {nome_produto}\n"
+            f"Título da Review: {titulo_review}\n"
+            f"Avaliação: {rating}\n"
+            f"Review: {texto_review}"
+        )
+        blocos.append(bloco)
+
+    return "\n\n---\n\n".join(blocos)
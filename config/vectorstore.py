@@ -1,124 +1,360 @@
 
 
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
 from langchain_core.documents import Document
-from langchain_community.vectorstores import FAISS
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
 import os
-from config.database import select_distinct_all
+from config.concurrency import run_blocking
+from config.database import (
+    append_vector_values,
+    count_vector_values,
+    save_vector_values,
+    select_review_ids_by_value,
+    select_reviews_by_ids,
+    select_reviews_by_value_ids,
+    select_reviews_generation,
+    select_value_ids_by_filter,
+    select_value_ids_by_value,
+    select_vector_index_state,
+)
 from config.model import load_embedding_model
+from models.filtro_reviews import FiltroReviews
 
-def generate_vector_db_to_retrieve_by_product_name(top_k: int) -> VectorStoreRetriever:
-    other_columns = select_distinct_all()
-    documents = []
-    embedding_model = load_embedding_model()
-    if not os.path.exists("./vector_db_product_name"):
-        for row in other_columns:
-            product_name = row[3]
-            metadata = {  
-                "product_id": row[2],
-                "product_name": row[3],
-                "product_brand": row[4],
-                "site_category_lv1": row[5],
-                "site_category_lv2": row[6],
-                "overall_rating": row[7],
-                "recommend_to_a_friend": row[8],
-                "review_title": row[9],
-                "review_text": row[10],
-            }
-            doc = Document(page_content=product_name, metadata=metadata)
-            documents.append(doc)
-        db = FAISS.from_documents(documents=documents, embedding=embedding_model)
-        db.save_local('vector_db_product_name')
-    else:
-        db = FAISS.load_local("./vector_db_product_name", embeddings=embedding_model,
-                              allow_dangerous_deserialization=True)
-    retriever = db.as_retriever(search_type='similarity', search_kwargs={"k": top_k})
-    return retriever
-
-
-def generate_vector_db_to_retrieve_by_product_brand(top_k: int) -> VectorStoreRetriever:
-    other_columns = select_distinct_all()
-    documents = []
-    embedding_model = load_embedding_model()
-    if not os.path.exists("./vector_db_product_brand"):
-        for row in other_columns:
-            product_name = row[4]
-            metadata = {
-                "product_id": row[2],
-                "product_name": row[3],
-                "product_brand": row[4],
-                "site_category_lv1": row[5],
-                "site_category_lv2": row[6],
-                "overall_rating": row[7],
-                "recommend_to_a_friend": row[8],
-                "review_title": row[9],
-                "review_text": row[10],
-            }
-            # print(product_name)
-            doc = Document(page_content=product_name, metadata=metadata)
-            documents.append(doc)
-        db = FAISS.from_documents(documents=documents, embedding=embedding_model)
-        db.save_local('vector_db_product_brand')
-    else:
-        db = FAISS.load_local("./vector_db_product_brand", embeddings=embedding_model,
-                              allow_dangerous_deserialization=True)
-    retriever = db.as_retriever(search_type='similarity', search_kwargs={"k": top_k})
-    return retriever
-
-
-def generate_vector_db_to_retrieve_by_site_category_lv1(top_k: int) -> VectorStoreRetriever:
-    other_columns = select_distinct_all()
-    documents = []
-    embedding_model = load_embedding_model()
-    if not os.path.exists("./vector_db_site_category_lv1"):
-        for row in other_columns:
-            category_lv1 = row[5]  
-            metadata = {
-                "product_id": row[2],
-                "product_name": row[3],
-                "product_brand": row[4],
-                "site_category_lv1": row[5],
-                "site_category_lv2": row[6],
-                "overall_rating": row[7],
-                "recommend_to_a_friend": row[8],
-                "review_title": row[9],
-                "review_text": row[10],
-            }
-            doc = Document(page_content=category_lv1, metadata=metadata)
-            documents.append(doc)
-        db = FAISS.from_documents(documents=documents, embedding=embedding_model)
-        db.save_local('vector_db_site_category_lv1')
-    else:
-        db = FAISS.load_local("./vector_db_site_category_lv1", embeddings=embedding_model,
-                              allow_dangerous_deserialization=True)
-    retriever = db.as_retriever(search_type='similarity', search_kwargs={"k": top_k})
-    return retriever
-
-
-def generate_vector_db_to_retrieve_by_site_category_lv2(top_k: int) -> VectorStoreRetriever:
-    other_columns = select_distinct_all()
-    documents = []
-    embedding_model = load_embedding_model()
-    if not os.path.exists("./vector_db_site_category_lv2"):
-        for row in other_columns:
-            site_category_lv2 = row[6]
-            metadata = {
-                "product_id": row[2],
-                "product_name": row[3],
-                "product_brand": row[4],
-                "site_category_lv1": row[5],
-                "site_category_lv2": row[6],
-                "overall_rating": row[7],
-                "recommend_to_a_friend": row[8],
-                "review_title": row[9],
-                "review_text": row[10],
-            }
-            doc = Document(page_content=site_category_lv2, metadata=metadata)
-            documents.append(doc)
-        db = FAISS.from_documents(documents=documents, embedding=embedding_model)
-        db.save_local('vector_db_site_category_lv2')
+# Campos da tabela reviews que possuem índice vetorial
+VECTOR_DB_FIELDS = (
+    "product_name",
+    "product_brand",
+    "site_category_lv1",
+    "site_category_lv2",
+)
+
+VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "./vector_db")
+
+# Textos enviados por chamada ao modelo de embeddings durante a construção
+EMBEDDING_BATCH_SIZE = 512
+
+# Tipo de índice usado na construção: flat (exato), ivf, hnsw, pq (IVF + PQ) ou sq8.
+# Ao trocar o tipo é preciso reconstruir os índices (POST /vector_db/reload?rebuild=true).
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "sq8")
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+VECTOR_IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", "0"))  # 0 = calculado pelo tamanho do campo
+VECTOR_NPROBE = int(os.getenv("VECTOR_NPROBE", "16"))
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "64"))
+VECTOR_PQ_M = int(os.getenv("VECTOR_PQ_M", "64"))
+# Em índices HNSW, subconjuntos filtrados até este tamanho são comparados de forma exata
+VECTOR_FILTER_EXACT_MAX = int(os.getenv("VECTOR_FILTER_EXACT_MAX", "4096"))
+
+# Flags tentadas, em ordem, ao mapear um índice em memória: IO_FLAG_MMAP_IFC mapeia
+# os códigos de índices flat/IVF; IO_FLAG_MMAP cobre as listas invertidas de versões antigas.
+MMAP_READ_FLAGS = tuple(
+    flag for flag in (getattr(faiss, "IO_FLAG_MMAP_IFC", None), faiss.IO_FLAG_MMAP) if flag is not None
+)
+
+
+def index_factory_string(index_type: str, dim: int, n_vectors: int,
+                         nlist: int = VECTOR_IVF_NLIST,
+                         hnsw_m: int = VECTOR_HNSW_M,
+                         pq_m: int = VECTOR_PQ_M) -> str:
+    """
+    Descrição do índice no formato do faiss.index_factory.
+
+    Campos pequenos demais para treinar o índice escolhido (por exemplo as
+    categorias, com poucas dezenas de valores) usam o índice exato "Flat",
+    assim como um campo ainda sem valores (base vazia), que não tem com o que
+    treinar e recebe os vetores depois, pelo update.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice inválido: {index_type}. Use um de {INDEX_TYPES}")
+    if n_vectors == 0:
+        return "Flat"
+
+    if index_type in ("ivf", "pq"):
+        # o k-means do IVF precisa de ~39 pontos por centróide
+        nlist = min(nlist or int(4 * math.sqrt(n_vectors)), n_vectors // 39)
+        if nlist < 1:
+            return "Flat"
+        if index_type == "ivf":
+            return f"IVF{nlist},Flat"
+        # cada sub-quantizador do PQ (8 bits) treina 256 centróides
+        if n_vectors < 39 * 256:
+            return "Flat"
+        pq_m = max(m for m in range(1, min(pq_m, dim) + 1) if dim % m == 0)
+        return f"IVF{nlist},PQ{pq_m}"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "sq8":
+        return "SQ8"
+    return "Flat"
+
+
+def build_index(vectors: np.ndarray, index_type: str = VECTOR_INDEX_TYPE, **factory_kwargs) -> faiss.Index:
+    """
+    Cria, treina (quando o tipo exige) e popula um índice. Os vetores recebem
+    ids sequenciais na ordem de inserção, que são os próprios value_id; assim o
+    arquivo guarda só os códigos, sem tabela de ids, e pode ser mapeado em memória.
+    """
+    description = index_factory_string(index_type, vectors.shape[1], len(vectors), **factory_kwargs)
+    index = faiss.index_factory(vectors.shape[1], description)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def read_index_mmap(path: str) -> faiss.Index:
+    """
+    Abre o índice somente leitura e mapeado em memória, para que vários workers
+    do uvicorn compartilhem o mesmo arquivo no page cache. Tipos de índice (ou
+    plataformas) sem suporte a mmap são lidos normalmente.
+    """
+    for flags in MMAP_READ_FLAGS:
+        try:
+            return faiss.read_index(path, flags | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+def write_index_atomic(index: faiss.Index, path: str) -> None:
+    """Grava em arquivo temporário e troca de uma vez: workers com o arquivo antigo mapeado não são afetados."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def configure_search(index: faiss.Index, nprobe: int = VECTOR_NPROBE, ef_search: int = VECTOR_EF_SEARCH) -> None:
+    """Ajusta os parâmetros de busca (nprobe do IVF, efSearch do HNSW) do índice."""
+    params = faiss.ParameterSpace()
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if faiss.try_extract_index_ivf(base) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if isinstance(base, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", ef_search)
+
+
+def filtered_search(index: faiss.Index, embedding: np.ndarray, k: int, value_ids: List[int],
+                    ef_search: int = VECTOR_EF_SEARCH) -> List[int]:
+    """
+    Busca restrita aos value_id informados (o subconjunto do filtro SQL), com
+    faiss.IDSelectorBatch: os demais vetores nem são comparados.
+
+    - IVF: todas as listas são visitadas (nprobe = nlist), senão um filtro
+      restritivo deixaria as listas sondadas sem nenhum candidato.
+    - HNSW: o grafo perde recall com filtros restritivos, então subconjuntos
+      de até VECTOR_FILTER_EXACT_MAX vetores são reconstruídos e comparados
+      de forma exata; acima disso usa o seletor com efSearch ampliado.
+    """
+    ids = np.asarray(sorted(value_ids), dtype=np.int64)
+    k = min(k, len(ids))
+    if k == 0:
+        return []
+    if isinstance(index, faiss.IndexHNSW) and len(ids) <= VECTOR_FILTER_EXACT_MAX:
+        _, order = faiss.knn(embedding, index.reconstruct_batch(ids), k)
+        return [int(ids[i]) for i in order[0] if i != -1]
+
+    selector = faiss.IDSelectorBatch(ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(ef_search, 8 * k))
     else:
-        db = FAISS.load_local("./vector_db_site_category_lv2", embeddings=embedding_model,
-                              allow_dangerous_deserialization=True)
-    retriever = db.as_retriever(search_type='similarity', search_kwargs={"k": top_k})
-    return retriever
+        params = faiss.SearchParameters(sel=selector)
+    _, found = index.search(embedding, k, params=params)
+    return [int(value_id) for value_id in found[0] if value_id != -1]
+
+
+class MultiFieldVectorStore:
+    """
+    Armazena um índice FAISS compacto por campo pesquisável.
+
+    Cada índice contém apenas vetores (um por valor distinto do campo), e a
+    posição do vetor é o seu value_id inteiro. O texto dos valores, o mapeamento
+    valor -> review_id e as próprias reviews ficam no SQLite e só são lidos na
+    hora de montar os resultados. Os índices são abertos somente leitura e
+    mapeados em memória (read_index_mmap).
+    """
+
+    def __init__(self, embedding_model: Optional[Embeddings] = None, path: str = VECTOR_DB_DIR,
+                 index_type: str = VECTOR_INDEX_TYPE, nprobe: int = VECTOR_NPROBE,
+                 ef_search: int = VECTOR_EF_SEARCH):
+        self.embedding_model = embedding_model or load_embedding_model()
+        self.path = path
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.indexes: Dict[str, faiss.Index] = {}
+
+    def index_path(self, field: str) -> str:
+        return os.path.join(self.path, f"{field}.faiss")
+
+    def load(self, fields: Optional[Iterable[str]] = None, rebuild: bool = False) -> "MultiFieldVectorStore":
+        """
+        Carrega os índices do disco, construindo os que faltam (ou todos, com
+        rebuild=True). Um índice também é reconstruído quando foi feito para
+        outra geração da tabela reviews (recarga completa do CSV) ou quando o
+        arquivo e o mapeamento no SQLite divergem; se a tabela só cresceu desde
+        a construção, as reviews novas são acrescentadas (update).
+        """
+        generation, last_review_id = select_reviews_generation()
+        for field in fields or VECTOR_DB_FIELDS:
+            if field not in VECTOR_DB_FIELDS:
+                raise ValueError(f"Campo sem índice vetorial: {field}")
+            path = self.index_path(field)
+            state = select_vector_index_state(field)
+            index = read_index_mmap(path) if not rebuild and state and os.path.exists(path) else None
+            if (index is None or state[0] != generation or state[1] > last_review_id
+                    or index.ntotal != count_vector_values(field)):
+                index = self.build(field, generation, last_review_id)
+            elif state[1] < last_review_id:
+                index = self.update(field, state[1], generation, last_review_id)
+            self.indexes[field] = index
+            configure_search(self.indexes[field], nprobe=self.nprobe, ef_search=self.ef_search)
+        return self
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            vectors.extend(self.embedding_model.embed_documents(texts[start:start + EMBEDDING_BATCH_SIZE]))
+        return np.asarray(vectors, dtype=np.float32)
+
+    def build(self, field: str, generation: str, last_review_id: int) -> faiss.Index:
+        values = select_review_ids_by_value(field, last_review_id=last_review_id)
+        if values:
+            vectors = self.embed_texts([value for value, _ in values])
+        else:
+            # campo sem valores: índice vazio, na dimensão do modelo de embedding
+            vectors = np.empty((0, self.embedding_dim()), dtype=np.float32)
+        index = build_index(vectors, index_type=self.index_type)
+
+        os.makedirs(self.path, exist_ok=True)
+        write_index_atomic(index, self.index_path(field))
+        save_vector_values(field, values, generation, last_review_id)
+        return read_index_mmap(self.index_path(field))
+
+    def update(self, field: str, after_review_id: int, generation: str, last_review_id: int) -> faiss.Index:
+        """
+        Acrescenta ao índice do campo as reviews com review_id em
+        (after_review_id, last_review_id]: valores já indexados só ganham as
+        reviews novas no mapeamento, e valores novos são embedados e entram no
+        fim do índice, com os próximos value_id. O arquivo é gravado antes do
+        mapeamento; se o processo parar entre os dois, o índice fica com mais
+        vetores que o mapeamento e é reconstruído no próximo load.
+        """
+        values = select_review_ids_by_value(field, after_review_id, last_review_id)
+        known = select_value_ids_by_value(field, [value for value, _ in values])
+        new_values = [(value, review_ids) for value, review_ids in values if value not in known]
+
+        path = self.index_path(field)
+        index = faiss.read_index(path)
+        first_value_id = index.ntotal
+        if new_values:
+            index.add(self.embed_texts([value for value, _ in new_values]))
+            write_index_atomic(index, path)
+
+        append_vector_values(
+            field,
+            [(known[value], value, review_ids) for value, review_ids in values if value in known]
+            + [(first_value_id + i, value, review_ids) for i, (value, review_ids) in enumerate(new_values)],
+            generation,
+            last_review_id,
+        )
+        return read_index_mmap(path)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return np.asarray([self.embedding_model.embed_query(query)], dtype=np.float32)
+
+    def embedding_dim(self) -> int:
+        return self.embed_query("dimensão").shape[1]
+
+    def search(self, field: str, embedding: np.ndarray, k: int,
+               allowed_ids: Optional[List[int]] = None) -> List[int]:
+        """
+        Retorna os value_id mais próximos do embedding, do mais similar ao menos
+        similar; com allowed_ids, só entre esses value_id (filtered_search).
+        """
+        if allowed_ids is not None:
+            return filtered_search(self.indexes[field], embedding, k, allowed_ids, ef_search=self.ef_search)
+        _, ids = self.indexes[field].search(embedding, k)
+        return [int(value_id) for value_id in ids[0] if value_id != -1]
+
+    def search_reviews(self, field: str, query: str, top_k: int,
+                       filtro: Optional[FiltroReviews] = None) -> List[Tuple[int, str]]:
+        """
+        Busca os valores mais similares do campo e expande cada um para as suas
+        reviews, até completar top_k. Retorna [(review_id, valor), ...].
+        Com filtro, a busca vetorial roda só sobre os valores que têm reviews
+        dentro do filtro, e só essas reviews entram no resultado.
+        """
+        return self.search_reviews_by_vector(field, self.embed_query(query), top_k, filtro)
+
+    async def asearch_reviews(self, field: str, query: str, top_k: int,
+                              filtro: Optional[FiltroReviews] = None) -> List[Tuple[int, str]]:
+        """Versão assíncrona: embedding pelo cliente async do Ollama, FAISS e SQLite no executor limitado."""
+        embedding = np.asarray([await self.embedding_model.aembed_query(query)], dtype=np.float32)
+        return await run_blocking(self.search_reviews_by_vector, field, embedding, top_k, filtro)
+
+    def search_reviews_by_vector(self, field: str, embedding: np.ndarray, top_k: int,
+                                 filtro: Optional[FiltroReviews] = None) -> List[Tuple[int, str]]:
+        allowed_ids = None
+        if filtro is not None and not filtro.is_empty():
+            allowed_ids = select_value_ids_by_filter(field, filtro)
+            total_values = len(allowed_ids)
+        else:
+            filtro = None
+            total_values = self.indexes[field].ntotal
+
+        fetch_k = min(top_k, total_values)
+        hits: List[Tuple[int, str]] = []
+        while fetch_k > 0:
+            value_ids = self.search(field, embedding, fetch_k, allowed_ids)
+            expanded = select_reviews_by_value_ids(field, value_ids, filtro)
+            hits = []
+            for value_id in value_ids:
+                value, review_ids = expanded.get(value_id, (None, []))
+                hits.extend((review_id, value) for review_id in review_ids)
+                if len(hits) >= top_k:
+                    break
+            if len(hits) >= top_k or fetch_k >= total_values:
+                break
+            fetch_k = min(fetch_k * 2, total_values)
+        return hits[:top_k]
+
+
+class FieldRetriever(BaseRetriever):
+    """
+    Visão de um campo do MultiFieldVectorStore com o seu próprio top_k.
+    Devolve um documento por review, com a review completa lida do SQLite.
+    """
+
+    store: MultiFieldVectorStore
+    field: str
+    top_k: int = 10
+    filtro: Optional[FiltroReviews] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._to_documents(self.store.search_reviews(self.field, query, self.top_k, self.filtro))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = await self.store.asearch_reviews(self.field, query, self.top_k, self.filtro)
+        return await run_blocking(self._to_documents, hits)
+
+    @staticmethod
+    def _to_documents(hits: List[Tuple[int, str]]) -> List[Document]:
+        values = dict(hits)
+        reviews = select_reviews_by_ids(review_id for review_id, _ in hits)
+        return [
+            Document(id=str(review["review_id"]), page_content=values[review["review_id"]], metadata=review)
+            for review in reviews
+        ]
@@ -1,24 +1,44 @@
-from typing import Callable
-from fastapi import FastAPI
+import json
+import os
+import uuid
+from typing import AsyncIterator, Callable, Dict, Optional
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from langchain_core.runnables import RunnableSerializable
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import Runnable, RunnableSerializable
 from dotenv import load_dotenv
 from models.comentario_input import ComentariosInput
-
-from config.agents import (
-    get_agent_sumarizacao,
-    get_agent_gerador_topicos,
-    get_agent_chat_rag, 
-    get_agent_sentimentos          
+from models.filtro_reviews import FiltroReviews
+from models.sentimentos_model import SentimentosModel
+from models.topics_model import Topics
+
+from config.agents import build_agents, format_stats_context
+from config.batching import batching_stats
+from config.concurrency import LLM_MAX_CONCURRENCY, run_blocking
+from config.context_packing import context_packing_stats
+from config.database import (
+    STATS_DIMENSIONS,
+    STATS_ORDERINGS,
+    csv_to_sqlite,
+    refresh_review_stats,
+    select_enrichment,
+    select_matching_review_ids,
+    select_review_stats,
+    select_top_review_stats,
 )
-from config.database import csv_to_sqlite
+from config.hybrid import hybrid_stats
+from config.llm_cache import llm_response_cache
+from config.memory import open_chat_checkpointer
 from config.model import load_model
-from retrievers import (
-    product_brand_retriever,
-    product_name_retriever,
-    site_category_lv1_retriever,
-    site_category_lv2_retriever,
-)
+from config.registry import retriever_registry
+from config.sentiment import aggregate_sentiments, classify_comments, local_sentiment_router
+from config.singleflight import agent_flight, flight_key, singleflight_stats
+from config.structured import JsonFieldStream, structured_output_stats
+from retrievers import aretrieve
+
+DEFAULT_MODEL_NAME = "mistral"
 
 
 def get_app() -> FastAPI:
@@ -40,23 +60,39 @@ def get_app() -> FastAPI:
 
     def start_app_handler() -> Callable:
 
-        def startup() -> None:
-            csv_filepath = rf'./src/B2W-Reviews01.csv'
+        async def startup() -> None:
+            csv_filepath = os.getenv("REVIEWS_CSV_FILE", rf'./src/B2W-Reviews01.csv')
             csv_to_sqlite(csv_filepath)
-
+            refresh_review_stats()
+            retriever_registry.load()
 
             class Consts:
                 model: RunnableSerializable[dict, str] = None
                 chat_agent = None
+                # checkpointer SQLite com o histórico das sessões do /chat
+                checkpointer = None
+                # nome do modelo -> {nome do agente -> cadeia já montada}
+                agents: Dict[str, Dict[str, Runnable]] = {}
 
             app.consts = Consts()
-            app.consts.model = load_model("mistral")
+            app.consts.model = load_model(DEFAULT_MODEL_NAME)
+            app.consts.checkpointer = await open_chat_checkpointer()
+            app.consts.agents[DEFAULT_MODEL_NAME] = build_agents(app.consts.model, app.consts.checkpointer)
 
             pass
 
         return startup
 
+    def stop_app_handler() -> Callable:
+
+        async def shutdown() -> None:
+            if app.consts.checkpointer is not None:
+                await app.consts.checkpointer.conn.close()
+
+        return shutdown
+
     app.add_event_handler("startup", start_app_handler())
+    app.add_event_handler("shutdown", stop_app_handler())
 
     return app
 
@@ -64,6 +100,14 @@ def get_app() -> FastAPI:
 app = get_app()
 
 
+def get_agent(nome: str, model_name: str = DEFAULT_MODEL_NAME) -> Runnable:
+    """Devolve a cadeia/agente montado no startup para o modelo informado."""
+    agents = app.consts.agents.get(model_name)
+    if agents is None:
+        agents = app.consts.agents[model_name] = build_agents(load_model(model_name), app.consts.checkpointer)
+    return agents[nome]
+
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
@@ -74,24 +118,116 @@ async def model():
     return {"message": str(app.consts.model)}
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Acertos (exatos e semânticos), falhas e tamanho do cache de respostas do LLM."""
+    return llm_response_cache.stats()
+
+
+@app.get("/batching/stats")
+async def batching_stats_endpoint():
+    """Lotes enviados ao Ollama pelos despachantes de micro-lotes (embeddings e classificação)."""
+    return batching_stats()
+
+
+@app.get("/singleflight/stats")
+async def singleflight_stats_endpoint():
+    """Chamadas executadas e chamadas idênticas que aproveitaram uma execução em andamento."""
+    return singleflight_stats()
+
+
+@app.get("/context_packing/stats")
+async def context_packing_stats_endpoint():
+    """Comentários recebidos pelas sumarizações, duplicatas removidas, cortes pelo orçamento e tokens antes e depois."""
+    return context_packing_stats.stats()
+
+
+@app.get("/structured/stats")
+async def structured_stats():
+    """Saídas estruturadas válidas de primeira, consertadas pelo reparo local e descartadas."""
+    return structured_output_stats.stats()
+
+
+@app.get("/sentimentos/stats")
+async def sentimentos_stats():
+    """Quantos comentários o pré-classificador local respondeu e quantos foram para o LLM."""
+    return local_sentiment_router.stats()
+
+
+@app.post("/vector_db/reload")
+async def reload_vector_db(rebuild: bool = False):
+    """
+    Recarrega os índices FAISS compartilhados pelas rotas e pelas ferramentas
+    do agente. Com rebuild=True os índices são reconstruídos a partir do banco.
+    """
+    await run_blocking(retriever_registry.reload, rebuild=rebuild)
+    return {"status": "ok"}
+
+
+# Os filtros (FiltroReviews) chegam como query params, ex.:
+# /product_name/geladeira?product_brand=brastemp&max_rating=2&recommend_to_a_friend=No
 @app.get("/product_brand/{product_brand}")
-async def brands(product_brand: str):
-    return product_brand_retriever(product_brand)
+async def brands(product_brand: str, hybrid: bool = False, filtro: FiltroReviews = Depends()):
+    return await aretrieve("product_brand", product_brand, hybrid=hybrid, filtro=filtro)
 
 
 @app.get("/product_name/{product_name}")
-async def product_name(product_name: str):
-    return product_name_retriever(product_name)
+async def product_name(product_name: str, hybrid: bool = False, filtro: FiltroReviews = Depends()):
+    return await aretrieve("product_name", product_name, hybrid=hybrid, filtro=filtro)
 
 
 @app.get("/site_category_lv1/{site_category_lv1}")
-async def site_category_lv1(site_category_lv1: str):
-    return site_category_lv1_retriever(site_category_lv1)
+async def site_category_lv1(site_category_lv1: str, hybrid: bool = False, filtro: FiltroReviews = Depends()):
+    return await aretrieve("site_category_lv1", site_category_lv1, hybrid=hybrid, filtro=filtro)
 
 
 @app.get("/site_category_lv2/{site_category_lv2}")
-async def site_category_lv2(site_category_lv2: str):
-    return site_category_lv2_retriever(site_category_lv2)
+async def site_category_lv2(site_category_lv2: str, hybrid: bool = False, filtro: FiltroReviews = Depends()):
+    return await aretrieve("site_category_lv2", site_category_lv2, hybrid=hybrid, filtro=filtro)
+
+
+@app.get("/review_text/{review_text}")
+async def review_text(review_text: str, top_results: int = 10, filtro: FiltroReviews = Depends()):
+    """
+    Busca pelo conteúdo das reviews (título, texto, produto e marca): bm25 do
+    FTS5 fundido por RRF com a busca vetorial por nome de produto. Códigos de
+    modelo e outros identificadores exatos usam só a busca lexical.
+    """
+    return await aretrieve("review_text", review_text, top_results, filtro=filtro)
+
+
+@app.get("/stats/{dimension}")
+async def review_stats_ranking(dimension: str, order_by: str = "total", limit: int = 20, min_reviews: int = 1):
+    """
+    Ranking de produtos (product_id ou product_name), marcas ou categorias pelas estatísticas
+    materializadas: order_by = total, nota_media, pior_nota ou recomendacao.
+    """
+    if dimension not in STATS_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Dimensão inválida. Use uma de {STATS_DIMENSIONS}.")
+    if order_by not in STATS_ORDERINGS:
+        raise HTTPException(status_code=400, detail=f"order_by inválido. Use um de {tuple(STATS_ORDERINGS)}.")
+    return await run_blocking(select_top_review_stats, dimension, order_by, limit, min_reviews)
+
+
+@app.get("/stats/{dimension}/{value}")
+async def review_stats(dimension: str, value: str):
+    """
+    Histograma de notas, taxa de recomendação, total de reviews e participação
+    de cada sentimento (reviews enriquecidas) de um produto, marca ou categoria,
+    lidos da tabela review_stats, sem busca vetorial nem LLM.
+    """
+    if dimension not in STATS_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Dimensão inválida. Use uma de {STATS_DIMENSIONS}.")
+    stats = await run_blocking(select_review_stats, dimension, value)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"Nenhuma review para {dimension} = {value}.")
+    return stats
+
+
+@app.get("/retrievers/stats")
+async def retrievers_stats():
+    """Buscas híbridas completas e buscas que usaram só o caminho lexical (identificador ou timeout)."""
+    return hybrid_stats.stats()
 
 
 # @app.get("/search/{search_type}/{search_query}")
@@ -134,74 +270,299 @@ async def site_category_lv2(site_category_lv2: str):
 #                     'retriever_result': None,
 #                 }
             
+async def stream_per_comment(agent, list_comentarios, max_concurrency: int,
+                             from_enrichment: Optional[Callable] = None,
+                             prefilter: Optional[Callable] = None) -> AsyncIterator:
+    """
+    Executa o agente para cada comentário em paralelo, com no máximo
+    max_concurrency chamadas ao modelo em andamento, e produz pares
+    (posição, resultado) à medida que cada comentário fica pronto; a falha de
+    um comentário vira uma exceção no seu resultado.
+
+    Com from_enrichment, os comentários cujo Id já foi processado pelo job de
+    enriquecimento (config.enrichment), e cujo texto é o dessa review no
+    banco, são respondidos a partir do banco, convertidos por essa função, e
+    só os demais vão para o modelo.
+
+    Com prefilter, cada comentário restante passa antes por essa função, que
+    devolve o resultado calculado localmente ou None para enviá-lo ao modelo.
+    Respostas do banco e locais saem primeiro, antes de qualquer chamada ao modelo.
+    """
+    armazenados = {}
+    if from_enrichment is not None:
+        conferidos = await run_blocking(select_matching_review_ids, [
+            (c.review_id, c.comentario) for c in list_comentarios if c.review_id is not None])
+        armazenados = await run_blocking(select_enrichment, conferidos)
+
+    pendentes = []
+    for posicao, comentario in enumerate(list_comentarios):
+        if comentario.review_id in armazenados:
+            yield posicao, from_enrichment(armazenados[comentario.review_id])
+            continue
+        resultado = prefilter(comentario) if prefilter is not None else None
+        if resultado is not None:
+            yield posicao, resultado
+        else:
+            pendentes.append(posicao)
+
+    async for i, resultado in agent.abatch_as_completed(
+        [{"query": list_comentarios[posicao]} for posicao in pendentes],
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    ):
+        yield pendentes[i], resultado
+
+
+async def invoke_per_comment(agent, list_comentarios, max_concurrency: int,
+                             from_enrichment: Optional[Callable] = None,
+                             prefilter: Optional[Callable] = None):
+    """Como stream_per_comment, mas devolve todos os resultados na ordem de entrada."""
+    resultados = [None] * len(list_comentarios)
+    async for posicao, resultado in stream_per_comment(agent, list_comentarios, max_concurrency,
+                                                       from_enrichment, prefilter):
+        resultados[posicao] = resultado
+    return resultados
+
+
+def ndjson(linhas: AsyncIterator) -> StreamingResponse:
+    """Resposta NDJSON: um objeto JSON por linha, enviado assim que fica pronto."""
+    async def corpo():
+        async for linha in linhas:
+            yield json.dumps(jsonable_encoder(linha), ensure_ascii=False) + "\n"
+    return StreamingResponse(corpo(), media_type="application/x-ndjson")
+
+
+def sse(eventos: AsyncIterator) -> StreamingResponse:
+    """Resposta Server-Sent Events a partir de pares (evento, dados)."""
+    async def corpo():
+        async for evento, dados in eventos:
+            yield f"event: {evento}\ndata: {json.dumps(jsonable_encoder(dados), ensure_ascii=False)}\n\n"
+    return StreamingResponse(corpo(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def stats_context(search: str, query: str, filtro: Optional[FiltroReviews]) -> str:
+    """
+    Estatísticas materializadas do item pesquisado, formatadas para o prompt de
+    sumarização: o produto, a marca ou a categoria buscada, ou o produto do filtro product_id.
+    """
+    if search in STATS_DIMENSIONS:
+        stats = await run_blocking(select_review_stats, search, query)
+    elif filtro is not None and filtro.product_id is not None:
+        stats = await run_blocking(select_review_stats, "product_id", filtro.product_id)
+    else:
+        stats = None
+    return format_stats_context(stats)
+
+
+async def coalesced(nome: str, entrada, compute):
+    """
+    Executa compute() uma única vez para requisições idênticas simultâneas
+    (mesmo endpoint e mesma entrada normalizada); as demais aguardam e
+    recebem o mesmo resultado.
+    """
+    return await agent_flight.do(flight_key(nome, entrada), compute)
+
+
+def local_sentimentos(comentario) -> Optional[SentimentosModel]:
+    """Porcentagens de um comentário claro respondidas pelo pré-classificador local."""
+    label = local_sentiment_router.classify(comentario)
+    return aggregate_sentiments([label]) if label is not None else None
+
+
 @app.post("/sentimentos")
-async def sentimentos(dados: ComentariosInput):
+async def sentimentos(dados: ComentariosInput, max_concurrency: int = LLM_MAX_CONCURRENCY):
     list_comentarios = dados.comentarios
-    model = app.consts.model
-    agent_sentimentos = get_agent_sentimentos(model)
+    agent_sentimentos = get_agent("sentimentos")
     listResult = []
-    for comment in list_comentarios:
-        sentimentos = agent_sentimentos.invoke({"query":comment})
+    resultados = await coalesced("sentimentos", dados, lambda: invoke_per_comment(
+        agent_sentimentos, list_comentarios, max_concurrency,
+        from_enrichment=lambda armazenado: SentimentosModel(**armazenado["percentuais"]),
+        prefilter=local_sentimentos,
+    ))
+    for sentimentos in resultados:
+        if isinstance(sentimentos, Exception):
+            sentimentos = {"erro": str(sentimentos)}
         listResult.append(sentimentos)
     return {
         "sentimentos":listResult
     }  
 
+@app.post("/sentimentos/stream")
+async def sentimentos_stream(dados: ComentariosInput, max_concurrency: int = LLM_MAX_CONCURRENCY):
+    """
+    Igual a /sentimentos, mas em NDJSON: uma linha {"indice", "sentimentos"}
+    (ou {"indice", "erro"}) por comentário, assim que ele fica pronto.
+    """
+    async def linhas():
+        async for posicao, sentimentos in stream_per_comment(
+            get_agent("sentimentos"), dados.comentarios, max_concurrency,
+            from_enrichment=lambda armazenado: SentimentosModel(**armazenado["percentuais"]),
+            prefilter=local_sentimentos,
+        ):
+            if isinstance(sentimentos, Exception):
+                yield {"indice": posicao, "erro": str(sentimentos)}
+            else:
+                yield {"indice": posicao, "sentimentos": sentimentos}
+    return ndjson(linhas())
+
+@app.post("/sentimentos/agregado")
+async def sentimentos_agregado(dados: ComentariosInput, max_concurrency: int = LLM_MAX_CONCURRENCY):
+    """
+    Classifica cada comentário como POSITIVO, NEGATIVO ou NEUTRO (rótulos
+    guardados por Id de review) e calcula as porcentagens do conjunto a partir
+    da contagem dos rótulos, sem pedir os números ao modelo.
+    """
+    list_comentarios = dados.comentarios
+    rotulos = await coalesced("sentimentos/agregado", dados, lambda: classify_comments(
+        get_agent("classificador_sentimento"), list_comentarios, max_concurrency))
+    validos = [rotulo for rotulo in rotulos if not isinstance(rotulo, Exception)]
+    return {
+        "sentimentos": aggregate_sentiments(validos),
+        "rotulos": [{"erro": str(rotulo)} if isinstance(rotulo, Exception) else rotulo for rotulo in rotulos],
+        "total": len(validos),
+    }
+
 @app.post("/gerador_topicos")
-async def gerador_topicos(dados: ComentariosInput):
+async def gerador_topicos(dados: ComentariosInput, max_concurrency: int = LLM_MAX_CONCURRENCY):
     list_comentarios = dados.comentarios
-    model = app.consts.model
-    agent_gerador_topicos = get_agent_gerador_topicos(model)
+    agent_gerador_topicos = get_agent("gerador_topicos")
     listResult = []
-    for comentario in list_comentarios:
-        obj_comentario_topico = {}
-        topicos = agent_gerador_topicos.invoke({"query":comentario})
-        obj_comentario_topico["comentario"] = comentario
-        obj_comentario_topico["topicos_principais"] = topicos
-        listResult.append(obj_comentario_topico)
+    resultados = await coalesced("gerador_topicos", dados, lambda: invoke_per_comment(
+        agent_gerador_topicos, list_comentarios, max_concurrency,
+        from_enrichment=lambda armazenado: Topics(extracted_topics=armazenado["topicos"]),
+    ))
+    for comentario, topicos in zip(list_comentarios, resultados):
+        listResult.append(comentario_topico(comentario, topicos))
     return {
         "result":listResult
     }
 
+def comentario_topico(comentario, topicos) -> Dict:
+    obj_comentario_topico = {}
+    obj_comentario_topico["comentario"] = comentario
+    if isinstance(topicos, Exception):
+        obj_comentario_topico["topicos_principais"] = None
+        obj_comentario_topico["erro"] = str(topicos)
+    else:
+        obj_comentario_topico["topicos_principais"] = topicos
+    return obj_comentario_topico
+
+@app.post("/gerador_topicos/stream")
+async def gerador_topicos_stream(dados: ComentariosInput, max_concurrency: int = LLM_MAX_CONCURRENCY):
+    """
+    Igual a /gerador_topicos, mas em NDJSON: uma linha por comentário, com o
+    campo "indice" (posição na entrada), enviada assim que o comentário fica pronto.
+    """
+    async def linhas():
+        async for posicao, topicos in stream_per_comment(
+            get_agent("gerador_topicos"), dados.comentarios, max_concurrency,
+            from_enrichment=lambda armazenado: Topics(extracted_topics=armazenado["topicos"]),
+        ):
+            yield {"indice": posicao, **comentario_topico(dados.comentarios[posicao], topicos)}
+    return ndjson(linhas())
+
 @app.post("/sumarizacao")
 async def sumarizador(dados: ComentariosInput):
     list_comentarios = dados.comentarios
-    model = app.consts.model
-    agent_sumarizacao = get_agent_sumarizacao(model)
-    result = agent_sumarizacao.invoke({"query":list_comentarios})
+    agent_sumarizacao = get_agent("sumarizacao_map_reduce")
+    result = await coalesced("sumarizacao", dados, lambda: agent_sumarizacao.ainvoke({"query":list_comentarios}))
     return result
 
+async def stream_summary(agent_sumarizacao, entrada) -> AsyncIterator:
+    """
+    Eventos da sumarização: "token" com cada pedaço novo do texto do resumo
+    (nas etapas de map e de reduce), "resultado" com o resumo final ou "erro".
+    O modelo gera JSON ({"resumo_final": "..."}), então os tokens são extraídos
+    do valor de resumo_final à medida que ele chega: os tokens de um run_id,
+    juntos, formam o resumo daquela etapa, e os da última, o resumo final.
+    """
+    resumos: Dict[str, JsonFieldStream] = {}
+    try:
+        async for evento in agent_sumarizacao.astream_events(entrada, version="v2"):
+            if evento["event"] == "on_chat_model_stream" and evento["data"]["chunk"].content:
+                resumo = resumos.setdefault(evento["run_id"], JsonFieldStream("resumo_final"))
+                token = resumo.feed(evento["data"]["chunk"].content)
+                if token:
+                    yield "token", {"token": token, "run_id": evento["run_id"]}
+            elif evento["event"] == "on_chain_end" and evento["name"] == "sumarizacao_map_reduce":
+                yield "resultado", evento["data"]["output"]
+    except Exception as exc:
+        yield "erro", {"erro": str(exc)}
+
+@app.post("/sumarizacao/stream")
+async def sumarizador_stream(dados: ComentariosInput):
+    """Igual a /sumarizacao, mas em Server-Sent Events, com os tokens à medida que são gerados."""
+    return sse(stream_summary(get_agent("sumarizacao_map_reduce"), {"query": dados.comentarios}))
+
 
 
 @app.post("/chat")
-async def chat(message: str):
+async def chat(message: str, session_id: Optional[str] = None):
     """
     Este endpoint agora invoca o agente de chat RAG que foi instanciado em startup.
     Ele possui:
-      - Memória de conversa (ConversationBufferMemory),
+      - Memória de conversa por sessão, persistida em SQLite (checkpointer do LangGraph),
       - Ferramentas FAISS (@tool),
-    Basta chamar `.run(message)` que o agente cuidará de:
+    O cliente envia o session_id da conversa; sem ele uma nova sessão é criada
+    e o id é devolvido para ser usado nas próximas mensagens. O agente cuidará de:
       1) Recuperação via FAISS (caso julgue necessário),
-      2) Incluir histórico no prompt,
+      2) Incluir o histórico (resumo + mensagens recentes) no prompt,
       3) Gerar resposta com base no modelo de AI
-      4) Armazenar tudo em memória para chamadas futuras.
+      4) Armazenar tudo no checkpointer para chamadas futuras.
     """
     # Chama o agente RAG que foi criado em startup
-    model = app.consts.model
-    agent_chat = get_agent_chat_rag(model)
-    config = {"configurable": {"thread_id": "1"}}
-    response = agent_chat.invoke({"input": message},config=config)
-    return {"resposta": response}
+    session_id = session_id or uuid.uuid4().hex
+    agent_chat = get_agent("chat_rag")
+    config = {"configurable": {"thread_id": session_id}}
+    response = await agent_chat.ainvoke({"messages": [("user", message)]}, config=config)
+    return {"resposta": response["messages"][-1].content, "session_id": session_id}
+
+
+@app.post("/chat/stream")
+async def chat_stream(message: str, session_id: Optional[str] = None):
+    """
+    Igual a /chat, mas em Server-Sent Events: "sessao" com o session_id,
+    "token" com cada pedaço da resposta do assistente e "fim" com a resposta
+    completa. As chamadas às ferramentas e o resumo do histórico não geram tokens.
+    """
+    session_id = session_id or uuid.uuid4().hex
+    agent_chat = get_agent("chat_rag")
+    config = {"configurable": {"thread_id": session_id}}
+
+    async def eventos():
+        yield "sessao", {"session_id": session_id}
+        resposta = []
+        try:
+            async for chunk, metadata in agent_chat.astream({"messages": [("user", message)]},
+                                                            config=config, stream_mode="messages"):
+                if metadata.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+                    continue
+                if chunk.tool_call_chunks:
+                    # turno que chama ferramenta: o texto final ainda está por vir
+                    resposta.clear()
+                    continue
+                if chunk.content:
+                    resposta.append(chunk.content)
+                    yield "token", {"token": chunk.content}
+        except Exception as exc:
+            yield "erro", {"erro": str(exc)}
+            return
+        yield "fim", {"resposta": "".join(resposta), "session_id": session_id}
+
+    return sse(eventos())
 
 
 
 from fastapi import HTTPException
 
 @app.get("/sentimento_geral/{search}/{query}/{qtd_comentario}")
-async def sentimento_geral(search: str, query: str, qtd_comentario: str):
+async def sentimento_geral(search: str, query: str, qtd_comentario: str, filtro: FiltroReviews = Depends()):
     """
     Esse endpoint invoca o agente de sentimento geral que busca os comentários
-    e devolve um objeto SentimentosModel como dict.
+    e devolve um objeto SentimentosModel como dict. Os filtros (marca, notas,
+    recomendação, datas) são aplicados no SQL antes da busca vetorial, então
+    só as reviews relevantes chegam ao modelo.
     """
     try:
         qtd_comentario = int(qtd_comentario)
@@ -212,24 +573,42 @@ async def sentimento_geral(search: str, query: str, qtd_comentario: str):
         raise HTTPException(status_code=400, detail="qtd_comentario deve ser maior que zero.")
 
     match search:
-        case 'product_brand':
-            retriever_result = product_brand_retriever(query, qtd_comentario)
-        case 'product_name':
-            retriever_result = product_name_retriever(query, qtd_comentario)
-        case 'site_category_lv1':
-            retriever_result = site_category_lv1_retriever(query, qtd_comentario)
-        case 'site_category_lv2':
-            retriever_result = site_category_lv2_retriever(query, qtd_comentario)
+        case 'product_brand' | 'product_name' | 'site_category_lv1' | 'site_category_lv2' | 'review_text':
+            pass
         case _:
             raise HTTPException(status_code=400, detail="Parâmetro 'search' inválido.")
 
-    model = app.consts.model
-    agent_sumarizacao = get_agent_sumarizacao(model)
-    result = agent_sumarizacao.invoke({"query": retriever_result})
+    async def compute():
+        retriever_result = await aretrieve(search, query, qtd_comentario, filtro=filtro)
+        contexto = await stats_context(search, query, filtro)
+        agent_sumarizacao = get_agent("sumarizacao_map_reduce")
+        return await agent_sumarizacao.ainvoke({"query": retriever_result, "contexto": contexto})
+
+    # Várias chamadas simultâneas para a mesma página compartilham busca e geração
+    result = await coalesced("sentimento_geral", (search, query, qtd_comentario, filtro), compute)
 
     return result
 
 
+@app.get("/sentimento_geral/{search}/{query}/{qtd_comentario}/stream")
+async def sentimento_geral_stream(search: str, query: str, qtd_comentario: int,
+                                  filtro: FiltroReviews = Depends()):
+    """Igual a /sentimento_geral, mas em Server-Sent Events (mesmos eventos de /sumarizacao/stream)."""
+    if qtd_comentario <= 0:
+        raise HTTPException(status_code=400, detail="qtd_comentario deve ser maior que zero.")
+    if search not in ('product_brand', 'product_name', 'site_category_lv1', 'site_category_lv2', 'review_text'):
+        raise HTTPException(status_code=400, detail="Parâmetro 'search' inválido.")
+
+    async def eventos():
+        retriever_result = await aretrieve(search, query, qtd_comentario, filtro=filtro)
+        yield "comentarios", {"total": len(retriever_result)}
+        entrada = {"query": retriever_result, "contexto": await stats_context(search, query, filtro)}
+        async for evento in stream_summary(get_agent("sumarizacao_map_reduce"), entrada):
+            yield evento
+
+    return sse(eventos())
+
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List,Optional
+from typing import List,Optional,Union
 
 class ComentarioInput(BaseModel):
     categoria_principal: Optional[str] = Field(..., alias="Categoria Principal")
@@ -10,11 +10,21 @@ class ComentarioInput(BaseModel):
     avaliacao_geral: int = Field(..., alias="Avaliação Geral")
     recomendaria_a_um_amigo: Optional[str] = Field(..., alias="Recomendaria a um amigo")
     comentario: Optional[str] = Field(..., alias="Comentário")
-    id: Optional[str] = Field(..., alias="Id")
+    id: Optional[Union[int, str]] = Field(..., alias="Id")
 
     class Config:
         allow_population_by_field_name = True
 
+    @property
+    def review_id(self) -> Optional[int]:
+        """
+        Id numérico da review na tabela reviews, quando o comentário veio do
+        banco. Aceita o Id como número (saída de format_docs) ou como texto.
+        """
+        if isinstance(self.id, int) and not isinstance(self.id, bool):
+            return self.id
+        return int(self.id) if isinstance(self.id, str) and self.id.isdigit() else None
+
 class ComentariosInput(BaseModel):
     comentarios: List[ComentarioInput]
     
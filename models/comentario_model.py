@@ -8,7 +8,7 @@ class Comentario(BaseModel):
     product_brand:Optional[str]
     site_category_lv1:Optional[str]
     site_category_lv2:Optional[str]
-    overall_rating:Optional[str]
+    overall_rating:Optional[int]
     review_title:Optional[str]
     recommend_to_a_friend:Optional[str]
     review_text:Optional[str]
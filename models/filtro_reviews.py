@@ -0,0 +1,18 @@
+from datetime import date
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+
+
+class FiltroReviews(BaseModel):
+    product_id: Optional[str] = Field(None, description="Id exato do produto")
+    product_brand: Optional[str] = Field(None, description="Marca (sem diferenciar maiúsculas)")
+    site_category_lv1: Optional[str] = Field(None, description="Categoria de nível 1 (sem diferenciar maiúsculas)")
+    site_category_lv2: Optional[str] = Field(None, description="Categoria de nível 2 (sem diferenciar maiúsculas)")
+    min_rating: Optional[int] = Field(None, ge=1, le=5, description="Nota mínima (1 a 5)")
+    max_rating: Optional[int] = Field(None, ge=1, le=5, description="Nota máxima (1 a 5)")
+    recommend_to_a_friend: Optional[Literal["Yes", "No"]] = Field(None, description="Recomendaria a um amigo")
+    submitted_after: Optional[date] = Field(None, description="Data mínima de envio (AAAA-MM-DD)")
+    submitted_before: Optional[date] = Field(None, description="Data máxima de envio (AAAA-MM-DD)")
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in self.model_dump().values())
@@ -1,7 +1,16 @@
 from pydantic import BaseModel, Field
+from typing import List, Literal
 
 class SentimentosModel(BaseModel):
     Positivos: str = Field(..., description="Porcentagem de sentimentos positivos")
     Negativos: str = Field(..., description="Porcentagem de sentimentos negativos")
     Neutros: str = Field(..., description="Porcentagem de sentimentos neutros")
 
+
+class SentimentoComentario(BaseModel):
+    sentimento: Literal["POSITIVO", "NEGATIVO", "NEUTRO"] = Field(..., description="Sentimento do comentário")
+
+
+class SentimentosLote(BaseModel):
+    sentimentos: List[Literal["POSITIVO", "NEGATIVO", "NEUTRO"]] = Field(
+        ..., description="Sentimento de cada comentário, na mesma ordem da entrada")
@@ -1,11 +1,11 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
 from langchain_core.documents import Document
 
-from config.vectorstore import generate_vector_db_to_retrieve_by_product_name, \
-    generate_vector_db_to_retrieve_by_product_brand, generate_vector_db_to_retrieve_by_site_category_lv1, \
-    generate_vector_db_to_retrieve_by_site_category_lv2
+from config.registry import retriever_registry
+from config.singleflight import aretriever_flight, flight_key, retriever_flight
 from models.comentario_model import Comentario
+from models.filtro_reviews import FiltroReviews
 
 
 def format_docs(documents):
@@ -15,14 +15,15 @@ def format_docs(documents):
     """
 
     label_map = {
-        "product_id":"Id",
+        "review_id": "Id",
+        "product_id": "Id do Produto",
         "product_name": "Produto",
         "product_brand": "Marca",
         "site_category_lv1": "Categoria",
         "site_category_lv2": "Subcategoria",
-        "overall_rating": "Título da Avaliação",
-        "review_title": "Recomendaria a um amigo",
-        "recommend_to_a_friend": "Avaliação Geral",
+        "review_title": "Título da Avaliação",
+        "overall_rating": "Avaliação Geral",
+        "recommend_to_a_friend": "Recomendaria a um amigo",
         "review_text": "Comentário"
     }
 
@@ -45,7 +46,32 @@ def format_docs(documents):
     return formatted
 
 
-def product_name_retriever(product_name: Annotated[str, 'product name quoted by the employee'], top_results:int = 10):
+# Pseudo-field for full-text search over review titles and texts: hybrid retrieval
+# (FTS5 + the vector index of HYBRID_VECTOR_FIELD) with no vector index of its own
+REVIEW_TEXT_FIELD = "review_text"
+HYBRID_VECTOR_FIELD = "product_name"
+
+
+def _get_retriever(field: str, top_results: int, hybrid: bool, filtro: Optional[FiltroReviews]):
+    if field == REVIEW_TEXT_FIELD:
+        return retriever_registry.get_hybrid_retriever(HYBRID_VECTOR_FIELD, top_k=top_results, filtro=filtro)
+    if hybrid:
+        return retriever_registry.get_hybrid_retriever(field, top_k=top_results, filtro=filtro)
+    return retriever_registry.get_retriever(field, top_k=top_results, filtro=filtro)
+
+
+def _retrieve(field: str, query: str, top_results: int, hybrid: bool = False,
+              filtro: Optional[FiltroReviews] = None):
+    """ Runs one field search; identical searches already in flight share the same result. """
+    def compute():
+        retriever = _get_retriever(field, top_results, hybrid, filtro)
+        return format_docs(retriever.invoke(query))
+
+    return retriever_flight.do(flight_key(field, query, top_results, hybrid, filtro), compute)
+
+
+def product_name_retriever(product_name: Annotated[str, 'product name quoted by the employee'], top_results:int = 10, hybrid: bool = False,
+                           filtro: Optional[FiltroReviews] = None):
     """" Retrieves up to 10 database products names matching the user's input.
 
     Args:
@@ -54,12 +80,11 @@ def product_name_retriever(product_name: Annotated[str, 'product name quoted by
     returns:
         str: A string with 10 similar product names
     """
-    retriever = generate_vector_db_to_retrieve_by_product_name(top_k=top_results)
-    retrieved_docs = format_docs(retriever.invoke(product_name))
-    return retrieved_docs
+    return _retrieve("product_name", product_name, top_results, hybrid, filtro)
 
 
-def product_brand_retriever(product_brand: Annotated[str, 'product brand quoted by the employee'], top_results:int = 10):
+def product_brand_retriever(product_brand: Annotated[str, 'product brand quoted by the employee'], top_results:int = 10, hybrid: bool = False,
+                            filtro: Optional[FiltroReviews] = None):
     """" Retrieves up to 10 database products brands matching the user's input.
 
     Args:
@@ -68,12 +93,11 @@ def product_brand_retriever(product_brand: Annotated[str, 'product brand quoted
     returns:
         str: A string with 10 similar product brands
     """
-    retriever = generate_vector_db_to_retrieve_by_product_brand(top_k=top_results)
-    retrieved_docs = format_docs(retriever.invoke(product_brand))
-    return retrieved_docs
+    return _retrieve("product_brand", product_brand, top_results, hybrid, filtro)
 
 
-def site_category_lv1_retriever(site_category_lv1: Annotated[str, 'site category lv1 quoted by the employee'], top_results:int = 10):
+def site_category_lv1_retriever(site_category_lv1: Annotated[str, 'site category lv1 quoted by the employee'], top_results:int = 10, hybrid: bool = False,
+                                filtro: Optional[FiltroReviews] = None):
     """" Retrieves up to 10 database gategory lv1 matching the user's input.
 
     Args:
@@ -82,12 +106,11 @@ def site_category_lv1_retriever(site_category_lv1: Annotated[str, 'site category
     returns:
         str: A string with 10 similar category lv1
     """
-    retriever = generate_vector_db_to_retrieve_by_site_category_lv1(top_k=top_results)
-    retrieved_docs = format_docs(retriever.invoke(site_category_lv1))
-    return retrieved_docs
+    return _retrieve("site_category_lv1", site_category_lv1, top_results, hybrid, filtro)
 
 
-def site_category_lv2_retriever(site_category_lv2: Annotated[str, 'site category lv2 quoted by the employee'], top_results:int = 10):
+def site_category_lv2_retriever(site_category_lv2: Annotated[str, 'site category lv2 quoted by the employee'], top_results:int = 10, hybrid: bool = False,
+                                filtro: Optional[FiltroReviews] = None):
     """" Retrieves up to 10 database gategory lv2 matching the user's input.
 
     Args:
@@ -96,6 +119,43 @@ def site_category_lv2_retriever(site_category_lv2: Annotated[str, 'site category
     returns:
         str: A string with 10 similar category lv2
     """
-    retriever = generate_vector_db_to_retrieve_by_site_category_lv2(top_k=top_results)
-    retrieved_docs = format_docs(retriever.invoke(site_category_lv2))
-    return retrieved_docs
\ No newline at end of file
+    return _retrieve("site_category_lv2", site_category_lv2, top_results, hybrid, filtro)
+
+
+def review_text_retriever(review_text: Annotated[str, 'words or identifiers quoted by the employee'], top_results:int = 10,
+                          filtro: Optional[FiltroReviews] = None):
+    """" Retrieves up to 10 reviews whose title, text, product name or brand match the user's input.
+    Uses hybrid retrieval (BM25 over the review text fused with the product name vectors);
+    exact identifiers such as model numbers skip the embedding round-trip.
+
+    Args:
+        review_text(str): Words, phrases or identifiers to look for
+
+    returns:
+        str: A string with 10 matching reviews
+    """
+    return _retrieve(REVIEW_TEXT_FIELD, review_text, top_results, filtro=filtro)
+
+
+async def aretrieve(field: str, query: str, top_results: int = 10, hybrid: bool = False,
+                    filtro: Optional[FiltroReviews] = None):
+    """ Async version of the field retrievers above, used by the FastAPI routes.
+
+    Args:
+        field(str): The indexed field (product_name, product_brand, site_category_lv1 or site_category_lv2),
+            or review_text for full-text search over the reviews
+        query(str): The user's input
+        top_results(int): How many reviews to return
+        hybrid(bool): Fuse the field's vector results with BM25 over the review text
+        filtro(FiltroReviews): SQL-side filters (brand, categories, rating range, recommendation,
+            dates); the vector search only runs over the reviews that pass them
+
+    returns:
+        list: The formatted reviews. Concurrent identical searches (same field,
+        normalised query and top_results) share one computation and its result.
+    """
+    async def compute():
+        retriever = _get_retriever(field, top_results, hybrid, filtro)
+        return format_docs(await retriever.ainvoke(query))
+
+    return await aretriever_flight.do(flight_key(field, query, top_results, hybrid, filtro), compute)
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+from config.batching import MicroBatcher
+
+
+def _blocking_batcher():
+    """MicroBatcher de um lote por vez cujo batch_fn espera `liberar`; registra os lotes recebidos."""
+    liberar = threading.Event()
+    lotes = []
+
+    def batch_fn(itens):
+        lotes.append(list(itens))
+        liberar.wait(timeout=5)
+        return [item * 10 for item in itens]
+
+    return MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50, max_concurrency=1, name="teste"), liberar, lotes
+
+
+def test_cancelled_caller_while_queued_does_not_strand_batch_mates():
+    batcher, liberar, lotes = _blocking_batcher()
+
+    async def cenario():
+        primeiro = asyncio.ensure_future(batcher.acall(1))
+        await asyncio.sleep(0.2)  # primeiro lote em andamento, ocupando a única vaga
+        cancelado = asyncio.ensure_future(batcher.acall(2))
+        vizinho = asyncio.ensure_future(batcher.acall(3))
+        await asyncio.sleep(0.2)  # segundo lote formado, esperando a vaga
+        cancelado.cancel()
+        await asyncio.sleep(0.05)
+        liberar.set()
+        return await asyncio.wait_for(asyncio.gather(primeiro, vizinho), timeout=5)
+
+    assert asyncio.run(cenario()) == [10, 30]
+    assert lotes == [[1], [3]]
+
+
+def test_cancelled_caller_during_batch_does_not_strand_batch_mates():
+    batcher, liberar, lotes = _blocking_batcher()
+
+    async def cenario():
+        cancelado = asyncio.ensure_future(batcher.acall(1))
+        vizinho = asyncio.ensure_future(batcher.acall(2))
+        await asyncio.sleep(0.2)  # os dois no mesmo lote, já dentro de batch_fn
+        cancelado.cancel()
+        await asyncio.sleep(0.05)
+        liberar.set()
+        return await asyncio.wait_for(vizinho, timeout=5)
+
+    assert asyncio.run(cenario()) == 20
+    assert lotes == [[1, 2]]
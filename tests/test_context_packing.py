@@ -0,0 +1,31 @@
+from config.context_packing import context_packing_stats, pack_context
+from config.tokens import estimate_tokens
+
+
+def _reviews(n):
+    return [{"Produto": f"Produto {i % 3}", "Título da Avaliação": f"Avaliação {i}",
+             "Comentário": f"comentário {i} " + " ".join(f"palavra{i}x{j}" for j in range(30))} for i in range(n)]
+
+
+def test_pack_context_without_budget_keeps_every_review_in_chunks():
+    reviews = _reviews(40)
+    antes = context_packing_stats.stats()["cortados_pelo_orcamento"]
+
+    blocos = pack_context(reviews, None, chunk_tokens=400)
+
+    incluidos = [a for bloco in blocos for grupo in bloco for a in grupo["Avaliações"]]
+    assert len(incluidos) == len(reviews)
+    assert len(blocos) > 1
+    assert all(estimate_tokens(bloco) <= 600 for bloco in blocos)
+    assert context_packing_stats.stats()["cortados_pelo_orcamento"] == antes
+
+
+def test_pack_context_reports_reviews_cut_by_budget():
+    reviews = _reviews(40)
+    antes = context_packing_stats.stats()["cortados_pelo_orcamento"]
+
+    blocos = pack_context(reviews, token_budget=500)
+
+    incluidos = sum(len(grupo["Avaliações"]) for grupo in blocos[0])
+    assert 0 < incluidos < len(reviews)
+    assert context_packing_stats.stats()["cortados_pelo_orcamento"] - antes == len(reviews) - incluidos
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from config.embedding_cache import CachedEmbeddings
+
+
+class _Embeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 2.0]
+
+
+def test_async_embeddings_keep_cache_io_off_the_event_loop(tmp_path):
+    cache = CachedEmbeddings(_Embeddings(), "teste", cache_file=str(tmp_path / "cache.db"))
+    threads = []
+    for metodo in ("_lookup", "_store"):
+        original = getattr(cache, metodo)
+
+        def registrado(*args, _original=original):
+            threads.append(threading.current_thread().name)
+            return _original(*args)
+
+        setattr(cache, metodo, registrado)
+
+    async def cenario():
+        documentos = await cache.aembed_documents(["ab", "abc", "ab"])
+        return documentos, await cache.aembed_query("abcd"), await cache.aembed_query("abcd")
+
+    assert asyncio.run(cenario()) == ([[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]], [4.0, 2.0], [4.0, 2.0])
+    assert len(threads) == 5
+    assert all(nome.startswith("blocking") for nome in threads)
@@ -0,0 +1,27 @@
+from datetime import date
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from config.database import review_filter_sql
+from models.filtro_reviews import FiltroReviews
+
+app = FastAPI()
+
+
+@app.get("/filtro")
+def filtro_endpoint(filtro: FiltroReviews = Depends()):
+    return review_filter_sql(filtro)[1]
+
+
+def test_submission_dates_are_parsed_and_bound_as_iso_strings():
+    resposta = TestClient(app).get("/filtro", params={"submitted_after": "2018-01-05",
+                                                      "submitted_before": "2018-02-01"})
+    assert resposta.status_code == 200
+    assert resposta.json() == ["2018-01-05", "2018-02-01"]
+    assert FiltroReviews(submitted_after="2018-01-05").submitted_after == date(2018, 1, 5)
+
+
+def test_malformed_submission_date_is_rejected_with_422():
+    for valor in ("05/01/2018", "2018-13-01", "ontem"):
+        assert TestClient(app).get("/filtro", params={"submitted_after": valor}).status_code == 422
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import pytest
+
+import config.hybrid as hybrid
+from config.hybrid import HybridRetriever, hybrid_stats
+from config.vectorstore import MultiFieldVectorStore
+
+
+class _Store(MultiFieldVectorStore):
+    """Store sem índice: search_reviews / asearch_reviews delegam para `busca`."""
+
+    def __init__(self, busca):
+        self.busca = busca
+
+    def search_reviews(self, field, query, top_k, filtro=None):
+        return self.busca()
+
+    async def asearch_reviews(self, field, query, top_k, filtro=None):
+        return self.busca()
+
+
+@pytest.fixture(autouse=True)
+def _sem_banco(monkeypatch):
+    monkeypatch.setattr(hybrid, "search_fts", lambda query, limit, filtro=None, exact=False: [(1, -2.0), (2, -1.0)])
+    monkeypatch.setattr(hybrid, "select_reviews_by_ids", lambda ids: [{"review_id": i} for i in ids])
+
+
+def _ids(documentos):
+    return [doc.metadata["review_id"] for doc in documentos]
+
+
+def _falha():
+    raise RuntimeError("ollama fora do ar")
+
+
+def test_vector_error_falls_back_to_lexical_ranking():
+    retriever = HybridRetriever(store=_Store(_falha), top_k=2)
+    antes = hybrid_stats.stats()["lexicas_erro"]
+
+    assert _ids(retriever.invoke("fone sem fio")) == [1, 2]
+    assert _ids(asyncio.run(retriever.ainvoke("fone sem fio"))) == [1, 2]
+    assert hybrid_stats.stats()["lexicas_erro"] - antes == 2
+
+
+def test_timed_out_vector_searches_are_bounded(monkeypatch):
+    monkeypatch.setattr(hybrid, "_VECTOR_SLOTS", threading.BoundedSemaphore(2))
+    liberar = threading.Event()
+    retriever = HybridRetriever(store=_Store(lambda: liberar.wait(5) and [(3, "fone")]), top_k=3,
+                                vector_timeout=0.05)
+    antes = hybrid_stats.stats()
+
+    for _ in range(4):
+        assert _ids(retriever.invoke("fone sem fio")) == [1, 2]
+    depois = hybrid_stats.stats()
+    assert depois["lexicas_timeout"] - antes["lexicas_timeout"] == 2
+    assert depois["lexicas_saturado"] - antes["lexicas_saturado"] == 2
+
+    liberar.set()  # as buscas abandonadas terminam e devolvem as vagas
+    for _ in range(2):
+        assert hybrid._VECTOR_SLOTS.acquire(timeout=5)
+    for _ in range(2):
+        hybrid._VECTOR_SLOTS.release()
+    assert 3 in _ids(retriever.invoke("fone sem fio"))
+    assert hybrid_stats.stats()["hibridas"] - antes["hibridas"] == 1
@@ -0,0 +1,49 @@
+import csv
+
+import pytest
+
+import config.database as database
+
+COLUNAS = ("submission_date", "reviewer_id", "product_id", "product_name", "product_brand", "site_category_lv1",
+           "site_category_lv2", "review_title", "overall_rating", "recommend_to_a_friend", "review_text",
+           "reviewer_birth_year", "reviewer_gender", "reviewer_state")
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "reviews.db"))
+    arquivo = tmp_path / "reviews.csv"
+    with open(arquivo, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(COLUNAS)
+        for i, (marca, nota) in enumerate([("Samsung", 5), ("SAMSUNG", 4), ("samsung", 1), ("LG", 3)]):
+            escritor.writerow(["2018-01-01", f"r{i}", f"p{i}", f"produto {i}", marca, "Eletrônicos", "TV",
+                               f"título {i}", nota, "Yes" if nota > 3 else "No", f"texto {i}", 1980, "M", "SP"])
+    database.csv_to_sqlite(str(arquivo))
+    return arquivo
+
+
+def test_case_variants_are_aggregated_into_one_stats_row(banco):
+    database.refresh_review_stats()
+
+    stats = database.select_review_stats("product_brand", "samsung")
+    assert stats["total_reviews"] == 3
+    assert stats["histograma_notas"] == {"1": 1, "2": 0, "3": 0, "4": 1, "5": 1}
+    marcas = database.select_top_review_stats("product_brand")
+    assert sorted(row["total_reviews"] for row in marcas) == [1, 3]
+
+
+def test_stats_table_without_nocase_is_rebuilt(banco):
+    conn, cursor = database.get_connection()
+    with conn:
+        database.create_stats_tables(cursor)
+        cursor.execute("DROP TABLE review_stats;")
+        cursor.execute("CREATE TABLE review_stats (dimension TEXT NOT NULL, value TEXT NOT NULL, label TEXT, "
+                       + ", ".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in database.STATS_COUNTERS)
+                       + ", PRIMARY KEY (dimension, value));")
+        cursor.execute("INSERT INTO review_stats (dimension, value, total) VALUES ('product_brand', 'Samsung', 1);")
+        cursor.execute("UPDATE review_stats_state SET last_review_id = 4;")
+    conn.close()
+
+    assert database.refresh_review_stats() == 4
+    assert database.select_review_stats("product_brand", "SAMSUNG")["total_reviews"] == 3
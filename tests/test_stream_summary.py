@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+from langchain_core.messages import AIMessageChunk
+
+from main import stream_summary
+from models.summarization_model import Sumarizacao
+
+RESUMO = 'Clientes elogiam a "bateria" e o preço.\nReclamações: entrega atrasada, 2ª via 😕 \\ troca.'
+
+
+class _AgenteFake:
+    """Simula astream_events do agente: o modelo gera o JSON de Sumarizacao em pedaços pequenos."""
+
+    def __init__(self, tamanho_pedaco: int):
+        self.tamanho_pedaco = tamanho_pedaco
+
+    async def astream_events(self, entrada, version):
+        gerado = json.dumps({"resumo_final": RESUMO})  # ensure_ascii: acentos e emoji viram \uXXXX
+        for inicio in range(0, len(gerado), self.tamanho_pedaco):
+            chunk = AIMessageChunk(content=gerado[inicio:inicio + self.tamanho_pedaco])
+            yield {"event": "on_chat_model_stream", "run_id": "r1", "data": {"chunk": chunk}}
+        yield {"event": "on_chain_end", "name": "sumarizacao_map_reduce",
+               "data": {"output": Sumarizacao(resumo_final=RESUMO)}}
+
+
+def _eventos(tamanho_pedaco):
+    async def coletar():
+        return [evento async for evento in stream_summary(_AgenteFake(tamanho_pedaco), {"query": []})]
+    return asyncio.run(coletar())
+
+
+def test_streamed_tokens_join_to_final_summary():
+    for tamanho_pedaco in (1, 2, 3, 5, 7, 64):
+        eventos = _eventos(tamanho_pedaco)
+        tokens = [dados["token"] for nome, dados in eventos if nome == "token"]
+        nome, resultado = eventos[-1]
+        assert nome == "resultado"
+        assert "".join(tokens) == resultado.resumo_final == RESUMO
+        assert not any("resumo_final" in token or token.startswith('{"') for token in tokens)
@@ -0,0 +1,56 @@
+import csv
+import hashlib
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import config.database as database
+from config.vectorstore import VECTOR_DB_FIELDS, MultiFieldVectorStore
+
+COLUNAS = ("submission_date", "reviewer_id", "product_id", "product_name", "product_brand", "site_category_lv1",
+           "site_category_lv2", "review_title", "overall_rating", "recommend_to_a_friend", "review_text",
+           "reviewer_birth_year", "reviewer_gender", "reviewer_state")
+
+
+class _Embeddings(Embeddings):
+    def _vetor(self, texto):
+        return np.frombuffer(hashlib.md5(texto.encode()).digest(), dtype=np.uint8).astype(float).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vetor(texto) for texto in texts]
+
+    def embed_query(self, text):
+        return self._vetor(text)
+
+
+def _escrever(arquivo, linhas, modo="w"):
+    with open(arquivo, modo, newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        if modo == "w":
+            escritor.writerow(COLUNAS)
+        for i in linhas:
+            escritor.writerow(["2018-01-01", f"r{i}", f"p{i}", f"produto {i}", f"marca {i % 3}", "Casa", "TV",
+                               f"título {i}", 5, "Yes", f"texto {i}", 1980, "M", "SP"])
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw", "sq8"])
+def test_empty_dataset_builds_empty_indexes_that_grow(tmp_path, monkeypatch, index_type):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "reviews.db"))
+    arquivo = tmp_path / "reviews.csv"
+    _escrever(arquivo, [])
+    database.csv_to_sqlite(str(arquivo))
+
+    def carregar():
+        return MultiFieldVectorStore(_Embeddings(), path=str(tmp_path / "vector_db"), index_type=index_type).load()
+
+    store = carregar()
+    assert all(store.indexes[field].ntotal == 0 for field in VECTOR_DB_FIELDS)
+    assert store.search_reviews("product_name", "produto 1", 5) == []
+
+    _escrever(arquivo, range(5), modo="a")
+    database.csv_to_sqlite(str(arquivo))
+    store = carregar()
+    assert store.indexes["product_name"].ntotal == 5
+    assert store.indexes["product_brand"].ntotal == 3
+    assert store.search_reviews("product_name", "produto 3", 1) == [(4, "produto 3")]